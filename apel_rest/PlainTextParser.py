@@ -1,7 +1,11 @@
 """This module parses a plaintext message."""
 
+from django.conf import settings
+from rest_framework.exceptions import ParseError
 from rest_framework.parsers import BaseParser
 
+from api.utils.ContentDecoder import ContentDecodeError, ContentDecoder
+
 
 class PlainTextParser(BaseParser):
     """Plain text parser."""
@@ -9,5 +13,14 @@ class PlainTextParser(BaseParser):
     media_type = 'text/plain'
 
     def parse(self, stream, media_type=None, parser_context=None):
-        """Simply return a string representing the body of the request."""
-        return stream.read()
+        """Return a string representing the (decompressed) request body."""
+        encoding = None
+        if parser_context and 'request' in parser_context:
+            encoding = parser_context['request'].META.get(
+                'HTTP_CONTENT_ENCODING')
+
+        try:
+            return ContentDecoder(settings.MAX_BODY_SIZE).decode(stream,
+                                                                 encoding)
+        except ContentDecodeError as error:
+            raise ParseError(str(error))
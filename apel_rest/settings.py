@@ -133,16 +133,161 @@ REST_FRAMEWORK = {
 # incoming messages for later processing
 QPATH = '/var/spool/apel/cloud'
 
+# Defines the fraction of requests, between 0 and 1, that are logged.
+# Each sampled request is logged as one line of JSON, including its
+# headers, except those in REQUEST_LOG_REDACTED_HEADERS, and the first
+# REQUEST_LOG_BODY_BYTES bytes of its body.
+REQUEST_LOG_SAMPLE_RATE = 0.0
+REQUEST_LOG_BODY_BYTES = 256
+REQUEST_LOG_REDACTED_HEADERS = ('HTTP_AUTHORIZATION',
+                                'HTTP_COOKIE',
+                                'HTTP_PROXY_AUTHORIZATION')
+
+# Defines how many intermediate directories of the incoming queue
+# messages are spread across. Increasing this reduces contention
+# when many processes save messages at once
+QUEUE_SHARDS = 1
+
+# Defines the most messages that can be sent
+# to .../api/v1/cloud/record/batch in one request
+MAX_BATCH_MESSAGES = 1000
+
+# Defines the largest request body, in bytes, accepted once it has
+# been decompressed. Larger bodies are rejected with a 413 response.
+# Bodies can be compressed with gzip by sending them with a
+# 'Content-Encoding: gzip' header
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# Defines how long, in seconds, the list of providers retrieved from
+# PROVIDERS_URL is used before it is refreshed. A stale list is still
+# used while it is refreshed in the background, and is kept if the
+# refresh fails.
+PROVIDERS_CACHE_TTL = 300
+
+# Defines how long, in seconds, to wait after a failed attempt to
+# retrieve the list of providers before trying again.
+PROVIDERS_RETRY_INTERVAL = 60
+
+# Defines how long, in seconds, the public keys of an IAM are used
+# before they are fetched again. They are also fetched again if a
+# token is signed with a key that has not been fetched.
+JWKS_CACHE_TTL = 3600
+
+# Defines the minimum time, in seconds, between fetches of the public
+# keys of an IAM, however many tokens name unknown keys.
+JWKS_MIN_REFRESH_INTERVAL = 60
+
+# Defines how requests to the CMDB and IAMs are made. Connections wait
+# HTTP_CONNECT_TIMEOUT seconds to connect and HTTP_READ_TIMEOUT seconds
+# for each read, and up to HTTP_POOL_SIZE are kept alive to each host.
+# Failed requests are retried HTTP_RETRIES times, waiting a random time
+# of up to HTTP_RETRY_BACKOFF seconds, doubled for each retry.
+# After HTTP_CIRCUIT_FAILURES consecutive failures, requests to a host
+# fail immediately for HTTP_CIRCUIT_RESET_TIMEOUT seconds.
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 10
+HTTP_POOL_SIZE = 4
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_CIRCUIT_FAILURES = 5
+HTTP_CIRCUIT_RESET_TIMEOUT = 30
+
+# Defines the caches used by the REST API.
+# Verified tokens are cached in 'tokens', a memcached server shared by
+# every process, so each token is only verified once. If memcached is
+# not running, tokens are verified on every request. Avoid file based
+# caches, as Django 1.6 scans the whole cache directory whenever an
+# entry is added.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'KEY_PREFIX': 'tokens',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Defines which of CACHES verified tokens are cached in,
+# and the longest time, in seconds, a token is cached for.
+# Each process logs its token cache hits and misses at INFO level
+# at most every TOKEN_CACHE_STATS_INTERVAL seconds.
+TOKEN_CACHE_ALIAS = 'tokens'
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_STATS_INTERVAL = 600
+
+# Defines which of CACHES summary responses are cached in, and the
+# longest time, in seconds, a response is cached for. Responses are
+# only reused until the summaries change, which each process checks for
+# at most every RESPONSE_CACHE_GENERATION_TTL seconds. Each process
+# keeps its own responses, as a page of summaries can be large.
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_GENERATION_TTL = 10
+
+# Defines how many rejected tokens each process remembers, and for how
+# long, in seconds, so that retrying a bad token is rejected quickly.
+# Tokens that could not be verified because the keys of an IAM could
+# not be fetched are also remembered, so this should be kept short.
+REJECTED_TOKEN_CACHE_SIZE = 10000
+REJECTED_TOKEN_CACHE_TTL = 60
+
+# If True, tokens are accepted once they have been verified locally,
+# and are checked with the IAM, to see if they have been revoked, in
+# the background. Otherwise, each token is checked with the IAM before
+# it is accepted.
+ASYNC_TOKEN_INTROSPECTION = False
+
+# Defines how often, in seconds, tokens waiting to be checked
+# in the background are checked, and how many are checked at once.
+TOKEN_INTROSPECTION_INTERVAL = 5
+TOKEN_INTROSPECTION_BATCH_SIZE = 50
+
+# Defines how long, in seconds, a token the IAM did not confirm
+# in the background is rejected for.
+TOKEN_REVOCATION_TTL = 3600
+
 # Defines the database settings
 # used by the REST API
 CLOUD_DB_CONF = '/etc/apel/clouddb.cfg'
 
+# Defines how often, in seconds, CLOUD_DB_CONF is checked for changes.
+# The database settings are otherwise only read once per process, or
+# when the process receives a SIGHUP.
+CLOUD_DB_CONF_CHECK_INTERVAL = 30
+
+# Defines the pool of database connections kept open by each process.
+# CLOUD_DB_POOL_SIZE connections are kept open and reused, up to
+# CLOUD_DB_POOL_MAX_OVERFLOW extra connections are opened when they are
+# all in use, and requests wait up to CLOUD_DB_POOL_TIMEOUT seconds for
+# a connection before failing. Connections are replaced once they are
+# CLOUD_DB_POOL_MAX_LIFETIME seconds old.
+CLOUD_DB_POOL_SIZE = 5
+CLOUD_DB_POOL_MAX_OVERFLOW = 5
+CLOUD_DB_POOL_TIMEOUT = 10
+CLOUD_DB_POOL_MAX_LIFETIME = 3600
+
 # Defines the maximum results per page
 # returned from the REST API
 RESULTS_PER_PAGE = 100
 
+# Defines the maximum number of values each of the
+# user, group and service filters can be given
+MAX_FILTER_VALUES = 100
+
+# Defines the maximum number of groups the aggregate
+# view returns, larger results are rejected
+MAX_AGGREGATE_RESULTS = 10000
+
 # Defines what field to return
-# in the REST API
+# in the REST API, these must be
+# columns of VCloudSummaries
 RETURN_HEADERS = ["VOGroup",
                   "SiteName",
                   "UpdateTime",
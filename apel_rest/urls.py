@@ -3,6 +3,9 @@
 from django.conf.urls import patterns, include, url
 
 from django.contrib import admin
+from api.views.CloudRecordBatchView import CloudRecordBatchView
+from api.views.CloudRecordSummaryAggregateView import (
+    CloudRecordSummaryAggregateView)
 from api.views.CloudRecordSummaryView import CloudRecordSummaryView
 from api.views.CloudRecordView import CloudRecordView
 admin.autodiscover()
@@ -19,6 +22,14 @@ urlpatterns = patterns('',
                            CloudRecordView.as_view(),
                            name='CloudRecordView'),
 
+                       url(r'^api/v1/cloud/record/batch$',
+                           CloudRecordBatchView.as_view(),
+                           name='CloudRecordBatchView'),
+
                        url(r'^api/v1/cloud/record/summary$',
                            CloudRecordSummaryView.as_view(),
-                           name='CloudRecordSummaryView'))
+                           name='CloudRecordSummaryView'),
+
+                       url(r'^api/v1/cloud/record/summary/aggregate$',
+                           CloudRecordSummaryAggregateView.as_view(),
+                           name='CloudRecordSummaryAggregateView'))
@@ -10,6 +10,14 @@ https://docs.djangoproject.com/en/1.6/howto/deployment/wsgi/
 import os
 from django.core.wsgi import get_wsgi_application
 
+from api.utils.DatabaseConfig import DATABASE_CONFIG
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "apel_rest.settings")
 
 application = get_wsgi_application()
+
+# Allow the database configuration to be reloaded with a SIGHUP. Under
+# mod_wsgi, this needs "WSGIRestrictSignal Off", otherwise the handler is
+# silently ignored and the configuration is only reloaded once its file
+# changes, see SharedDatabaseConfig.
+DATABASE_CONFIG.install_sighup_handler()
@@ -0,0 +1,118 @@
+"""This module tests POST requests to the Cloud Record batch endpoint."""
+
+import glob
+import json
+import logging
+import os
+import shutil
+
+from dirq.queue import QueueError
+from django.core.urlresolvers import reverse
+from django.test import Client, TestCase
+from mock import Mock, patch
+
+from api.tests import MESSAGE, PROVIDERS
+from api.views.CloudRecordBatchView import CloudRecordBatchView
+from api.views.CloudRecordView import CloudRecordView
+
+QPATH_TEST = '/tmp/django-test/'
+
+ALLOWED_DN = '/C=XX/O=XX/OU=XX/L=XX/CN=allowed_host.test'
+
+
+class CloudRecordBatchPostTest(TestCase):
+    """Tests POST requests to the Cloud Record batch endpoint."""
+
+    def setUp(self):
+        """Mock the provider list and prevent logging in test output."""
+        logging.disable(logging.CRITICAL)
+        # Forget any providers cached by a previous test.
+        CloudRecordView.provider_registry.clear()
+        # Allows only allowed_host.test to POST
+        mock_providers = Mock(return_value=PROVIDERS)
+        CloudRecordView._get_provider_json_indigo_cmdb = mock_providers
+
+    def tearDown(self):
+        """Delete any messages under QPATH and re-enable logging.INFO."""
+        if os.path.exists(QPATH_TEST):
+            shutil.rmtree(QPATH_TEST)
+        logging.disable(logging.NOTSET)
+
+    def test_batch_post_202(self):
+        """Test every message in a batch is saved."""
+        messages = [MESSAGE, 'APEL-cloud-message: v0.4\n%%\n', '']
+        response = self._post(self._bundle(messages))
+
+        self.assertEqual(response.status_code, 202)
+        content = json.loads(response.content)
+        self.assertEqual(content['saved'], 3)
+        self.assertEqual([result['status'] for result in content['results']],
+                         [202, 202, 202])
+
+        saved = []
+        for message_path in glob.glob('%s*/*/*/body' % QPATH_TEST):
+            with open(message_path) as message_file:
+                saved.append(message_file.read())
+
+        self.assertEqual(sorted(saved), sorted(messages))
+
+    def test_batch_post_207(self):
+        """Test the result of each message is returned if some fail."""
+        with patch('api.utils.QueueWriter.QueueWriter.add',
+                   side_effect=['name', QueueError('disk full'),
+                                IOError('disk full'), OSError('disk full')]):
+            response = self._post(self._bundle([MESSAGE] * 4))
+
+        self.assertEqual(response.status_code, 207)
+        content = json.loads(response.content)
+        self.assertEqual(content['saved'], 1)
+        self.assertEqual([result['status'] for result in content['results']],
+                         [202, 500, 500, 500])
+
+    def test_batch_post_400(self):
+        """Test malformed, empty and oversized batches are rejected."""
+        self.assertEqual(self._post('').status_code, 400)
+        self.assertEqual(self._post('10\nshort').status_code, 400)
+
+        with self.settings(MAX_BATCH_MESSAGES=1):
+            response = self._post(self._bundle([MESSAGE, MESSAGE]))
+            self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(glob.glob('%s*/*/*/body' % QPATH_TEST), [])
+
+    def test_batch_post_401_403(self):
+        """Test the signer is authorised before any messages are read."""
+        bundle = self._bundle([MESSAGE])
+        self.assertEqual(self._post(bundle, dn=None).status_code, 401)
+
+        prohibited_dn = '/C=XX/O=XX/OU=XX/L=XX/CN=prohibited_host.test'
+        self.assertEqual(self._post(bundle, dn=prohibited_dn).status_code,
+                         403)
+
+    def test_split_messages(self):
+        """Test a batch body is split into its messages."""
+        test_batch_view = CloudRecordBatchView()
+
+        self.assertEqual(test_batch_view._split_messages('3\nabc0\n1\n\n'),
+                         ['abc', '', '\n'])
+
+        for body in ('abc', '3\nab', '-1\nabc', 'x\nabc'):
+            self.assertRaises(ValueError, test_batch_view._split_messages,
+                              body)
+
+    def _bundle(self, messages):
+        """Return a batch body containing messages."""
+        return ''.join('%s\n%s' % (len(message), message)
+                       for message in messages)
+
+    def _post(self, body, dn=ALLOWED_DN):
+        """Return the response to POSTing body to the batch endpoint."""
+        extra = {'HTTP_EMPA_ID': 'Test Process'}
+        if dn is not None:
+            extra['SSL_CLIENT_S_DN'] = dn
+
+        # This avoids the test writing to the QPATH
+        # set in apel_rest/settings.py
+        with self.settings(QPATH=QPATH_TEST):
+            return Client().post(reverse('CloudRecordBatchView'), body,
+                                 content_type='text/plain', **extra)
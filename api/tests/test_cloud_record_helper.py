@@ -15,6 +15,8 @@ class CloudRecordHelperTest(TestCase):
     def setUp(self):
         """Prevent logging from appearing in test output."""
         logging.disable(logging.CRITICAL)
+        # Forget any providers cached by a previous test.
+        CloudRecordView.provider_registry.clear()
 
     def test_signer_is_valid(self):
         """
@@ -67,5 +69,17 @@ class CloudRecordHelperTest(TestCase):
         # used in the _signer_is_valid method we are testing
         # now we are mocking a failure of the CMDB to respond as expected
         CloudRecordView._get_provider_json_indigo_cmdb = Mock(return_value={})
-        # in which case we should reject all POST requests
+        # if the CMDB fails when a refresh is due, the last good
+        # copy of the provider list should still be used
+        CloudRecordView.provider_registry.refresh(
+            test_cloud_view._fetch_indigo_providers)
+        self.assertTrue(test_cloud_view._signer_is_valid(allowed_dn))
+
+        # but if no provider list has ever been retrieved
+        # we should reject all POST requests
+        CloudRecordView.provider_registry.clear()
         self.assertFalse(test_cloud_view._signer_is_valid(allowed_dn))
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
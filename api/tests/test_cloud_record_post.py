@@ -4,6 +4,7 @@ import glob
 import logging
 import os
 import shutil
+import zlib
 
 from django.core.urlresolvers import reverse
 from django.test import Client, TestCase
@@ -21,6 +22,8 @@ class CloudRecordPostTest(TestCase):
     def setUp(self):
         """Prevent logging from appearing in test output."""
         logging.disable(logging.CRITICAL)
+        # Forget any providers cached by a previous test.
+        CloudRecordView.provider_registry.clear()
 
     def test_cloud_record_post_provider_banned(self):
         """Test that a banned provider on the provider list cannot POST."""
@@ -90,6 +93,87 @@ class CloudRecordPostTest(TestCase):
         # Make (and check) the POST request
         self._check_record_post(MESSAGE, 202)
 
+    def test_cloud_record_post_gzip(self):
+        """Test a gzip compressed POST request is saved decompressed."""
+        mock_providers = Mock(return_value=PROVIDERS)
+        CloudRecordView._get_provider_json_indigo_cmdb = mock_providers
+
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(MESSAGE) + compressor.flush()
+
+        with self.settings(QPATH=QPATH_TEST):
+            test_client = Client()
+            url = reverse('CloudRecordView')
+            dn = '/C=XX/O=XX/OU=XX/L=XX/CN=allowed_host.test'
+
+            response = test_client.post(url, body,
+                                        content_type="text/plain",
+                                        HTTP_CONTENT_ENCODING='gzip',
+                                        SSL_CLIENT_S_DN=dn)
+            self.assertEqual(response.status_code, 202)
+
+            [message_path] = self._saved_messages('%s*/*/*/body' %
+                                                  QPATH_TEST)
+            with file(message_path) as message_file:
+                self.assertEqual(message_file.read(), MESSAGE)
+
+            # Only gzip is supported.
+            response = test_client.post(url, body,
+                                        content_type="text/plain",
+                                        HTTP_CONTENT_ENCODING='br',
+                                        SSL_CLIENT_S_DN=dn)
+            self.assertEqual(response.status_code, 415)
+
+    def test_cloud_record_post_utf8(self):
+        """Test only UTF-8 bodies are saved, and saved as UTF-8."""
+        mock_providers = Mock(return_value=PROVIDERS)
+        CloudRecordView._get_provider_json_indigo_cmdb = mock_providers
+
+        self._check_record_post('caf\xc3\xa9', 202)
+        self._delete_messages(QPATH_TEST)
+
+        # dirq could not read this message back, so it is rejected.
+        self._check_record_post('\xff\xfe', 400)
+        self.assertEqual(self._saved_messages('%s*/*/*/body' % QPATH_TEST),
+                         [])
+
+        # Bodies sent as form data are decoded by Django.
+        with self.settings(QPATH=QPATH_TEST):
+            response = Client().post(
+                reverse('CloudRecordView'), {'_content': u'caf\xe9'},
+                SSL_CLIENT_S_DN='/C=XX/O=XX/OU=XX/L=XX/CN=allowed_host.test')
+            self.assertEqual(response.status_code, 202)
+
+            [message_path] = self._saved_messages('%s*/*/*/body' %
+                                                  QPATH_TEST)
+            with file(message_path) as message_file:
+                self.assertEqual(message_file.read(), 'caf\xc3\xa9')
+
+    def test_cloud_record_post_413(self):
+        """Test a POST request with too large a body returns a 413 code."""
+        mock_providers = Mock(return_value=PROVIDERS)
+        CloudRecordView._get_provider_json_indigo_cmdb = mock_providers
+
+        # Bodies are checked by their Content-Length, if it is given,
+        # and by the number of bytes read from the request.
+        with self.settings(MAX_BODY_SIZE=len(MESSAGE) - 1):
+            self._check_record_post(MESSAGE, 413)
+
+        with self.settings(MAX_BODY_SIZE=len(MESSAGE) - 1, QPATH=QPATH_TEST):
+            compressor = zlib.compressobj(9, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            body = compressor.compress(MESSAGE) + compressor.flush()
+
+            response = Client().post(
+                reverse('CloudRecordView'), body,
+                content_type="text/plain",
+                HTTP_CONTENT_ENCODING='gzip',
+                SSL_CLIENT_S_DN='/C=XX/O=XX/OU=XX/L=XX/CN=allowed_host.test')
+
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(self._saved_messages('%s*/*/*/body' %
+                                                  QPATH_TEST), [])
+
     def tearDown(self):
         """Delete any messages under QPATH and re-enable logging.INFO."""
         self._delete_messages(QPATH_TEST)
@@ -0,0 +1,184 @@
+"""This module tests GET requests to the summary aggregate endpoint."""
+
+import logging
+
+import MySQLdb
+from django.core.urlresolvers import reverse
+from django.test import Client, TestCase
+from mock import MagicMock, Mock, patch
+
+from api.utils.ResponseCache import RESPONSE_CACHE
+from api.utils.TokenChecker import TokenChecker
+
+
+class CloudRecordSummaryAggregateTest(TestCase):
+    """Tests GET requests to the summary aggregate endpoint."""
+
+    def setUp(self):
+        """Mock the connection pool and disable logging."""
+        logging.disable(logging.CRITICAL)
+        RESPONSE_CACHE.clear()
+        self._cursor = Mock()
+        self._cursor.fetchall = Mock(return_value=[('Test-Site', 172799)])
+        self._pool = MagicMock()
+        database = self._pool.connection.return_value.__enter__.return_value
+        database.cursor = Mock(return_value=self._cursor)
+
+        patcher = patch('api.views.CloudRecordSummaryAggregateView.'
+                        'get_connection_pool', return_value=self._pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # The summaries last changed at the start of 2018.
+        for name, value in (('generation', 'SummariseVMs=2018-01-01'),
+                            ('last_modified', 1514764800)):
+            patcher = patch.object(RESPONSE_CACHE, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_200(self, mock_valid_token_to_id):
+        """Test the totals for each group are returned."""
+        mock_valid_token_to_id.return_value = 'TestService'
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            response = self._get('?from=20000101&group=TestGroup'
+                                 '&group_by=SiteName&metrics=WallDuration')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data,
+                         {'group_by': ['SiteName'],
+                          'metrics': ['WallDuration'],
+                          'results': [{'SiteName': 'Test-Site',
+                                       'WallDuration': 172799}]})
+
+        sql, params = self._cursor.execute.call_args[0]
+        self.assertTrue(sql.startswith('select SiteName, sum(WallDuration) '))
+        self.assertTrue('group by SiteName' in sql)
+        self.assertEqual(params[0], 'TestGroup')
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_cached(self, mock_valid_token_to_id):
+        """Test a repeated request is answered from the response cache."""
+        mock_valid_token_to_id.return_value = 'TestService'
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            first = self._get('?from=20000101&group_by=SiteName'
+                              '&metrics=WallDuration')
+            second = self._get('?metrics=WallDuration&group_by=SiteName'
+                               '&from=20000101')
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        # The totals should only have been queried once.
+        self.assertEqual(self._cursor.execute.call_count, 1)
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_304(self, mock_valid_token_to_id):
+        """Test conditional requests are answered without a query."""
+        mock_valid_token_to_id.return_value = 'TestService'
+        options = '?from=20000101&group_by=SiteName'
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            response = self._get(options)
+            etag = response['ETag']
+            self.assertEqual(response['Last-Modified'],
+                             'Mon, 01 Jan 2018 00:00:00 GMT')
+
+            RESPONSE_CACHE.clear()
+            self._cursor.reset_mock()
+            for headers in ({'HTTP_IF_NONE_MATCH': etag},
+                            {'HTTP_IF_NONE_MATCH': '"other", W/%s' % etag},
+                            {'HTTP_IF_MODIFIED_SINCE':
+                             'Tue, 02 Jan 2018 00:00:00 GMT'}):
+                response = self._get(options, **headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+            self.assertFalse(self._cursor.execute.called)
+
+            # A different query, or an older copy, must be fetched again.
+            for options, headers in (
+                    (options + ',Year', {'HTTP_IF_NONE_MATCH': etag}),
+                    (options, {'HTTP_IF_MODIFIED_SINCE':
+                               'Sun, 31 Dec 2017 00:00:00 GMT'})):
+                response = self._get(options, **headers)
+                self.assertEqual(response.status_code, 200)
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_granularity(self, mock_valid_token_to_id):
+        """Test yearly totals are read from the yearly rollup."""
+        mock_valid_token_to_id.return_value = 'TestService'
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            response = self._get('?from=20000101&granularity=year'
+                                 '&group_by=SiteName&metrics=WallDuration')
+            self.assertEqual(response.status_code, 200)
+
+            sql, _ = self._cursor.execute.call_args[0]
+            self.assertTrue(' from CloudYearlySummaries ' in sql)
+
+            # Yearly summaries cannot be grouped by month.
+            response = self._get('?from=20000101&granularity=year'
+                                 '&group_by=Month')
+            self.assertEqual(response.status_code, 400)
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_400(self, mock_valid_token_to_id):
+        """Test unknown columns and missing filters are rejected."""
+        mock_valid_token_to_id.return_value = 'TestService'
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            for options in ('?group_by=SiteName',
+                            '?from=20000101&group_by=Password',
+                            '?from=20000101&group_by=WallDuration',
+                            '?from=20000101&metrics=SiteName',
+                            '?from=20000101&granularity=week'):
+                self.assertEqual(self._get(options).status_code, 400)
+
+        self.assertFalse(self._cursor.execute.called)
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_too_many(self, mock_valid_token_to_id):
+        """Test a 400 is returned if too many groups match."""
+        mock_valid_token_to_id.return_value = 'TestService'
+        self._cursor.fetchall = Mock(return_value=[('Site1', 1),
+                                                   ('Site2', 2)])
+
+        with self.settings(ALLOWED_FOR_GET='TestService',
+                           MAX_AGGREGATE_RESULTS=1):
+            response = self._get('?from=20000101&group_by=SiteName'
+                                 '&metrics=WallDuration')
+
+        self.assertEqual(response.status_code, 400)
+        # Only one more row than allowed should have been fetched.
+        self.assertEqual(self._cursor.execute.call_args[0][1][-1], 2)
+
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_aggregate_get_500(self, mock_valid_token_to_id):
+        """Test a 500 is returned if the database cannot be queried."""
+        mock_valid_token_to_id.return_value = 'TestService'
+        self._cursor.execute = Mock(
+            side_effect=MySQLdb.OperationalError(2006, 'Gone away'))
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            response = self._get('?from=20000101')
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_aggregate_get_401(self):
+        """Test an unauthenticated GET request."""
+        self.assertEqual(self._get('?from=20000101', None).status_code, 401)
+
+    def _get(self, options, authZ_header_cont="Bearer TestToken",
+             **headers):
+        """Make a GET request to the aggregate endpoint."""
+        url = reverse('CloudRecordSummaryAggregateView') + options
+        if authZ_header_cont is not None:
+            headers['HTTP_AUTHORIZATION'] = authZ_header_cont
+
+        return Client().get(url, **headers)
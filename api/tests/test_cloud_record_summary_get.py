@@ -1,9 +1,15 @@
 """This module tests GET requests to the Cloud Sumamry Record endpoint."""
 
+import base64
+import json
 import logging
+import os
+import tempfile
 import MySQLdb
 
+from api.utils.ResponseCache import RESPONSE_CACHE
 from api.utils.TokenChecker import TokenChecker
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.test import Client, TestCase
 from mock import patch
@@ -17,6 +23,7 @@ class CloudRecordSummaryGetTest(TestCase):
     def setUp(self):
         """Prevent logging from appearing in test output."""
         logging.disable(logging.CRITICAL)
+        RESPONSE_CACHE.clear()
 
     @patch.object(TokenChecker, 'valid_token_to_id')
     def test_cloud_record_summary_get_IAM_fail(self, mock_valid_token_to_id):
@@ -52,6 +59,25 @@ class CloudRecordSummaryGetTest(TestCase):
             self._check_summary_get(400, options="?group=TestGroup",
                                     authZ_header_cont="Bearer TestToken")
 
+    @patch.object(TokenChecker, 'valid_token_to_id')
+    def test_cloud_record_summary_get_400_cursor(self,
+                                                 mock_valid_token_to_id):
+        """Test a GET request with a cursor key of the wrong types."""
+        mock_valid_token_to_id.return_value = 'TestService'
+        # Year must be an integer, not a list.
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            ['next', ['2016'], 7, 30, 'TEST', 'TestUser', 'TestVO',
+             'TestGroup', 'TestRole', 'completed', 'OpenNebula', 'ImageA']))
+
+        with self.settings(ALLOWED_FOR_GET='TestService'):
+            self._check_summary_get(400,
+                                    expected_response='"\'cursor\' is not '
+                                                      'valid."',
+                                    options=("?group=TestGroup"
+                                             "&from=20000101&cursor=%s" %
+                                             cursor),
+                                    authZ_header_cont="Bearer TestToken")
+
     @patch.object(TokenChecker, 'valid_token_to_id')
     def test_cloud_record_summary_get_403(self, mock_valid_token_to_id):
         """Test an unauthorized service cannot make a GET request."""
@@ -111,6 +137,7 @@ class CloudRecordSummaryGetTest(TestCase):
                              '"Month":7}]}')
 
         with self.settings(ALLOWED_FOR_GET='TestService',
+                           CLOUD_DB_CONF=self._write_db_config(),
                            RETURN_HEADERS=["WallDuration",
                                            "Day",
                                            "Month",
@@ -125,6 +152,7 @@ class CloudRecordSummaryGetTest(TestCase):
                 # Clean up after test.
                 self._clear_database(database)
                 database.close()
+                os.remove(settings.CLOUD_DB_CONF)
 
     def tearDown(self):
         """Delete any messages under QPATH and re-enable logging.INFO."""
@@ -181,8 +209,8 @@ class CloudRecordSummaryGetTest(TestCase):
                        '"2016-07-30 00:00:00", 0, 129599, 1, "TEST", "1", '
                        '1);')
 
-        # These INSERT statements are needed
-        # because we query VCloudSummaries
+        # These INSERT statements are needed because
+        # we query MaterialisedCloudSummaries
         cursor.execute('INSERT INTO Sites VALUES (1, "TestSite");')
         cursor.execute('INSERT INTO VOs VALUES (1, "TestVO");')
         cursor.execute('INSERT INTO VOGroups VALUES (1, "TestGroup");')
@@ -205,6 +233,15 @@ class CloudRecordSummaryGetTest(TestCase):
         cursor.execute('DELETE FROM CloudSummaries '
                        'WHERE CloudType="TEST";')
 
+        cursor.execute('DELETE FROM MaterialisedCloudSummaries '
+                       'WHERE CloudType="TEST";')
+
+        cursor.execute('DELETE FROM CloudMonthlySummaries '
+                       'WHERE CloudType="TEST";')
+
+        cursor.execute('DELETE FROM CloudYearlySummaries '
+                       'WHERE CloudType="TEST";')
+
         cursor.execute('DELETE FROM Sites '
                        'WHERE id=1;')
 
@@ -225,6 +262,21 @@ class CloudRecordSummaryGetTest(TestCase):
 
         database.commit()
 
+    def _write_db_config(self,
+                         host='localhost',
+                         user='root',
+                         password='',
+                         name='apel_rest'):
+        """Write a database config file and return its path."""
+        config_file, config_path = tempfile.mkstemp(suffix='.cfg')
+        os.write(config_file, '[db]\n'
+                              'hostname = %s\n'
+                              'name = %s\n'
+                              'username = %s\n'
+                              'password = %s\n' % (host, name, user, password))
+        os.close(config_file)
+        return config_path
+
     def _connect_to_database(self,
                              host='localhost',
                              user='root',
@@ -1,11 +1,14 @@
 """This module tests the helper methods of the CloudRecordView class."""
 
 import logging
+import urlparse
 
-from api.views.CloudRecordSummaryView import CloudRecordSummaryView
+from api.views.CloudRecordSummaryView import (CloudRecordSummaryView,
+                                              check_return_headers)
+from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
 from django.test import TestCase
-from mock import Mock
+from mock import MagicMock, Mock
 from rest_framework.test import APIRequestFactory
 
 QPATH_TEST = '/tmp/django-test/'
@@ -84,6 +87,133 @@ class CloudRecordSummaryHelperTest(TestCase):
         content = test_cloud_view._paginate_result(request, [])
         self.assertEqual(content, expected_content)
 
+    def test_cursor(self):
+        """Test cursors can be encoded, decoded and rejected."""
+        test_cloud_view = CloudRecordSummaryView()
+        key = (2016, 7, 30, 'TEST', 'TestUser', 'TestVO', 'TestGroup',
+               'TestRole', 'completed', 'OpenNebula', 'ImageA')
+
+        cursor = test_cloud_view._encode_cursor('next', key)
+        self.assertEqual(test_cloud_view._decode_cursor(cursor),
+                         ('next', key))
+
+        # An empty cursor means the first page.
+        self.assertEqual(test_cloud_view._decode_cursor(''), None)
+        self.assertEqual(test_cloud_view._decode_cursor(None), None)
+
+        for cursor in ('not base64!',
+                       test_cloud_view._encode_cursor('sideways', key),
+                       test_cloud_view._encode_cursor('next', key[:5]),
+                       # Each key value must be of its column's type.
+                       test_cloud_view._encode_cursor('next',
+                                                      ('2016',) + key[1:]),
+                       test_cloud_view._encode_cursor('next',
+                                                      (True,) + key[1:]),
+                       test_cloud_view._encode_cursor('next',
+                                                      key[:3] + (None,) +
+                                                      key[4:]),
+                       test_cloud_view._encode_cursor('next',
+                                                      key[:10] + ([1],))):
+            self.assertRaises(ValueError,
+                              test_cloud_view._decode_cursor,
+                              cursor)
+
+        # Status, CloudType and ImageId can be null.
+        null_key = key[:8] + (None, None, None)
+        cursor = test_cloud_view._encode_cursor('next', null_key)
+        self.assertEqual(test_cloud_view._decode_cursor(cursor),
+                         ('next', null_key))
+
+        # Monthly summaries have no Day, so their keys are shorter.
+        monthly_key = key[:2] + key[3:]
+        cursor = test_cloud_view._encode_cursor('next', monthly_key)
+        self.assertEqual(test_cloud_view._decode_cursor(cursor, 'month'),
+                         ('next', monthly_key))
+        self.assertRaises(ValueError, test_cloud_view._decode_cursor, cursor)
+
+    def test_get_conditions(self):
+        """Test filters are combined, with an 'in' list for many values."""
+        test_cloud_view = CloudRecordSummaryView()
+        factory = APIRequestFactory()
+        url = ''.join((reverse('CloudRecordSummaryView'),
+                       '?service=SiteA,SiteB,SiteA',
+                       '&service=SiteC',
+                       '&group=/TEST1',
+                       '&user=CN=User,O=Test',
+                       '&from=FromDate',
+                       '&to=ToDate'))
+
+        conditions, params = test_cloud_view._get_conditions(factory.get(url))
+
+        # User DNs are not split on commas, but groups and services are.
+        self.assertEqual(conditions, ['GlobalUserName = %s',
+                                      'VOGroup = %s',
+                                      'SiteName in (%s, %s, %s)',
+                                      'EarliestStartTime > %s',
+                                      'LatestStartTime < %s'])
+        self.assertEqual(params, ['CN=User,O=Test', '/TEST1', 'SiteA',
+                                  'SiteB', 'SiteC', 'FromDate', 'ToDate'])
+
+        # Without a filter, only the start time is used.
+        url = reverse('CloudRecordSummaryView') + '?from=FromDate'
+        self.assertEqual(test_cloud_view._get_conditions(factory.get(url)),
+                         (['EarliestStartTime > %s'], ['FromDate']))
+
+        # Too many values, or no from, should be rejected.
+        for query in ('?from=FromDate&service=SiteA,SiteB',
+                      '?service=SiteA'):
+            request = factory.get(reverse('CloudRecordSummaryView') + query)
+            with self.settings(MAX_FILTER_VALUES=1):
+                self.assertRaises(ValueError,
+                                  test_cloud_view._get_conditions,
+                                  request)
+
+    def test_get_granularity(self):
+        """Test the granularity defaults to day and must be known."""
+        test_cloud_view = CloudRecordSummaryView()
+        factory = APIRequestFactory()
+        url = reverse('CloudRecordSummaryView')
+
+        for query, granularity in (('', 'day'),
+                                   ('?granularity=', 'day'),
+                                   ('?granularity=month', 'month'),
+                                   ('?granularity=year', 'year')):
+            request = factory.get(url + query)
+            self.assertEqual(test_cloud_view._get_granularity(request),
+                             granularity)
+
+        request = factory.get(url + '?granularity=week')
+        self.assertRaises(ValueError, test_cloud_view._get_granularity,
+                          request)
+
+    def test_paginate_by_cursor(self):
+        """Test a page is returned with cursors to the next page."""
+        test_cloud_view = CloudRecordSummaryView()
+        factory = APIRequestFactory()
+        url = ''.join((reverse('CloudRecordSummaryView'),
+                       '?from=FromDate&cursor='))
+        request = factory.get(url)
+
+        first_key = (2016, 7, 1) + ('TEST',) * 8
+        second_key = (2016, 7, 2) + ('TEST',) * 8
+        query = Mock()
+        query.seek = Mock(return_value=[(first_key, {'Day': 1}),
+                                        (second_key, {'Day': 2})])
+
+        with self.settings(RESULTS_PER_PAGE=1):
+            content = test_cloud_view._paginate_by_cursor(request, query,
+                                                          None)
+
+        query.seek.assert_called_once_with(2, after=None)
+        self.assertEqual(content['count'], None)
+        self.assertEqual(content['previous'], None)
+        self.assertEqual(content['results'], [{'Day': 1}])
+        # The next page should start after the last returned row.
+        next_url = urlparse.urlparse(content['next'])
+        next_cursor = urlparse.parse_qs(next_url.query)['cursor'][0]
+        self.assertEqual(test_cloud_view._decode_cursor(next_cursor),
+                         ('next', first_key))
+
     def test_request_to_token(self):
         """Test a token can be extracted from request."""
         test_cloud_view = CloudRecordSummaryView()
@@ -124,27 +254,40 @@ class CloudRecordSummaryHelperTest(TestCase):
                 test_cloud_view._is_client_authorized(
                     'IAmNotAllowed'))
 
-    def test_filter_cursor(self):
-        """Test the filtering of a query object based on settings."""
+    def test_stream_result(self):
+        """Test summaries are streamed as JSON and newline delimited JSON."""
         test_cloud_view = CloudRecordSummaryView()
 
-        # A list of test summaries.
-        test_data = [{'Day': 30,
-                      'Month': 7,
-                      'Year': 2016,
-                      'SiteName': 'TEST'}]
+        # Only the Day column is selected.
+        test_data = [(30,), (31,)]
 
+        # Mock the connection pool and the unbuffered cursor it provides.
         cursor = Mock()
-        # Get the mock cursor object return the test_data.
-        cursor.fetchall = Mock(return_value=test_data)
-
-        with self.settings(RETURN_HEADERS=['SiteName', 'Day']):
-            result = test_cloud_view._filter_cursor(cursor)
-
-        expected_result = [{'SiteName': 'TEST',
-                            'Day': 30}]
-
-        self.assertEqual(result, expected_result)
+        cursor.fetchmany = Mock(side_effect=[test_data, []])
+        pool = MagicMock()
+        pool.connection.return_value.__enter__.return_value.cursor = Mock(
+            return_value=cursor)
+
+        with self.settings(RETURN_HEADERS=['Day']):
+            stream = test_cloud_view._stream_result(pool, [], [], 'ndjson')
+            self.assertEqual(''.join(stream), '{"Day":30}\n{"Day":31}\n')
+
+            cursor.fetchmany.side_effect = [test_data, []]
+            stream = test_cloud_view._stream_result(pool, [], [], 'json')
+            self.assertEqual(''.join(stream), '[{"Day":30},{"Day":31}]')
+
+            # An empty result should still be valid JSON.
+            cursor.fetchmany.side_effect = [[]]
+            stream = test_cloud_view._stream_result(pool, [], [], 'json')
+            self.assertEqual(''.join(stream), '[]')
+
+    def test_check_return_headers(self):
+        """Test only known, distinct, RETURN_HEADERS are accepted."""
+        check_return_headers()
+
+        for return_headers in (['Day', 'Password'], [], ['Day', 'Day']):
+            with self.settings(RETURN_HEADERS=return_headers):
+                self.assertRaises(ImproperlyConfigured, check_return_headers)
 
     def tearDown(self):
         """Delete any messages under QPATH and re-enable logging.INFO."""
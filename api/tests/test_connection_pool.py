@@ -0,0 +1,114 @@
+"""This module tests the ConnectionPool class."""
+
+import logging
+
+from django.test import TestCase
+from mock import Mock
+
+from api.utils.ConnectionPool import ConnectionPool, PoolTimeoutError
+
+
+class ConnectionPoolTest(TestCase):
+    """Tests the ConnectionPool class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+        # Each call to self._connect returns a new mock connection.
+        self._connect = Mock(side_effect=lambda: Mock())
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_connection_reused(self):
+        """Test a returned connection is handed out again."""
+        pool = ConnectionPool(self._connect, size=1, max_overflow=0)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertTrue(first is second)
+        self.assertEqual(self._connect.call_count, 1)
+        # The connection should have been pinged before being reused,
+        # and any transaction ended each time it was returned.
+        self.assertEqual(first.ping.call_count, 1)
+        self.assertEqual(first.rollback.call_count, 2)
+
+    def test_overflow(self):
+        """Test overflow connections are opened, then closed when returned."""
+        pool = ConnectionPool(self._connect, size=1, max_overflow=1,
+                              timeout=0)
+
+        with pool.connection() as first:
+            with pool.connection() as second:
+                self.assertEqual(pool.stats()['overflow'], 1)
+                self.assertEqual(pool.stats()['in_use'], 2)
+
+                # Both the pool and the overflow are in use.
+                self.assertRaises(PoolTimeoutError,
+                                  pool.connection().__enter__)
+
+        self.assertTrue(second.close.called)
+        self.assertFalse(first.close.called)
+
+        stats = pool.stats()
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['timeouts'], 1)
+
+    def test_broken_connection(self):
+        """Test a connection failing its health check is replaced."""
+        pool = ConnectionPool(self._connect, size=1)
+
+        with pool.connection() as first:
+            pass
+
+        first.ping.side_effect = Exception('MySQL server has gone away')
+
+        with pool.connection() as second:
+            pass
+
+        self.assertFalse(first is second)
+        self.assertTrue(first.close.called)
+        self.assertEqual(pool.stats()['open'], 1)
+
+    def test_max_lifetime(self):
+        """Test connections are not reused after their max lifetime."""
+        pool = ConnectionPool(self._connect, size=1, max_lifetime=0)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertFalse(first is second)
+        self.assertTrue(first.close.called)
+
+    def test_error_in_block(self):
+        """Test a connection is discarded if its with block raises."""
+        pool = ConnectionPool(self._connect, size=1)
+
+        try:
+            with pool.connection() as connection:
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertTrue(connection.close.called)
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+    def test_connect_fails(self):
+        """Test a failure to connect does not leak a pool slot."""
+        pool = ConnectionPool(Mock(side_effect=IOError()), size=1,
+                              max_overflow=0)
+
+        for _ in range(2):
+            self.assertRaises(IOError, pool.connection().__enter__)
+
+        self.assertEqual(pool.stats()['open'], 0)
+        self.assertEqual(pool.stats()['timeouts'], 0)
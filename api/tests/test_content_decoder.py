@@ -0,0 +1,60 @@
+"""This module tests the ContentDecoder class."""
+
+import logging
+import zlib
+from StringIO import StringIO
+
+from django.test import TestCase
+
+from api.tests import MESSAGE
+from api.utils.ContentDecoder import (BodyTooLargeError, ContentDecodeError,
+                                      ContentDecoder, UnsupportedEncodingError)
+
+
+class ContentDecoderTest(TestCase):
+    """Tests the ContentDecoder class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_decode(self):
+        """Test identity and gzip bodies are decoded."""
+        content_decoder = ContentDecoder(max_size=len(MESSAGE), chunk_size=16)
+
+        self.assertEqual(content_decoder.decode(StringIO(MESSAGE)), MESSAGE)
+        self.assertEqual(content_decoder.decode(StringIO(self._gzip(MESSAGE)),
+                                                'gzip'),
+                         MESSAGE)
+        self.assertEqual(content_decoder.decode(StringIO(self._gzip(MESSAGE)),
+                                                'X-GZIP'),
+                         MESSAGE)
+
+    def test_decode_too_large(self):
+        """Test decompression stops once the body is too large."""
+        content_decoder = ContentDecoder(max_size=1024)
+        # 10 MB of zeros compresses to around 10 KB.
+        body = StringIO(self._gzip('\0' * 10 * 1024 * 1024))
+
+        self.assertRaises(BodyTooLargeError, content_decoder.decode,
+                          body, 'gzip')
+        # Decompression should have stopped after the first chunk.
+        self.assertTrue(body.tell() <= 65536)
+
+    def test_decode_invalid(self):
+        """Test unsupported encodings and corrupt bodies are rejected."""
+        content_decoder = ContentDecoder(max_size=1024)
+
+        self.assertRaises(UnsupportedEncodingError, content_decoder.decode,
+                          StringIO(MESSAGE), 'br')
+        self.assertRaises(ContentDecodeError, content_decoder.decode,
+                          StringIO(MESSAGE), 'gzip')
+
+    def _gzip(self, text):
+        """Return text compressed in the gzip format."""
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(text) + compressor.flush()
@@ -0,0 +1,115 @@
+"""This module tests the DatabaseConfig and SharedDatabaseConfig classes."""
+
+import logging
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from api.utils.DatabaseConfig import (DatabaseConfig,
+                                      DatabaseConfigError,
+                                      SharedDatabaseConfig)
+
+CONFIG = """[db]
+backend = mysql
+hostname = apel_mysql
+port = %s
+name = apel_rest
+username = apel
+password = secret
+"""
+
+
+class DatabaseConfigTest(TestCase):
+    """Tests the DatabaseConfig and SharedDatabaseConfig classes."""
+
+    def setUp(self):
+        """Create a directory for config files and disable logging."""
+        logging.disable(logging.CRITICAL)
+        self._config_dir = tempfile.mkdtemp()
+        self._config_path = os.path.join(self._config_dir, 'clouddb.cfg')
+
+    def tearDown(self):
+        """Delete any config files and re-enable logging."""
+        shutil.rmtree(self._config_dir)
+        logging.disable(logging.NOTSET)
+
+    def test_from_file(self):
+        """Test a valid config file is parsed into a DatabaseConfig."""
+        self._write_config(3307)
+        config = DatabaseConfig.from_file(self._config_path)
+
+        self.assertEqual(config.connect_kwargs(),
+                         {'host': 'apel_mysql',
+                          'port': 3307,
+                          'db': 'apel_rest',
+                          'user': 'apel',
+                          'passwd': 'secret'})
+
+        # The password should not appear in log messages.
+        self.assertFalse('secret' in repr(config))
+
+    def test_from_file_invalid(self):
+        """Test missing or invalid config files are rejected."""
+        # The file does not exist yet.
+        self.assertRaises(DatabaseConfigError,
+                          DatabaseConfig.from_file, self._config_path)
+
+        for port in ('not_a_port', '0', '65536'):
+            self._write_config(port)
+            self.assertRaises(DatabaseConfigError,
+                              DatabaseConfig.from_file, self._config_path)
+
+        with open(self._config_path, 'w') as config_file:
+            config_file.write('[db]\nhostname = apel_mysql\n')
+
+        self.assertRaises(DatabaseConfigError,
+                          DatabaseConfig.from_file, self._config_path)
+
+    def test_shared_config_reload(self):
+        """Test the shared config is only re-read when requested."""
+        self._write_config(3306)
+        shared_config = SharedDatabaseConfig()
+
+        with self.settings(CLOUD_DB_CONF=self._config_path,
+                           CLOUD_DB_CONF_CHECK_INTERVAL=300):
+            self.assertEqual(shared_config.get().port, 3306)
+
+            # Within CLOUD_DB_CONF_CHECK_INTERVAL, the change is not seen.
+            self._write_config(3307)
+            self.assertEqual(shared_config.get().port, 3306)
+
+            shared_config.request_reload()
+            self.assertEqual(shared_config.get().port, 3307)
+
+    def test_shared_config_mtime(self):
+        """Test the shared config is re-read when the file changes."""
+        self._write_config(3306)
+        shared_config = SharedDatabaseConfig()
+
+        with self.settings(CLOUD_DB_CONF=self._config_path,
+                           CLOUD_DB_CONF_CHECK_INTERVAL=0):
+            self.assertEqual(shared_config.get().port, 3306)
+
+            self._write_config(3307)
+            # Make sure the modification time changes.
+            os.utime(self._config_path, (0, 0))
+            self.assertEqual(shared_config.get().port, 3307)
+
+            # An invalid change should leave the last valid config in use.
+            self._write_config('not_a_port')
+            os.utime(self._config_path, (1, 1))
+            self.assertEqual(shared_config.get().port, 3307)
+
+    def test_shared_config_missing(self):
+        """Test an error is raised if no valid config has been loaded."""
+        shared_config = SharedDatabaseConfig()
+
+        with self.settings(CLOUD_DB_CONF=self._config_path):
+            self.assertRaises(DatabaseConfigError, shared_config.get)
+
+    def _write_config(self, port):
+        """Write a config file using port to self._config_path."""
+        with open(self._config_path, 'w') as config_file:
+            config_file.write(CONFIG % port)
@@ -0,0 +1,164 @@
+"""This module tests the HttpClient class."""
+
+import httplib
+import logging
+import socket
+
+from django.test import TestCase
+from mock import Mock, patch
+
+from api.utils.HttpClient import CircuitOpenError, HttpClient, HttpError
+
+UPSTREAM = 'https://iam-test.idc.eu:443'
+
+
+class HttpClientTest(TestCase):
+    """Tests the HttpClient class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    @patch('api.utils.HttpClient.httplib.HTTPSConnection')
+    def test_keep_alive(self, mock_connection_class):
+        """Test connections are reused, and kept per upstream."""
+        connection = self._mock_connection([(200, 'keys'), (200, 'more')])
+        mock_connection_class.return_value = connection
+
+        http_client = HttpClient(connect_timeout=1, read_timeout=2)
+        self.assertEqual(http_client.get('https://iam-test.idc.eu/jwk'),
+                         'keys')
+        self.assertEqual(http_client.get('https://iam-test.idc.eu/jwk?a=b'),
+                         'more')
+
+        mock_connection_class.assert_called_once_with('iam-test.idc.eu', 443,
+                                                      timeout=1)
+        connection.sock.settimeout.assert_called_once_with(2)
+        connection.request.assert_called_with('GET', '/jwk?a=b', None, {})
+
+        stats = http_client.stats()[UPSTREAM]
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['idle'], 1)
+        self.assertEqual(sum(stats['latency'].values()), 2)
+
+    @patch('api.utils.HttpClient.time.sleep')
+    @patch('api.utils.HttpClient.httplib.HTTPSConnection')
+    def test_retries(self, mock_connection_class, mock_sleep):
+        """Test failures and 5xx statuses are retried, but 4xx are not."""
+        mock_connection_class.return_value = self._mock_connection(
+            [socket.timeout('timed out'), (503, ''), (200, 'keys'),
+             (404, '')])
+
+        http_client = HttpClient(retries=2)
+        self.assertEqual(http_client.get('https://iam-test.idc.eu/jwk'),
+                         'keys')
+        self.assertEqual(mock_sleep.call_count, 2)
+
+        with self.assertRaises(HttpError) as context:
+            http_client.get('https://iam-test.idc.eu/jwk')
+
+        self.assertEqual(context.exception.status, 404)
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertEqual(http_client.stats()[UPSTREAM]['failures'], 2)
+
+    @patch('api.utils.HttpClient.time.sleep')
+    @patch('api.utils.HttpClient.httplib.HTTPSConnection')
+    def test_retries_exhausted(self, mock_connection_class, mock_sleep):
+        """Test an HttpError is raised once the retries are used up."""
+        mock_connection_class.return_value = self._mock_connection(
+            [socket.error('refused')] * 3)
+
+        http_client = HttpClient(retries=2)
+        with self.assertRaises(HttpError) as context:
+            http_client.get('https://iam-test.idc.eu/jwk')
+
+        self.assertEqual(context.exception.status, None)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('api.utils.HttpClient.time.sleep')
+    @patch('api.utils.HttpClient.httplib.HTTPSConnection')
+    def test_closed_idle_connection(self, mock_connection_class,
+                                    mock_sleep):
+        """Test a request is resent if upstream closed an idle connection."""
+        # The server closes the first connection once it is idle.
+        mock_connection_class.side_effect = [
+            self._mock_connection([(200, 'keys'),
+                                   httplib.BadStatusLine("''")]),
+            self._mock_connection([(200, 'more')])]
+
+        http_client = HttpClient(retries=0, failure_threshold=1)
+        for expected in ('keys', 'more'):
+            self.assertEqual(http_client.get('https://iam-test.idc.eu/jwk'),
+                             expected)
+
+        self.assertFalse(mock_sleep.called)
+        stats = http_client.stats()[UPSTREAM]
+        self.assertEqual(stats['failures'], 0)
+        self.assertEqual(stats['circuit'], 'closed')
+
+    @patch('api.utils.HttpClient.time.time')
+    @patch('api.utils.HttpClient.httplib.HTTPSConnection')
+    def test_circuit_breaker(self, mock_connection_class, mock_time):
+        """Test requests fail fast while the circuit is open."""
+        mock_time.return_value = 1000
+        mock_connection_class.return_value = self._mock_connection(
+            [(500, ''), (500, ''), (200, 'keys')])
+
+        http_client = HttpClient(retries=0, failure_threshold=2,
+                                 reset_timeout=30)
+        for _ in range(2):
+            self.assertRaises(HttpError, http_client.get,
+                              'https://iam-test.idc.eu/jwk')
+
+        self.assertRaises(CircuitOpenError, http_client.get,
+                          'https://iam-test.idc.eu/jwk')
+        self.assertEqual(http_client.stats()[UPSTREAM]['circuit'], 'open')
+        self.assertEqual(http_client.stats()[UPSTREAM]['rejected'], 1)
+
+        # After reset_timeout, a successful request closes the circuit.
+        mock_time.return_value = 1030
+        self.assertEqual(http_client.get('https://iam-test.idc.eu/jwk'),
+                         'keys')
+        self.assertEqual(http_client.stats()[UPSTREAM]['circuit'], 'closed')
+
+    @patch('api.utils.HttpClient.httplib.HTTPConnection')
+    def test_redirect(self, mock_connection_class):
+        """Test redirects are followed."""
+        mock_connection_class.return_value = self._mock_connection(
+            [(302, '', {'location': '/v2/providers'}), (200, 'providers')])
+
+        http_client = HttpClient()
+        self.assertEqual(http_client.get('http://cmdb-test.idc.eu/providers'),
+                         'providers')
+        mock_connection_class.return_value.request.assert_called_with(
+            'GET', '/v2/providers', None, {})
+
+    def test_bad_url(self):
+        """Test an HttpError is raised for URLs that cannot be requested."""
+        http_client = HttpClient()
+        self.assertRaises(HttpError, http_client.get, 'ftp://cmdb-test.idc.eu')
+
+    def _mock_connection(self, responses):
+        """
+        Return a mock connection giving each of responses in turn.
+
+        Each response is an exception to raise, or a (status, body) or
+        (status, body, headers) tuple.
+        """
+        mock_responses = []
+        for response in responses:
+            if isinstance(response, Exception):
+                mock_responses.append(response)
+                continue
+
+            headers = response[2] if len(response) > 2 else {}
+            mock_responses.append(Mock(status=response[0], will_close=False,
+                                       read=Mock(return_value=response[1]),
+                                       getheaders=Mock(
+                                           return_value=headers.items())))
+
+        return Mock(getresponse=Mock(side_effect=mock_responses))
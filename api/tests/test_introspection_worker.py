@@ -0,0 +1,60 @@
+"""This module tests the IntrospectionWorker class."""
+
+import logging
+
+from django.test import TestCase
+from mock import Mock
+
+from api.utils.IntrospectionWorker import IntrospectionWorker
+
+
+class IntrospectionWorkerTest(TestCase):
+    """Tests the IntrospectionWorker class."""
+
+    def setUp(self):
+        """Create a worker that will not run checks itself."""
+        logging.disable(logging.CRITICAL)
+        # Checks are run by the tests, rather than the worker thread.
+        self._worker = IntrospectionWorker(interval=300, batch_size=2)
+
+    def tearDown(self):
+        """Drop any pending checks and re-enable logging."""
+        self._worker.clear()
+        logging.disable(logging.NOTSET)
+
+    def test_deduplicated(self):
+        """Test a check is not queued twice for the same key."""
+        check = Mock()
+
+        self.assertTrue(self._worker.submit('token', check))
+        self.assertFalse(self._worker.submit('token', check))
+        self.assertEqual(self._worker.pending(), 1)
+
+        self.assertEqual(self._worker.run_pending(), 1)
+        check.assert_called_once_with()
+
+        # Once checked, the key can be submitted again.
+        self.assertTrue(self._worker.submit('token', check))
+
+    def test_batched(self):
+        """Test checks are run in batches, oldest first."""
+        checks = [Mock() for _ in range(3)]
+        for number, check in enumerate(checks):
+            self._worker.submit('token%s' % number, check)
+
+        self.assertEqual(self._worker.run_pending(), 2)
+        self.assertTrue(checks[0].called)
+        self.assertTrue(checks[1].called)
+        self.assertFalse(checks[2].called)
+
+        self.assertEqual(self._worker.run_pending(), 1)
+        self.assertTrue(checks[2].called)
+
+    def test_failed_check(self):
+        """Test a failing check does not stop the rest of the batch."""
+        check = Mock()
+        self._worker.submit('failing', Mock(side_effect=ValueError))
+        self._worker.submit('token', check)
+
+        self.assertEqual(self._worker.run_pending(), 2)
+        self.assertTrue(check.called)
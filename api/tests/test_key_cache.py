@@ -0,0 +1,80 @@
+"""This module tests the KeyCache class."""
+
+import logging
+
+from django.test import TestCase
+from mock import Mock
+
+from api.utils.KeyCache import KeyCache
+
+ISSUER = 'https://iam-test.idc.eu/'
+
+KEY_A = {'kty': 'RSA', 'kid': 'a', 'n': 'AQAB', 'e': 'AQAB'}
+KEY_B = {'kty': 'RSA', 'kid': 'b', 'n': 'AQAB', 'e': 'AQAB'}
+
+
+class KeyCacheTest(TestCase):
+    """Tests the KeyCache class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_keys_cached(self):
+        """Test keys are only fetched once while fresh, and found by kid."""
+        key_cache = KeyCache(ttl=300, min_refresh_interval=0)
+        loader = Mock(return_value={'keys': [KEY_A, KEY_B]})
+
+        self.assertEqual(key_cache.keys(ISSUER, 'a', loader),
+                         {'keys': [KEY_A]})
+        self.assertEqual(key_cache.keys(ISSUER, 'b', loader),
+                         {'keys': [KEY_B]})
+        # Without a kid, any of the keys could match.
+        self.assertEqual(key_cache.keys(ISSUER, None, loader),
+                         {'keys': [KEY_A, KEY_B]})
+
+        loader.assert_called_once_with(ISSUER)
+
+    def test_keys_rotated(self):
+        """Test an unknown kid causes the keys to be fetched again."""
+        key_cache = KeyCache(ttl=300, min_refresh_interval=0)
+        loader = Mock(return_value={'keys': [KEY_A]})
+        key_cache.keys(ISSUER, 'a', loader)
+
+        loader.return_value = {'keys': [KEY_B]}
+        self.assertEqual(key_cache.keys(ISSUER, 'b', loader),
+                         {'keys': [KEY_B]})
+        self.assertEqual(loader.call_count, 2)
+
+    def test_refresh_limited(self):
+        """Test unknown kids cannot cause repeated fetches."""
+        key_cache = KeyCache(ttl=300, min_refresh_interval=300)
+        loader = Mock(return_value={'keys': [KEY_A]})
+        key_cache.keys(ISSUER, 'a', loader)
+
+        for _ in range(10):
+            self.assertEqual(key_cache.keys(ISSUER, 'forged', loader), None)
+
+        # The known key should still be found.
+        self.assertEqual(key_cache.keys(ISSUER, 'a', loader),
+                         {'keys': [KEY_A]})
+        self.assertEqual(loader.call_count, 1)
+
+    def test_failed_fetch(self):
+        """Test the last good keys are kept if a fetch fails."""
+        key_cache = KeyCache(ttl=0, min_refresh_interval=0)
+        loader = Mock(return_value={'keys': [KEY_A]})
+        key_cache.keys(ISSUER, 'a', loader)
+
+        for failure in (None, {}, {'keys': []}):
+            loader.return_value = failure
+            self.assertEqual(key_cache.keys(ISSUER, 'a', loader),
+                             {'keys': [KEY_A]})
+
+        # With nothing cached, there are no keys to return.
+        key_cache.clear()
+        self.assertEqual(key_cache.keys(ISSUER, 'a', loader), None)
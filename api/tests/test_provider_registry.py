@@ -0,0 +1,89 @@
+"""This module tests the ProviderRegistry class."""
+
+import logging
+import threading
+import time
+
+from django.test import TestCase
+from mock import Mock, patch
+
+from api.utils.ProviderRegistry import ProviderRegistry
+
+
+class ProviderRegistryTest(TestCase):
+    """Tests the ProviderRegistry class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_hostnames_cached(self):
+        """Test the loader is only called once while the copy is fresh."""
+        registry = ProviderRegistry(ttl=300)
+        loader = Mock(return_value=['allowed_host.test'])
+
+        for _ in range(3):
+            hostnames = registry.hostnames(loader)
+            self.assertTrue('allowed_host.test' in hostnames)
+
+        self.assertEqual(loader.call_count, 1)
+
+    @patch('api.utils.ProviderRegistry.time')
+    def test_stale_hostnames_served(self, mock_time):
+        """Test a stale copy is served and refreshed in the background."""
+        mock_time.time.return_value = 1000
+        registry = ProviderRegistry(ttl=300, retry_interval=0)
+        registry.refresh(Mock(return_value=['old_host.test']))
+
+        loaded = threading.Event()
+
+        def load():
+            """Return the new hostnames, signalling the refresh started."""
+            loaded.set()
+            return ['new_host.test']
+
+        loader = Mock(side_effect=load)
+        mock_time.time.return_value = 1300
+        # The stale copy should be returned straight away.
+        self.assertEqual(registry.hostnames(loader),
+                         frozenset(['old_host.test']))
+        loaded.wait(5)
+        self.assertTrue(loaded.is_set())
+
+        # The new copy is served once the refresh has stored it, and as
+        # it is fresh, no further refresh is started.
+        for _ in range(100):
+            hostnames = registry.hostnames(loader)
+            if hostnames == frozenset(['new_host.test']):
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(hostnames, frozenset(['new_host.test']))
+        self.assertEqual(loader.call_count, 1)
+
+    def test_failed_refresh(self):
+        """Test the last good copy is kept if a refresh fails."""
+        registry = ProviderRegistry()
+        registry.refresh(Mock(return_value=['allowed_host.test']))
+
+        # Both an empty result and an exception count as a failure.
+        registry.refresh(Mock(return_value=[]))
+        registry.refresh(Mock(side_effect=ValueError('CMDB down')))
+
+        self.assertEqual(registry.hostnames(Mock()),
+                         frozenset(['allowed_host.test']))
+
+    def test_failed_first_load(self):
+        """Test no hostnames are returned, and retries are limited."""
+        registry = ProviderRegistry(retry_interval=300)
+        loader = Mock(return_value=[])
+
+        self.assertEqual(registry.hostnames(loader), frozenset())
+        self.assertEqual(registry.hostnames(loader), frozenset())
+
+        # The second call is within retry_interval of the first attempt.
+        self.assertEqual(loader.call_count, 1)
@@ -0,0 +1,138 @@
+"""This module tests the QueueWriter class."""
+
+import errno
+import logging
+import os
+import shutil
+from StringIO import StringIO
+
+from dirq.queue import Queue, QueueError
+from django.test import TestCase
+from mock import patch
+
+from api.tests import MESSAGE
+from api.utils.ContentDecoder import BodyTooLargeError, ContentDecoder
+from api.utils.QueueWriter import (MessageEncodingError, QueueWriter,
+                                   get_queue_writer)
+
+QPATH_TEST = '/tmp/django-test-queue-writer/'
+
+QSCHEMA = {'body': 'string', 'signer': 'string', 'empaid': 'string?'}
+
+
+class QueueWriterTest(TestCase):
+    """Tests the QueueWriter class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Delete the test queue and re-enable logging."""
+        if os.path.exists(QPATH_TEST):
+            shutil.rmtree(QPATH_TEST)
+        logging.disable(logging.NOTSET)
+
+    def test_add_stream(self):
+        """Test a streamed message is the same as one added by dirq."""
+        queue_writer = QueueWriter(QPATH_TEST, QSCHEMA, chunk_size=16)
+        name = queue_writer.add_stream('body', StringIO(MESSAGE),
+                                       {'signer': 'test-signer'})
+
+        queue = Queue(QPATH_TEST, schema=QSCHEMA)
+        self.assertEqual(queue.count(), 1)
+        self.assertTrue(queue.lock(name))
+        self.assertEqual(queue.get(name), {'body': MESSAGE,
+                                           'signer': 'test-signer'})
+
+    def test_add_stream_error(self):
+        """Test nothing is added if the stream cannot be read."""
+        queue_writer = QueueWriter(QPATH_TEST, QSCHEMA, chunk_size=16)
+        body = ContentDecoder(max_size=32).open(StringIO(MESSAGE))
+
+        self.assertRaises(BodyTooLargeError, queue_writer.add_stream,
+                          'body', body, {'signer': 'test-signer'})
+
+        self.assertEqual(Queue(QPATH_TEST, schema=QSCHEMA).count(), 0)
+        # The partly written message should have been removed.
+        self.assertEqual(os.listdir(os.path.join(QPATH_TEST, 'temporary')),
+                         [])
+
+    def test_add_stream_utf8(self):
+        """Test messages are saved UTF-8 encoded, as dirq saves them."""
+        queue_writer = QueueWriter(QPATH_TEST, QSCHEMA, chunk_size=3)
+        queue = Queue(QPATH_TEST, schema=QSCHEMA)
+
+        # The second character is split across chunks.
+        for body in ('a\xe2\x82\xac caf\xc3\xa9', u'a\u20ac caf\xe9'):
+            name = queue_writer.add_stream('body', StringIO(body),
+                                           {'signer': u'caf\xe9'})
+            self.assertTrue(queue.lock(name))
+            self.assertEqual(queue.get(name), {'body': u'a\u20ac caf\xe9',
+                                               'signer': u'caf\xe9'})
+
+        # Bytes dirq could not read back are rejected, including an
+        # incomplete character at the end of the stream.
+        for body in ('\xff\xfe', 'caf\xc3'):
+            self.assertRaises(MessageEncodingError, queue_writer.add_stream,
+                              'body', StringIO(body),
+                              {'signer': 'test-signer'})
+
+        self.assertRaises(MessageEncodingError, queue_writer.add,
+                          {'body': MESSAGE, 'signer': '\xff\xfe'})
+
+        self.assertEqual(queue.count(), 2)
+        self.assertEqual(os.listdir(os.path.join(QPATH_TEST, 'temporary')),
+                         [])
+
+    def test_add_stream_invalid(self):
+        """Test messages that do not match the schema are rejected."""
+        queue_writer = QueueWriter(QPATH_TEST, QSCHEMA)
+
+        self.assertRaises(QueueError, queue_writer.add_stream,
+                          'body', StringIO(MESSAGE), {})
+        self.assertRaises(QueueError, queue_writer.add_stream,
+                          'body', StringIO(MESSAGE),
+                          {'signer': 'test-signer', 'unknown': 'field'})
+
+    def test_shards(self):
+        """Test sharded messages are spread across directories and read."""
+        # Make the first directory of every shard hold at most 2 messages.
+        queue_writer = QueueWriter(QPATH_TEST, QSCHEMA, shards=4, maxelts=2)
+
+        names = [queue_writer.add({'body': MESSAGE, 'signer': str(number)})
+                 for number in range(20)]
+
+        directories = set(name.split('/')[0] for name in names)
+        self.assertTrue(len(directories) > 4)
+        for directory in directories:
+            # Each shard uses directories numbered shard modulo 4.
+            self.assertTrue(len(os.listdir(os.path.join(QPATH_TEST,
+                                                        directory))) <= 2)
+
+        queue = Queue(QPATH_TEST, schema=QSCHEMA)
+        self.assertEqual(sorted(queue), sorted(names))
+        self.assertEqual(queue_writer.stats()['adds'], 20)
+
+    def test_rename_purged(self):
+        """Test an element purged before it is renamed is not retried."""
+        queue_writer = QueueWriter(QPATH_TEST, QSCHEMA)
+        # Queue.purge removes temporary elements older than maxtemp.
+        temp = os.path.join(QPATH_TEST, 'temporary', 'purged')
+
+        with patch('api.utils.QueueWriter.os.rename') as mock_rename:
+            mock_rename.side_effect = OSError(errno.ENOENT, 'Purged')
+            self.assertRaises(OSError, queue_writer._rename, temp)
+            self.assertEqual(mock_rename.call_count, 1)
+
+    def test_get_queue_writer(self):
+        """Test the QueueWriter is reused until the settings change."""
+        with self.settings(QPATH=QPATH_TEST, QUEUE_SHARDS=1):
+            queue_writer = get_queue_writer()
+            self.assertTrue(get_queue_writer() is queue_writer)
+            self.assertEqual(queue_writer.path,
+                             os.path.join(QPATH_TEST, 'incoming'))
+
+        with self.settings(QPATH=QPATH_TEST, QUEUE_SHARDS=2):
+            self.assertFalse(get_queue_writer() is queue_writer)
+            self.assertEqual(get_queue_writer().stats()['shards'], 2)
@@ -0,0 +1,71 @@
+"""This module tests the RejectedTokenCache class."""
+
+import logging
+
+from django.test import TestCase
+from mock import patch
+
+from api.utils.RejectedTokenCache import RejectedTokenCache
+
+
+class RejectedTokenCacheTest(TestCase):
+    """Tests the RejectedTokenCache class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_reject(self):
+        """Test rejected tokens are remembered with their reason."""
+        rejected_token_cache = RejectedTokenCache(max_entries=10, ttl=60)
+        rejected_token_cache.reject('token-one', 'untrusted issuer')
+
+        self.assertEqual(rejected_token_cache.get('token-one'),
+                         'untrusted issuer')
+        self.assertEqual(rejected_token_cache.get('token-two'), None)
+
+        self.assertEqual(rejected_token_cache.stats(),
+                         {'untrusted issuer': {'rejected': 1, 'hits': 1}})
+
+    @patch('api.utils.RejectedTokenCache.time.time')
+    def test_ttl(self, mock_time):
+        """Test rejected tokens are forgotten after ttl seconds."""
+        rejected_token_cache = RejectedTokenCache(max_entries=10, ttl=60)
+        mock_time.return_value = 1000
+        rejected_token_cache.reject('token-one', 'unverified')
+
+        mock_time.return_value = 1059
+        self.assertEqual(rejected_token_cache.get('token-one'), 'unverified')
+
+        mock_time.return_value = 1060
+        self.assertEqual(rejected_token_cache.get('token-one'), None)
+        self.assertEqual(len(rejected_token_cache), 0)
+
+    def test_lru_eviction(self):
+        """Test the least recently used token is forgotten when full."""
+        rejected_token_cache = RejectedTokenCache(max_entries=2, ttl=60)
+        rejected_token_cache.reject('token-one', 'malformed')
+        rejected_token_cache.reject('token-two', 'malformed')
+
+        # Using token-one makes token-two the least recently used.
+        rejected_token_cache.get('token-one')
+        rejected_token_cache.reject('token-three', 'malformed')
+
+        self.assertEqual(len(rejected_token_cache), 2)
+        self.assertEqual(rejected_token_cache.get('token-one'), 'malformed')
+        self.assertEqual(rejected_token_cache.get('token-two'), None)
+        self.assertEqual(rejected_token_cache.get('token-three'), 'malformed')
+
+    def test_clear(self):
+        """Test clear forgets tokens and resets the counters."""
+        rejected_token_cache = RejectedTokenCache()
+        rejected_token_cache.reject('token-one', 'malformed')
+
+        rejected_token_cache.clear()
+
+        self.assertEqual(rejected_token_cache.get('token-one'), None)
+        self.assertEqual(rejected_token_cache.stats(), {})
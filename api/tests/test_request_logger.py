@@ -0,0 +1,98 @@
+"""This module tests the RequestLogger class."""
+
+import logging
+import os
+import shutil
+from StringIO import StringIO
+
+from django.core.urlresolvers import reverse
+from django.test import Client, RequestFactory, TestCase
+from mock import Mock, patch
+
+from api.tests import MESSAGE, PROVIDERS
+from api.utils.RequestLogger import RequestLogger
+from api.views.CloudRecordView import CloudRecordView
+
+QPATH_TEST = '/tmp/django-test/'
+
+ALLOWED_DN = '/C=XX/O=XX/OU=XX/L=XX/CN=allowed_host.test'
+
+
+class RequestLoggerTest(TestCase):
+    """Tests the RequestLogger class."""
+
+    def setUp(self):
+        """Prevent logging from appearing in test output."""
+        logging.disable(logging.CRITICAL)
+        # Forget any providers cached by a previous test.
+        CloudRecordView.provider_registry.clear()
+
+    def tearDown(self):
+        """Delete any messages under QPATH and re-enable logging.INFO."""
+        if os.path.exists(QPATH_TEST):
+            shutil.rmtree(QPATH_TEST)
+        logging.disable(logging.NOTSET)
+
+    def test_sampling(self):
+        """Test only the sampled fraction of requests are logged."""
+        request = RequestFactory().get('/api/v1/cloud/record/summary')
+
+        self.assertEqual(RequestLogger(sample_rate=0.0).start(request), None)
+        self.assertNotEqual(RequestLogger(sample_rate=1.0).start(request),
+                            None)
+
+        with patch('api.utils.RequestLogger.random.random',
+                   side_effect=[0.05, 0.5]):
+            request_logger = RequestLogger(sample_rate=0.1)
+            self.assertNotEqual(request_logger.start(request), None)
+            self.assertEqual(request_logger.start(request), None)
+
+    def test_record(self):
+        """Test headers are redacted and only the start of bodies logged."""
+        request_logger = RequestLogger(sample_rate=1.0, body_bytes=8)
+        request_logger.log = Mock()
+
+        request = RequestFactory().get('/api/v1/cloud/record/summary',
+                                       {'from': '20000101'},
+                                       HTTP_AUTHORIZATION='Bearer secret',
+                                       HTTP_EMPA_ID='Test Process')
+        request_log = request_logger.start(request)
+
+        body = request_log.wrap(StringIO(MESSAGE))
+        self.assertEqual(body.read(4) + body.read(), MESSAGE)
+
+        request_log.finish(202)
+
+        [record], _ = request_logger.log.call_args
+        self.assertEqual(record['method'], 'GET')
+        self.assertEqual(record['path'], '/api/v1/cloud/record/summary')
+        self.assertEqual(record['query'], 'from=20000101')
+        self.assertEqual(record['headers']['HTTP_AUTHORIZATION'],
+                         '[redacted]')
+        self.assertEqual(record['headers']['HTTP_EMPA_ID'], 'Test Process')
+        self.assertEqual(record['body'], MESSAGE[:8])
+        self.assertEqual(record['body_size'], len(MESSAGE))
+        self.assertEqual(record['status'], 202)
+
+    def test_view_logging(self):
+        """Test a sampled POST request is logged once, with its status."""
+        mock_providers = Mock(return_value=PROVIDERS)
+        CloudRecordView._get_provider_json_indigo_cmdb = mock_providers
+
+        request_logger = RequestLogger(sample_rate=1.0, body_bytes=8)
+        request_logger.log = Mock()
+
+        with patch('api.utils.RequestLogger.REQUEST_LOGGER',
+                   request_logger):
+            with self.settings(QPATH=QPATH_TEST):
+                response = Client().post(
+                    reverse('CloudRecordView'), MESSAGE,
+                    content_type="text/plain",
+                    SSL_CLIENT_S_DN=ALLOWED_DN)
+
+        self.assertEqual(response.status_code, 202)
+
+        [record], _ = request_logger.log.call_args
+        self.assertEqual(request_logger.log.call_count, 1)
+        self.assertEqual(record['status'], 202)
+        self.assertEqual(record['body'], MESSAGE[:8])
@@ -0,0 +1,113 @@
+"""This module tests the ResponseCache class."""
+
+import datetime
+import logging
+import time
+
+from django.test import TestCase
+from mock import MagicMock, Mock
+from rest_framework.compat import OrderedDict
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+from api.utils.ResponseCache import ResponseCache
+
+
+class ResponseCacheTest(TestCase):
+    """Tests the ResponseCache class."""
+
+    def setUp(self):
+        """Create an empty ResponseCache and disable logging."""
+        self._response_cache = ResponseCache('default', ttl=300,
+                                             generation_ttl=60)
+        self._response_cache.clear()
+        self._factory = APIRequestFactory()
+
+        # Mock a connection pool whose LastUpdated table has one row.
+        self._cursor = Mock()
+        self._cursor.fetchall = Mock(
+            return_value=[('SummariseVMs', datetime.datetime(2018, 1, 1))])
+        self._pool = MagicMock()
+        database = self._pool.connection.return_value.__enter__.return_value
+        database.cursor = Mock(return_value=self._cursor)
+
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_generation(self):
+        """Test the generation is read from LastUpdated at most once a TTL."""
+        self.assertEqual(self._response_cache.generation(self._pool),
+                         'SummariseVMs=2018-01-01 00:00:00')
+        self._cursor.fetchall = Mock(
+            return_value=[('SummariseVMs', datetime.datetime(2018, 1, 2))])
+
+        # The generation was read too recently to read it again.
+        self.assertEqual(self._response_cache.generation(self._pool),
+                         'SummariseVMs=2018-01-01 00:00:00')
+        self.assertEqual(self._cursor.execute.call_count, 1)
+
+        self._response_cache._generation_ttl = 0
+        self.assertEqual(self._response_cache.generation(self._pool),
+                         'SummariseVMs=2018-01-02 00:00:00')
+        self.assertEqual(self._response_cache.last_modified(self._pool),
+                         time.mktime((2018, 1, 2, 0, 0, 0, 0, 0, -1)))
+
+    def test_set_keeps_order(self):
+        """Test a cached response renders the same as the original."""
+        request = self._factory.get('/api/v1/cloud/record/summary'
+                                    '?from=20180101')
+        summary = OrderedDict([('VO', 'TestVO'), ('Year', 2018),
+                               ('SiteName', 'TestSite')])
+        data = ReturnDict([('count', 1), ('next', None),
+                           ('previous', None), ('results', [summary])],
+                          serializer=None)
+        self._response_cache.set(request, 'one', data)
+
+        cached = self._response_cache.get(request, 'one')
+        self.assertEqual(JSONRenderer().render(cached),
+                         JSONRenderer().render(data))
+
+    def test_get_and_set(self):
+        """Test responses are cached by query and generation."""
+        request = self._factory.get('/api/v1/cloud/record/summary'
+                                    '?from=20180101&group=TestGroup')
+        self._response_cache.set(request, 'one', {'count': 1})
+
+        # The order of the query parameters should not matter.
+        same_request = self._factory.get('/api/v1/cloud/record/summary'
+                                         '?group=TestGroup&from=20180101')
+        self.assertEqual(self._response_cache.get(same_request, 'one'),
+                         {'count': 1})
+
+        other_request = self._factory.get('/api/v1/cloud/record/summary'
+                                          '?from=20180101&group=Other')
+        self.assertEqual(self._response_cache.get(other_request, 'one'),
+                         None)
+
+        # A new generation should not see the old responses.
+        self.assertEqual(self._response_cache.get(request, 'two'), None)
+
+        with self.settings(RETURN_HEADERS=['Day']):
+            self.assertEqual(self._response_cache.get(request, 'one'), None)
+
+        stats = self._response_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+    def test_etag(self):
+        """Test the ETag changes with the query and the generation."""
+        request = self._factory.get('/api/v1/cloud/record/summary'
+                                    '?from=20180101')
+        etag = self._response_cache.etag(request, 'one')
+
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        self.assertEqual(self._response_cache.etag(request, 'one'), etag)
+        self.assertNotEqual(self._response_cache.etag(request, 'two'), etag)
+
+        other_request = self._factory.get('/api/v1/cloud/record/summary'
+                                          '?from=20180102')
+        self.assertNotEqual(self._response_cache.etag(other_request, 'one'),
+                            etag)
@@ -0,0 +1,79 @@
+"""This module tests the Sender class of scripts/sender.py."""
+
+import imp
+import logging
+import os
+import shutil
+import threading
+import unittest
+
+from dirq.QueueSimple import QueueSimple
+from mock import Mock, patch
+
+# scripts is not a package, so sender.py is loaded from its path.
+sender = imp.load_source('sender', os.path.join(
+    os.path.dirname(__file__), '..', '..', 'scripts', 'sender.py'))
+
+QPATH_TEST = '/tmp/django-test-sender/'
+
+
+class SenderTest(unittest.TestCase):
+    """Tests the Sender class."""
+
+    def setUp(self):
+        """Create a test queue and prevent logging from appearing."""
+        self._queue = QueueSimple(QPATH_TEST)
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Delete the test queue and re-enable logging."""
+        if os.path.exists(QPATH_TEST):
+            shutil.rmtree(QPATH_TEST)
+        logging.disable(logging.NOTSET)
+
+    @patch.object(sender.Sender, '_rest_send')
+    def test_send_all(self, mock_rest_send):
+        """Test every message is sent and removed from the queue."""
+        mock_rest_send.return_value = Mock(status=202)
+        for number in range(5):
+            self._queue.add('message %s' % number)
+
+        test_sender = self._sender(workers=2)
+        self.assertTrue(test_sender.send_all())
+
+        self.assertEqual(self._queue.count(), 0)
+        self.assertEqual(sorted(call[0][2]
+                                for call in mock_rest_send.call_args_list),
+                         ['message %s' % number for number in range(5)])
+
+    @patch.object(sender.Sender, '_rest_send')
+    def test_send_all_error(self, mock_rest_send):
+        """Test an unexpected error stops sending without hanging."""
+        mock_rest_send.return_value = Mock(status=202)
+        # More messages than msgids can hold with one worker.
+        for number in range(25):
+            self._queue.add('message %s' % number)
+
+        test_sender = self._sender(workers=1)
+        test_sender._outq.get = Mock(side_effect=IOError('Cannot read'))
+
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(test_sender.send_all()))
+        thread.daemon = True
+        thread.start()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive(), "send_all did not return")
+        self.assertEqual(results, [False])
+        self.assertFalse(mock_rest_send.called)
+        self.assertEqual(self._queue.count(), 25)
+
+    def test_no_workers(self):
+        """Test a Sender needs at least one worker."""
+        self.assertRaises(ValueError, self._sender, workers=0)
+
+    def _sender(self, workers):
+        """Return a Sender for the test queue using workers threads."""
+        return sender.Sender('localhost', QPATH_TEST, 'cert', 'key', 'v1',
+                             workers=workers)
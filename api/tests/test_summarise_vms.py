@@ -0,0 +1,57 @@
+"""This module tests scripts/summarise_vms.py."""
+
+import imp
+import logging
+import os
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+# scripts is not a package, so summarise_vms.py is loaded from its path.
+summarise_vms = imp.load_source('summarise_vms', os.path.join(
+    os.path.dirname(__file__), '..', '..', 'scripts', 'summarise_vms.py'))
+
+
+class SummariseVMsTest(unittest.TestCase):
+    """Tests scripts/summarise_vms.py."""
+
+    def setUp(self):
+        """Prevent logging from appearing."""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_read_config(self):
+        """Test the connection is read from the [db] section."""
+        config = tempfile.NamedTemporaryFile(suffix='.cfg')
+        config.write('[db]\n'
+                     'backend = mysql\n'
+                     'hostname = apel_mysql \n'
+                     'port = 3306\n'
+                     'name = apel_rest\n'
+                     'username = apel\n'
+                     'password = secret\n')
+        config.flush()
+
+        self.assertEqual(summarise_vms.read_config(config.name),
+                         {'host': 'apel_mysql', 'port': 3306,
+                          'db': 'apel_rest', 'user': 'apel',
+                          'passwd': 'secret'})
+        config.close()
+
+    @patch.object(summarise_vms.MySQLdb, 'connect')
+    def test_summarise(self, mock_connect):
+        """Test SummariseVMs is called and committed."""
+        database = Mock()
+        mock_connect.return_value = database
+
+        summarise_vms.summarise({'host': 'localhost'})
+
+        mock_connect.assert_called_once_with(host='localhost')
+        database.cursor.return_value.execute.assert_called_once_with(
+            'CALL SummariseVMs()')
+        self.assertTrue(database.commit.called)
+        self.assertTrue(database.close.called)
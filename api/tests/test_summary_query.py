@@ -0,0 +1,214 @@
+"""This module tests the SummaryQuery class."""
+
+import logging
+
+from django.core.paginator import Paginator
+from django.test import TestCase
+from mock import Mock
+
+from api.utils.SummaryQuery import SummaryQuery
+
+
+class SummaryQueryTest(TestCase):
+    """Tests the SummaryQuery class."""
+
+    def setUp(self):
+        """Create a mock database and disable logging."""
+        logging.disable(logging.CRITICAL)
+        self._cursor = Mock()
+        self._database = Mock()
+        self._database.cursor = Mock(return_value=self._cursor)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_count(self):
+        """Test the count is queried once, using the query's conditions."""
+        self._cursor.fetchone = Mock(return_value=(250,))
+        query = SummaryQuery(self._database, ['VOGroup = %s'], ['TestGroup'])
+
+        self.assertEqual(query.count(), 250)
+        self.assertEqual(len(query), 250)
+
+        self._cursor.execute.assert_called_once_with(
+            'select count(*) from MaterialisedCloudSummaries '
+            'where VOGroup = %s',
+            ['TestGroup'])
+
+    def test_slice(self):
+        """Test slicing a query fetches only that slice, in order."""
+        self._cursor.fetchone = Mock(return_value=(250,))
+        self._cursor.fetchall = Mock(return_value=[('TEST', 30)])
+        query = SummaryQuery(self._database, ['VOGroup = %s'], ['TestGroup'],
+                             ['SiteName', 'Day'])
+
+        self.assertEqual(query[200:300], [{'SiteName': 'TEST', 'Day': 30}])
+
+        sql, params = self._cursor.execute.call_args[0]
+        self.assertTrue(sql.startswith('select SiteName, Day '
+                                       'from MaterialisedCloudSummaries '
+                                       'where VOGroup = %s order by Year, '
+                                       'Month, Day, '))
+        self.assertTrue(sql.endswith(' limit %s offset %s'))
+        # The slice is clamped to the number of summaries.
+        self.assertEqual(params, ['TestGroup', 50, 200])
+
+    def test_columns(self):
+        """Test only known columns can be requested."""
+        self.assertRaises(ValueError, SummaryQuery,
+                          self._database, [], [], ['Day', 'Password'])
+        self.assertRaises(ValueError, SummaryQuery,
+                          self._database, [], [], [])
+
+        for columns in (['Day', 'Password'], [], ['Day', 'Day']):
+            self.assertRaises(ValueError, SummaryQuery.check_columns,
+                              columns)
+
+        SummaryQuery.check_columns(SummaryQuery.COLUMNS)
+
+    def test_column_order(self):
+        """Test columns are selected in the order they were requested."""
+        self._cursor.fetchone = Mock(return_value=(1,))
+        self._cursor.fetchall = Mock(return_value=[(2018, 'TEST', 30)])
+        query = SummaryQuery(self._database, [], [],
+                             ['Year', 'SiteName', 'WallDuration'])
+
+        self.assertEqual(query[0:1], [{'Year': 2018, 'SiteName': 'TEST',
+                                       'WallDuration': 30}])
+        sql, _ = self._cursor.execute.call_args[0]
+        self.assertTrue(sql.startswith('select Year, SiteName, WallDuration '
+                                       'from '))
+
+    def test_paginator(self):
+        """Test a SummaryQuery can be paginated without fetching all rows."""
+        self._cursor.fetchone = Mock(return_value=(0,))
+        query = SummaryQuery(self._database, [], [])
+
+        page = Paginator(query, 100).page(1)
+
+        self.assertEqual(list(page.object_list), [])
+        # Only the count should have been queried.
+        self.assertEqual(self._cursor.execute.call_count, 1)
+
+    def test_seek(self):
+        """Test seeking fetches the rows either side of a key."""
+        # The returned WallDuration, then the ORDER_BY key columns.
+        rows = [(10,) + (1,) * len(SummaryQuery.ORDER_BY),
+                (20,) + (2,) * len(SummaryQuery.ORDER_BY)]
+        self._cursor.fetchall = Mock(return_value=rows)
+        query = SummaryQuery(self._database, ['VOGroup = %s'], ['TestGroup'],
+                             ['WallDuration'])
+        key = (0,) * len(SummaryQuery.ORDER_BY)
+
+        result = query.seek(10, after=key)
+
+        self.assertEqual(result,
+                         [((1,) * len(SummaryQuery.ORDER_BY),
+                           {'WallDuration': 10}),
+                          ((2,) * len(SummaryQuery.ORDER_BY),
+                           {'WallDuration': 20})])
+        sql, params = self._cursor.execute.call_args[0]
+        self.assertTrue(sql.startswith('select WallDuration, Year, Month, '))
+        self.assertTrue('where VOGroup = %s and (Year > %s or ' in sql)
+        self.assertTrue(sql.endswith('ImageId limit %s'))
+        self.assertEqual(params[0], 'TestGroup')
+        self.assertEqual(params[-1], 10)
+        # No count should have been queried.
+        self.assertEqual(self._cursor.execute.call_count, 1)
+
+        # Seeking backwards fetches in descending order, then reverses.
+        self._cursor.fetchall = Mock(return_value=list(reversed(rows)))
+        result = query.seek(10, before=key)
+
+        self.assertEqual([row for _, row in result],
+                         [{'WallDuration': 10}, {'WallDuration': 20}])
+        sql, _ = self._cursor.execute.call_args[0]
+        self.assertTrue('(Year < %s or ' in sql)
+        self.assertTrue(sql.endswith('ImageId desc limit %s'))
+
+    def test_granularity(self):
+        """Test monthly summaries are read from the monthly rollup."""
+        self._cursor.fetchone = Mock(return_value=(1,))
+        self._cursor.fetchall = Mock(return_value=[(None, 2, 2016)])
+        query = SummaryQuery(self._database, [], [], ['Day', 'Month', 'Year'],
+                             'month')
+
+        self.assertEqual(query[0:1], [{'Day': None, 'Month': 2,
+                                       'Year': 2016}])
+
+        sql, _ = self._cursor.execute.call_args[0]
+        # Day is rolled up, so is null and not part of the order.
+        self.assertTrue(sql.startswith('select null, Month, Year '
+                                       'from CloudMonthlySummaries '
+                                       'order by Year, Month, SiteName, '))
+        self.assertEqual(SummaryQuery.key_columns('month'),
+                         SummaryQuery.ORDER_BY[:2] + SummaryQuery.ORDER_BY[3:])
+
+        # Rolled up columns cannot be grouped by.
+        self.assertRaises(ValueError, query.aggregate, ['Day'],
+                          ['WallDuration'])
+        self.assertRaises(ValueError, SummaryQuery, self._database, [], [],
+                          None, 'week')
+
+    def test_key_condition(self):
+        """Test the key comparison is expanded column by column."""
+        query = SummaryQuery(self._database, [], [])
+        query._order_by = ('Year', 'Month', 'Day')
+
+        condition, params = query._key_condition('>', (2016, 7, 30))
+
+        self.assertEqual(condition,
+                         '(Year > %s or (Year = %s and '
+                         '(Month > %s or (Month = %s and Day > %s))))')
+        self.assertEqual(params, [2016, 2016, 7, 7, 30])
+
+    def test_stream(self):
+        """Test streaming a query fetches rows in chunks."""
+        self._cursor.fetchmany = Mock(side_effect=[[(30,)], [(31,)], []])
+        query = SummaryQuery(self._database, [], [], ['Day'])
+
+        rows = query.stream(chunk_size=1)
+        # The query should have been run before any rows are requested.
+        self.assertTrue(self._cursor.execute.called)
+
+        self.assertEqual(list(rows), [{'Day': 30}, {'Day': 31}])
+        self._cursor.fetchmany.assert_called_with(1)
+        self.assertTrue(self._cursor.close.called)
+
+    def test_aggregate(self):
+        """Test aggregating groups and sums in MySQL."""
+        self._cursor.fetchall = Mock(return_value=[('TEST', 2, 90, 3),
+                                                   ('TEST', 3, None, 0)])
+        query = SummaryQuery(self._database, ['VOGroup = %s'], ['TestGroup'])
+
+        totals = query.aggregate(['SiteName', 'Month'],
+                                 ['WallDuration', 'NumberOfVMs'], 10)
+
+        self.assertEqual(totals, [{'SiteName': 'TEST', 'Month': 2,
+                                   'WallDuration': 90, 'NumberOfVMs': 3},
+                                  {'SiteName': 'TEST', 'Month': 3,
+                                   'WallDuration': None, 'NumberOfVMs': 0}])
+        self._cursor.execute.assert_called_once_with(
+            'select SiteName, Month, sum(WallDuration), sum(NumberOfVMs) '
+            'from MaterialisedCloudSummaries where VOGroup = %s '
+            'group by SiteName, Month order by SiteName, Month limit %s',
+            ['TestGroup', 10])
+
+        # Without group_by, a single total is returned.
+        self._cursor.fetchall = Mock(return_value=[(90,)])
+        self.assertEqual(query.aggregate([], ['WallDuration']),
+                         [{'WallDuration': 90}])
+
+    def test_aggregate_columns(self):
+        """Test only known columns can be grouped by or summed."""
+        query = SummaryQuery(self._database, [], [])
+
+        self.assertRaises(ValueError, query.aggregate,
+                          ['Password'], ['WallDuration'])
+        # Dimensions cannot be summed, nor metrics grouped by.
+        self.assertRaises(ValueError, query.aggregate, [], ['SiteName'])
+        self.assertRaises(ValueError, query.aggregate,
+                          ['WallDuration'], ['WallDuration'])
+        self.assertRaises(ValueError, query.aggregate, ['SiteName'], [])
+        self.assertFalse(self._cursor.execute.called)
@@ -0,0 +1,66 @@
+"""This module tests the TokenCache class."""
+
+import logging
+import time
+
+from django.test import TestCase
+
+from api.utils.TokenCache import TokenCache
+
+
+class TokenCacheTest(TestCase):
+    """Tests the TokenCache class."""
+
+    def setUp(self):
+        """Create an empty TokenCache and disable logging."""
+        self._token_cache = TokenCache('default', ttl=300)
+        self._token_cache.clear()
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        """Re-enable logging."""
+        logging.disable(logging.NOTSET)
+
+    def test_get_and_set(self):
+        """Test each token is cached separately, even for one subject."""
+        expires = time.time() + 3600
+        self._token_cache.set('token-one', 'subject', expires)
+        self._token_cache.set('token-two', 'subject', expires)
+
+        self.assertEqual(self._token_cache.get('token-one'), 'subject')
+        self.assertEqual(self._token_cache.get('token-two'), 'subject')
+        self.assertEqual(self._token_cache.get('token-three'), None)
+
+        self.assertEqual(self._token_cache.stats(), {'hits': 2, 'misses': 1})
+
+    def test_key(self):
+        """Test tokens are not stored in the cache keys."""
+        key = self._token_cache._key('verified', 'token-one')
+        self.assertNotIn('token-one', key)
+        self.assertNotEqual(key, self._token_cache._key('revoked',
+                                                        'token-one'))
+
+    def test_set_expired(self):
+        """Test an expired token is not cached."""
+        self._token_cache.set('token-one', 'subject', time.time() - 1)
+        self.assertEqual(self._token_cache.get('token-one'), None)
+
+    def test_revoke(self):
+        """Test a revoked token is no longer cached as verified."""
+        self._token_cache.set('token-one', 'subject', time.time() + 3600)
+        self.assertFalse(self._token_cache.is_revoked('token-one'))
+
+        self._token_cache.revoke('token-one', 300)
+
+        self.assertTrue(self._token_cache.is_revoked('token-one'))
+        self.assertEqual(self._token_cache.get('token-one'), None)
+
+    def test_clear(self):
+        """Test clear forgets tokens and resets the counters."""
+        self._token_cache.set('token-one', 'subject', time.time() + 3600)
+        self._token_cache.get('token-one')
+
+        self._token_cache.clear()
+
+        self.assertEqual(self._token_cache.stats(), {'hits': 0, 'misses': 0})
+        self.assertEqual(self._token_cache.get('token-one'), None)
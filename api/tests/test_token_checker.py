@@ -5,8 +5,10 @@ import time
 
 from jose import jwt
 from django.test import TestCase
-from mock import patch
+from mock import Mock, patch
 
+from api.utils.HttpClient import HttpError
+from api.utils.TokenCache import TokenCache
 from api.utils.TokenChecker import TokenChecker
 
 
@@ -16,10 +18,22 @@ class TokenCheckerTest(TestCase):
     def setUp(self):
         """Create a new TokenChecker and disable logging."""
         self._token_checker = TokenChecker()
+        # Cache tokens in this process, rather than in memcached, which
+        # may not be running.
+        self._token_cache_patcher = patch.object(
+            TokenChecker, 'token_cache', TokenCache('default', ttl=300))
+        self._token_cache_patcher.start()
+        # Make sure keys and tokens cached by other tests are not used.
+        TokenChecker.key_cache.clear()
+        TokenChecker.introspection_worker.clear()
+        TokenChecker.token_cache.clear()
+        TokenChecker.rejected_token_cache.clear()
+        TokenChecker.token_cache_stats_logged = 0
         logging.disable(logging.CRITICAL)
 
     def tearDown(self):
-        """Re-enable logging."""
+        """Restore the token cache and re-enable logging."""
+        self._token_cache_patcher.stop()
         logging.disable(logging.NOTSET)
 
     @patch.object(TokenChecker, '_get_issuer_public_key')
@@ -57,6 +71,17 @@ class TokenCheckerTest(TestCase):
                     "Token with payload %s should not be accepted!" % payload
                 )
 
+    def test_token_cache_stats(self):
+        """Check the token cache stats are logged at INFO level, in turn."""
+        self._token_checker.logger = Mock()
+
+        with self.settings(TOKEN_CACHE_STATS_INTERVAL=600):
+            self._token_checker._log_token_cache_stats()
+            self._token_checker._log_token_cache_stats()
+
+        self.assertEqual(self._token_checker.logger.info.call_count, 1)
+        self.assertEqual(self._token_checker.logger.debug.call_count, 1)
+
     @patch.object(TokenChecker, '_get_issuer_public_key')
     @patch.object(TokenChecker, '_check_token_not_revoked')
     def test_token_cache_mis_match(self, mock_check_token_not_revoked,
@@ -161,6 +186,98 @@ class TokenCheckerTest(TestCase):
                     "Token with payload %s should not be accepted!" % payload
                 )
 
+    @patch.object(TokenChecker, '_get_issuer_public_key')
+    @patch.object(TokenChecker, '_introspect_token')
+    def test_async_introspection(self, mock_introspect_token,
+                                 mock_get_issuer_public_key):
+        """
+        Check tokens are accepted before being checked with the IAM.
+
+        A token the IAM says is inactive in the background should be
+        rejected from then on, even though it had been cached.
+        """
+        mock_get_issuer_public_key.return_value = PUBLIC_KEY
+        # The IAM will say the token has been revoked.
+        mock_introspect_token.return_value = (TokenChecker.INACTIVE, None)
+
+        token = self._create_token(self._standard_token(), PRIVATE_KEY)
+        with self.settings(IAM_HOSTNAME_LIST=['iam-test.idc.eu'],
+                           ASYNC_TOKEN_INTROSPECTION=True):
+            # Using the token twice should only queue one check.
+            for _ in range(2):
+                self.assertEqual(
+                    self._token_checker.valid_token_to_id(token), CLIENT_ID)
+
+            self.assertFalse(mock_introspect_token.called)
+
+            # Run the check, rather than waiting for the worker thread.
+            self.assertEqual(TokenChecker.introspection_worker.run_pending(),
+                             1)
+            mock_introspect_token.assert_called_once_with(
+                token, 'https://iam-test.idc.eu/')
+
+            self.assertEqual(self._token_checker.valid_token_to_id(token),
+                             None)
+
+    @patch.object(TokenChecker, '_get_issuer_public_key')
+    @patch('api.utils.TokenChecker.HTTP_CLIENT')
+    def test_async_introspection_unknown(self, mock_http_client,
+                                         mock_get_issuer_public_key):
+        """Check a token is not revoked when the IAM cannot be asked."""
+        mock_get_issuer_public_key.return_value = PUBLIC_KEY
+        # The IAM will be unreachable.
+        mock_http_client.post.side_effect = HttpError('IAM is down')
+
+        token = self._create_token(self._standard_token(), PRIVATE_KEY)
+        with self.settings(IAM_HOSTNAME_LIST=['iam-test.idc.eu'],
+                           ASYNC_TOKEN_INTROSPECTION=True):
+            self.assertEqual(self._token_checker.valid_token_to_id(token),
+                             CLIENT_ID)
+            self.assertEqual(TokenChecker.introspection_worker.run_pending(),
+                             1)
+            self.assertEqual(self._token_checker.valid_token_to_id(token),
+                             CLIENT_ID)
+
+    @patch('api.utils.TokenChecker.HTTP_CLIENT')
+    def test_introspect_token(self, mock_http_client):
+        """Check the IAM's answers are told apart from failures to ask."""
+        issuer = 'https://iam-test.idc.eu/'
+        for response, expected in (
+                ('{"active": true, "client_id": "%s"}' % CLIENT_ID,
+                 (TokenChecker.ACTIVE, CLIENT_ID)),
+                ('{"active": false}', (TokenChecker.INACTIVE, None)),
+                ('{"active": true}', (TokenChecker.UNKNOWN, None)),
+                ('not json', (TokenChecker.UNKNOWN, None)),
+                ('[]', (TokenChecker.UNKNOWN, None))):
+            mock_http_client.post.return_value = response
+            self.assertEqual(
+                self._token_checker._introspect_token('token', issuer),
+                expected, "Unexpected result for %s" % response)
+
+        mock_http_client.post.side_effect = HttpError('IAM is down')
+        self.assertEqual(self._token_checker._introspect_token('token',
+                                                               issuer),
+                         (TokenChecker.UNKNOWN, None))
+
+    @patch.object(TokenChecker, '_verify_token')
+    def test_rejected_token_cache(self, mock_verify_token):
+        """Check a rejected token is rejected again without being checked."""
+        # The token will not be verified against the IAM's public key.
+        mock_verify_token.return_value = False
+
+        token = self._create_token(self._standard_token(),
+                                   FORGED_PRIVATE_KEY)
+        with self.settings(IAM_HOSTNAME_LIST=['iam-test.idc.eu']):
+            for _ in range(2):
+                self.assertEqual(
+                    self._token_checker.valid_token_to_id(token), None)
+
+        # The token should only have been verified the first time.
+        mock_verify_token.assert_called_once_with(token,
+                                                  'https://iam-test.idc.eu/')
+        self.assertEqual(TokenChecker.rejected_token_cache.stats(),
+                         {'unverified': {'rejected': 1, 'hits': 1}})
+
     def test_is_token_issuer_trusted(self):
         """
         Check an untrusted 'issuer' (or missing 'issuer') is detected.
@@ -0,0 +1,218 @@
+"""This module contains the ConnectionPool class."""
+import contextlib
+import logging
+import threading
+import time
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available in time."""
+
+    pass
+
+
+class ConnectionPool(object):
+    """
+    A thread safe pool of database connections.
+
+    Up to 'size' connections are kept open and reused between requests.
+    When they are all in use, up to 'max_overflow' extra connections are
+    opened and closed again once returned. After that, callers wait up to
+    'timeout' seconds for a connection to be returned.
+
+    Connections older than 'max_lifetime' seconds are replaced, and idle
+    connections are checked with ping() before being handed out.
+    """
+
+    def __init__(self, connect, size=5, max_overflow=5,
+                 max_lifetime=3600, timeout=10):
+        """
+        Initialize a new, empty, ConnectionPool.
+
+        connect is a callable returning a new DB-API connection.
+        """
+        self.logger = logging.getLogger(__name__)
+        self._connect = connect
+        self._size = size
+        self._max_overflow = max_overflow
+        self._max_lifetime = max_lifetime
+        self._timeout = timeout
+
+        self._condition = threading.Condition()
+        # Idle connections, as (connection, created_at) tuples.
+        self._idle = []
+        # The number of connections currently open, idle or in use.
+        self._open = 0
+        self._in_use = 0
+        self._disposed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrow a connection from the pool for the duration of a with block.
+
+        If the block raises an exception the connection is closed rather
+        than returned, as it may be left in an unknown state.
+        """
+        connection, created_at = self._checkout()
+        try:
+            yield connection
+        except:
+            self._discard(connection)
+            raise
+        else:
+            self._checkin(connection, created_at)
+
+    def stats(self):
+        """Return a dictionary describing pool occupancy and wait times."""
+        with self._condition:
+            if self._checkouts:
+                average_wait = self._total_wait / self._checkouts
+            else:
+                average_wait = 0.0
+
+            return {'size': self._size,
+                    'max_overflow': self._max_overflow,
+                    'open': self._open,
+                    'idle': len(self._idle),
+                    'in_use': self._in_use,
+                    'overflow': max(self._open - self._size, 0),
+                    'checkouts': self._checkouts,
+                    'timeouts': self._timeouts,
+                    'average_wait': average_wait,
+                    'max_wait': self._max_wait}
+
+    def dispose(self):
+        """
+        Close all idle connections.
+
+        Connections currently in use are closed when they are returned.
+        """
+        with self._condition:
+            self._disposed = True
+            idle = self._idle
+            self._idle = []
+            self._open -= len(idle)
+            self._condition.notify_all()
+
+        for connection, _ in idle:
+            self._close(connection)
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _checkout(self):
+        """Return an open (connection, created_at) tuple from the pool."""
+        start = time.time()
+        deadline = start + self._timeout
+
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, created_at = self._idle.pop()
+                    break
+
+                if self._open < self._size + self._max_overflow:
+                    # Reserve a slot, the connection is made outside the lock.
+                    connection = None
+                    self._open += 1
+                    break
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError("No database connection became "
+                                           "available within %s seconds" %
+                                           self._timeout)
+
+                self._condition.wait(remaining)
+
+            self._in_use += 1
+            wait = time.time() - start
+            self._checkouts += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+
+        if connection is not None:
+            if self._is_healthy(connection, created_at):
+                return connection, created_at
+
+            self._close(connection)
+
+        try:
+            return self._connect(), time.time()
+        except:
+            # Give back the slot reserved for the new connection.
+            with self._condition:
+                self._open -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def _checkin(self, connection, created_at):
+        """Return a connection to the pool, or close it if not needed."""
+        try:
+            # End any transaction, so the next borrower does not see
+            # a stale snapshot of the database.
+            connection.rollback()
+        except Exception as error:
+            self.logger.warning("Could not reset database connection: %s",
+                                error)
+            self._discard(connection)
+            return
+
+        expired = time.time() - created_at >= self._max_lifetime
+        with self._condition:
+            self._in_use -= 1
+            # Overflow connections are closed rather than kept idle.
+            keep = (not expired and not self._disposed and
+                    self._open <= self._size)
+            if keep:
+                self._idle.append((connection, created_at))
+            else:
+                self._open -= 1
+            self._condition.notify()
+
+        if not keep:
+            self._close(connection)
+
+    def _discard(self, connection):
+        """Close a borrowed connection and free its slot in the pool."""
+        with self._condition:
+            self._in_use -= 1
+            self._open -= 1
+            self._condition.notify()
+
+        self._close(connection)
+
+    def _is_healthy(self, connection, created_at):
+        """Return True if an idle connection can be handed out."""
+        if time.time() - created_at >= self._max_lifetime:
+            return False
+
+        try:
+            connection.ping()
+        except Exception as error:
+            # Different drivers raise different errors from ping(),
+            # any of them means this connection cannot be used.
+            self.logger.info("Discarding broken database connection: %s",
+                             error)
+            return False
+
+        return True
+
+    def _close(self, connection):
+        """Close a connection, ignoring any errors."""
+        try:
+            connection.close()
+        except Exception as error:
+            self.logger.debug("Error closing database connection: %s", error)
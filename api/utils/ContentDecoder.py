@@ -0,0 +1,132 @@
+"""This module contains the ContentDecoder class."""
+import zlib
+
+
+class ContentDecodeError(Exception):
+    """Raised when a request body cannot be decoded."""
+
+    # The HTTP status to respond with.
+    status = 400
+
+
+class UnsupportedEncodingError(ContentDecodeError):
+    """Raised when a request body has an unsupported Content-Encoding."""
+
+    status = 415
+
+
+class BodyTooLargeError(ContentDecodeError):
+    """Raised when a decoded request body is larger than allowed."""
+
+    status = 413
+
+
+class ContentDecoder(object):
+    """
+    Decode request bodies sent with a Content-Encoding.
+
+    Bodies are read, and gzip bodies decompressed, a chunk at a time.
+    Reading is abandoned as soon as more than 'max_size' bytes of body
+    have been produced, so a large body, or a small body that expands a
+    lot, cannot fill the memory of the server.
+    """
+
+    ENCODINGS = ('identity', 'gzip', 'x-gzip')
+
+    def __init__(self, max_size, chunk_size=65536):
+        """Initialize a new ContentDecoder."""
+        self._max_size = max_size
+        self._chunk_size = chunk_size
+
+    def open(self, stream, encoding=None):
+        """
+        Return a file like object that reads the decoded body from stream.
+
+        encoding is the Content-Encoding of the body, if any. Reading the
+        returned object raises a ContentDecodeError if the body cannot be
+        decoded.
+        """
+        encoding = (encoding or 'identity').strip().lower()
+        if encoding not in self.ENCODINGS:
+            raise UnsupportedEncodingError("Content-Encoding '%s' is not "
+                                           "supported" % encoding)
+
+        return DecodedStream(stream, encoding != 'identity', self._max_size,
+                             self._chunk_size)
+
+    def decode(self, stream, encoding=None):
+        """Read stream, a file like object, and return the decoded body."""
+        return self.open(stream, encoding).read()
+
+
+class DecodedStream(object):
+    """A file like object returned by ContentDecoder.open."""
+
+    def __init__(self, stream, compressed, max_size, chunk_size):
+        """Initialize a new DecodedStream reading from stream."""
+        self._stream = stream
+        self._max_size = max_size
+        self._chunk_size = chunk_size
+        self._size = 0
+
+        if compressed:
+            # 16 + MAX_WBITS makes zlib expect a gzip header and trailer.
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = None
+
+        # Compressed input that has not been decompressed yet.
+        self._tail = ''
+        self._finished = False
+
+    def read(self, size=-1):
+        """Return up to size bytes of the body, or the rest if size < 0."""
+        if size < 0:
+            return ''.join(iter(lambda: self.read(self._chunk_size), ''))
+
+        if size == 0:
+            return ''
+
+        if self._decompressor is None:
+            # Never read more than one byte past the limit.
+            chunk = self._stream.read(min(size,
+                                          self._max_size - self._size + 1))
+        else:
+            chunk = self._decompress(size)
+
+        self._size += len(chunk)
+        if self._size > self._max_size:
+            raise BodyTooLargeError("Body is larger than %s bytes" %
+                                    self._max_size)
+
+        return chunk
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _decompress(self, size):
+        """Return up to size bytes decompressed from the stream."""
+        try:
+            while True:
+                if self._tail:
+                    data = self._tail
+                elif self._finished:
+                    return ''
+                else:
+                    data = self._stream.read(self._chunk_size)
+                    if not data:
+                        self._finished = True
+                        return self._decompressor.flush()
+
+                # Any input that would produce more than size bytes is
+                # left in unconsumed_tail for the next read.
+                chunk = self._decompressor.decompress(data, size)
+                self._tail = self._decompressor.unconsumed_tail
+                if chunk:
+                    return chunk
+        except zlib.error as error:
+            raise ContentDecodeError("Body could not be decompressed: %s" %
+                                     error)
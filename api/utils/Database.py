@@ -0,0 +1,46 @@
+"""This module holds the database connections shared by the API views."""
+import threading
+
+import MySQLdb
+from django.conf import settings
+
+from api.utils.ConnectionPool import ConnectionPool
+from api.utils.DatabaseConfig import DATABASE_CONFIG
+
+_connection_pool = None
+_connection_pool_config = None
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Return the process wide pool of connections to the summary database.
+
+    A new pool is created if the database configuration has changed since
+    the pool was last requested. Raise DatabaseConfigError if there is no
+    valid database configuration.
+    """
+    global _connection_pool, _connection_pool_config
+
+    config = DATABASE_CONFIG.get()
+
+    with _connection_pool_lock:
+        if _connection_pool_config != config:
+            if _connection_pool is not None:
+                _connection_pool.dispose()
+
+            connect_kwargs = config.connect_kwargs()
+
+            def connect():
+                """Open a new connection to the summary database."""
+                return MySQLdb.connect(**connect_kwargs)
+
+            _connection_pool = ConnectionPool(
+                connect,
+                size=settings.CLOUD_DB_POOL_SIZE,
+                max_overflow=settings.CLOUD_DB_POOL_MAX_OVERFLOW,
+                max_lifetime=settings.CLOUD_DB_POOL_MAX_LIFETIME,
+                timeout=settings.CLOUD_DB_POOL_TIMEOUT)
+            _connection_pool_config = config
+
+        return _connection_pool
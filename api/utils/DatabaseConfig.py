@@ -0,0 +1,215 @@
+"""This module contains the DatabaseConfig and SharedDatabaseConfig classes."""
+import ConfigParser
+import logging
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+
+
+class DatabaseConfigError(Exception):
+    """Raised when the database configuration is missing or invalid."""
+
+    pass
+
+
+class DatabaseConfig(object):
+    """The validated contents of a clouddb.cfg file."""
+
+    def __init__(self, hostname, port, name, username, password):
+        """
+        Initialize a new DatabaseConfig.
+
+        Raise DatabaseConfigError if any of the values are invalid.
+        """
+        for option, value in (('hostname', hostname),
+                              ('name', name),
+                              ('username', username)):
+            if not value:
+                raise DatabaseConfigError("'%s' must be set" % option)
+
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            raise DatabaseConfigError("'port' must be an integer, not %r" %
+                                      port)
+
+        if not 0 < port < 65536:
+            raise DatabaseConfigError("'port' %s is out of range" % port)
+
+        self.hostname = hostname
+        self.port = port
+        self.name = name
+        self.username = username
+        self.password = password
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Return a new DatabaseConfig read from the [db] section of path.
+
+        Raise DatabaseConfigError if path cannot be read or is invalid.
+        """
+        parser = ConfigParser.ConfigParser()
+        try:
+            if not parser.read(path):
+                raise DatabaseConfigError("Could not read %s" % path)
+
+            backend = cls._get_option(parser, 'backend', 'mysql')
+            if backend != 'mysql':
+                raise DatabaseConfigError("Unsupported backend '%s'" %
+                                          backend)
+
+            return cls(cls._get_option(parser, 'hostname'),
+                       cls._get_option(parser, 'port', 3306),
+                       cls._get_option(parser, 'name'),
+                       cls._get_option(parser, 'username'),
+                       cls._get_option(parser, 'password', ''))
+
+        except ConfigParser.Error as error:
+            raise DatabaseConfigError("Error in %s: %s" % (path, error))
+
+    def connect_kwargs(self):
+        """Return the keyword arguments to pass to MySQLdb.connect."""
+        return {'host': self.hostname,
+                'port': self.port,
+                'db': self.name,
+                'user': self.username,
+                'passwd': self.password}
+
+    def __eq__(self, other):
+        """Return True if other describes the same database connection."""
+        return (isinstance(other, DatabaseConfig) and
+                self.connect_kwargs() == other.connect_kwargs())
+
+    def __ne__(self, other):
+        """Return True if other describes a different database connection."""
+        return not self == other
+
+    def __repr__(self):
+        """Return a representation of this config, omitting the password."""
+        return '<DatabaseConfig %s@%s:%s/%s>' % (self.username,
+                                                 self.hostname,
+                                                 self.port,
+                                                 self.name)
+
+    @staticmethod
+    def _get_option(parser, option, default=None):
+        """Return option from the [db] section, or default if not set."""
+        if default is not None and not parser.has_option('db', option):
+            return default
+
+        return parser.get('db', option)
+
+
+class SharedDatabaseConfig(object):
+    """
+    Hold the DatabaseConfig used by every view in this process.
+
+    settings.CLOUD_DB_CONF is read the first time the config is needed.
+    After that it is only re-read if its modification time changes, which
+    is checked at most every settings.CLOUD_DB_CONF_CHECK_INTERVAL seconds,
+    or when a reload is requested (e.g. on SIGHUP).
+
+    If a re-read fails, the last valid config continues to be used.
+    """
+
+    def __init__(self):
+        """Initialize a new, empty, SharedDatabaseConfig."""
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._config = None
+        self._error = None
+        self._path = None
+        self._mtime = None
+        self._last_check = 0
+        self._reload_requested = False
+
+    def get(self):
+        """
+        Return the current DatabaseConfig.
+
+        Raise DatabaseConfigError if no valid config has been loaded.
+        """
+        if self._needs_check():
+            with self._lock:
+                if self._needs_check():
+                    self._check()
+
+        if self._config is None:
+            raise self._error
+
+        return self._config
+
+    def request_reload(self, *args):
+        """
+        Re-read the config file the next time the config is needed.
+
+        Accepts, and ignores, the arguments passed to signal handlers.
+        """
+        self._reload_requested = True
+
+    def install_sighup_handler(self):
+        """Request a reload of the config when SIGHUP is received."""
+        try:
+            signal.signal(signal.SIGHUP, self.request_reload)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread.
+            self.logger.warning("Could not install SIGHUP handler, "
+                                "%s will be reloaded when it changes.",
+                                settings.CLOUD_DB_CONF)
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _needs_check(self):
+        """Return True if the config file should be checked for changes."""
+        return (self._reload_requested or
+                self._path != settings.CLOUD_DB_CONF or
+                time.time() - self._last_check >=
+                settings.CLOUD_DB_CONF_CHECK_INTERVAL)
+
+    def _check(self):
+        """Re-read the config file if it has changed."""
+        path = settings.CLOUD_DB_CONF
+        forced = self._reload_requested or path != self._path
+        self._reload_requested = False
+        self._last_check = time.time()
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+
+        if not forced and mtime == self._mtime:
+            return
+
+        if path != self._path:
+            # A config read from a different file no longer applies.
+            self._config = None
+
+        self._path = path
+        self._mtime = mtime
+
+        try:
+            config = DatabaseConfig.from_file(path)
+        except DatabaseConfigError as error:
+            self._error = error
+            self.logger.error("Invalid database configuration: %s", error)
+            if self._config is not None:
+                self.logger.error("Continuing to use %s", self._config)
+            return
+
+        self.logger.info("Loaded database configuration %s from %s",
+                         config, path)
+        self._config = config
+        self._error = None
+
+
+# The database configuration shared by every view in this process.
+DATABASE_CONFIG = SharedDatabaseConfig()
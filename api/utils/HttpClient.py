@@ -0,0 +1,327 @@
+"""This module contains the HttpClient class."""
+import bisect
+import httplib
+import logging
+import random
+import socket
+import ssl
+import threading
+import time
+import urlparse
+
+from django.conf import settings
+
+
+class HttpError(Exception):
+    """Raised when a request fails, status is the HTTP status if known."""
+
+    def __init__(self, message, status=None):
+        """Initialize a new HttpError."""
+        super(HttpError, self).__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(HttpError):
+    """Raised when an upstream has failed too often to be contacted."""
+
+    pass
+
+
+class HttpClient(object):
+    """
+    A thread safe HTTP client that keeps connections alive between requests.
+
+    Up to 'pool_size' idle connections are kept open to each upstream,
+    a (scheme, host, port) tuple. New connections wait up to
+    'connect_timeout' seconds to connect, and 'read_timeout' seconds for
+    each read of the response.
+
+    Requests that fail to connect, time out or return a 5xx status are
+    retried up to 'retries' times, waiting a random time of up to
+    'backoff' seconds, doubled for each retry, in between.
+
+    After 'failure_threshold' consecutive failed requests an upstream's
+    circuit is opened, and requests to it fail immediately for
+    'reset_timeout' seconds. A single request is then let through, which
+    closes the circuit again if it succeeds.
+    """
+
+    # The upper bounds, in seconds, of the latency histogram buckets.
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                       10)
+
+    # Redirects with these statuses are followed, up to MAX_REDIRECTS times.
+    REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+    MAX_REDIRECTS = 5
+
+    def __init__(self, connect_timeout=5, read_timeout=10, retries=2,
+                 backoff=0.5, pool_size=4, failure_threshold=5,
+                 reset_timeout=30):
+        """Initialize a new HttpClient with no open connections."""
+        self.logger = logging.getLogger(__name__)
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._pool_size = pool_size
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+
+        # _lock guards the state below.
+        self._lock = threading.Lock()
+        # Maps each upstream to a list of its idle connections.
+        self._idle = {}
+        # Maps each upstream to its circuit state and metrics, see _state.
+        self._upstreams = {}
+
+    def get(self, url, headers=None):
+        """Return the body of a GET of url, see request."""
+        return self.request('GET', url, headers=headers)
+
+    def post(self, url, body, headers=None):
+        """Return the body of a POST of body to url, see request."""
+        return self.request('POST', url, body, headers)
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Make a request and return the body of the response.
+
+        Raise HttpError if the request fails or the final response,
+        after following any redirects, does not have a 2xx status.
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            status, response_headers, data = self._request(method, url,
+                                                           body, headers)
+
+            location = response_headers.get('location')
+            if status not in self.REDIRECT_STATUSES or location is None:
+                break
+
+            url = urlparse.urljoin(url, location)
+            if status == 303:
+                method, body = 'GET', None
+
+        if not 200 <= status < 300:
+            raise HttpError('%s %s returned %s' % (method, url, status),
+                            status)
+
+        return data
+
+    def stats(self):
+        """Return a dictionary of the metrics of each upstream URL."""
+        labels = [str(bound) for bound in self.LATENCY_BUCKETS] + ['+Inf']
+
+        with self._lock:
+            stats = {}
+            for upstream, state in self._upstreams.items():
+                stats['%s://%s:%s' % upstream] = {
+                    'requests': state['requests'],
+                    'failures': state['failures'],
+                    'rejected': state['rejected'],
+                    'circuit': ('closed' if state['opened_at'] is None
+                                else 'open'),
+                    'idle': len(self._idle.get(upstream, [])),
+                    'latency': dict(zip(labels, state['latency']))}
+
+            return stats
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _request(self, method, url, body, headers):
+        """Return (status, headers, body) of a request, with retries."""
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise HttpError('Cannot request %s' % url)
+
+        if parts.scheme == 'https':
+            default_port = httplib.HTTPS_PORT
+        else:
+            default_port = httplib.HTTP_PORT
+
+        upstream = (parts.scheme, parts.hostname, parts.port or default_port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        attempt = 0
+        while True:
+            self._allow(upstream)
+
+            start = time.time()
+            try:
+                result = self._send(upstream, method, path, body,
+                                    headers or {})
+            except (socket.error, ssl.CertificateError,
+                    httplib.HTTPException) as error:
+                result = None
+                self.logger.warning('%s %s failed: %s', method, url, error)
+            else:
+                error = None
+                if result[0] >= 500:
+                    self.logger.warning('%s %s returned %s', method, url,
+                                        result[0])
+
+            failed = result is None or result[0] >= 500
+            self._record(upstream, time.time() - start, failed)
+
+            if not failed:
+                return result
+
+            if attempt >= self._retries:
+                if result is None:
+                    raise HttpError('%s %s failed: %s' % (method, url, error))
+                return result
+
+            attempt += 1
+            time.sleep(random.uniform(0, self._backoff * 2 ** (attempt - 1)))
+
+    def _send(self, upstream, method, path, body, headers):
+        """
+        Make a single request over a pooled connection.
+
+        If upstream has closed an idle connection, the request is made
+        again straight away over another connection, as that is not a
+        failure of upstream.
+        """
+        while True:
+            connection, reused = self._checkout(upstream)
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                # The response must be read before the connection is reused.
+                data = response.read()
+            except (httplib.BadStatusLine, socket.error) as error:
+                connection.close()
+                # A timeout may mean upstream is slow, rather than that
+                # the connection was closed, so it is not retried here.
+                if reused and not isinstance(error, socket.timeout):
+                    self.logger.debug('Idle connection to %s was closed: '
+                                      '%s', '%s://%s:%s' % upstream, error)
+                    continue
+                raise
+            except:
+                connection.close()
+                raise
+
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(upstream, connection)
+
+        return response.status, dict(response.getheaders()), data
+
+    def _checkout(self, upstream):
+        """
+        Return a (connection, reused) tuple for a request to upstream.
+
+        connection is an idle connection, when reused is True, or else a
+        new one.
+        """
+        with self._lock:
+            idle = self._idle.get(upstream)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port = upstream
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(
+                host, port, timeout=self._connect_timeout)
+        else:
+            connection = httplib.HTTPConnection(
+                host, port, timeout=self._connect_timeout)
+
+        connection.connect()
+        # The connect timeout has been used, later reads use read_timeout.
+        connection.sock.settimeout(self._read_timeout)
+        return connection, False
+
+    def _checkin(self, upstream, connection):
+        """Return a connection to the pool, or close it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault(upstream, [])
+            if len(idle) < self._pool_size:
+                idle.append(connection)
+                return
+
+        connection.close()
+
+    def _allow(self, upstream):
+        """Raise CircuitOpenError if upstream's circuit is open."""
+        with self._lock:
+            state = self._state(upstream)
+            opened_at = state['opened_at']
+            if opened_at is None:
+                return
+
+            if time.time() - opened_at < self._reset_timeout:
+                state['rejected'] += 1
+                raise CircuitOpenError('Circuit to %s://%s:%s is open' %
+                                       upstream)
+
+            # Let this request through to test the upstream, others are
+            # rejected until it finishes, see _record.
+            state['opened_at'] = time.time()
+
+    def _record(self, upstream, latency, failed):
+        """Record the latency and outcome of a request to upstream."""
+        with self._lock:
+            state = self._state(upstream)
+            state['requests'] += 1
+            state['latency'][bisect.bisect_left(self.LATENCY_BUCKETS,
+                                                latency)] += 1
+
+            if not failed:
+                state['consecutive_failures'] = 0
+                state['opened_at'] = None
+                return
+
+            state['failures'] += 1
+            state['consecutive_failures'] += 1
+            if state['consecutive_failures'] >= self._failure_threshold:
+                if state['opened_at'] is None:
+                    self.logger.error('Opening circuit to %s://%s:%s after '
+                                      '%s failures', upstream[0], upstream[1],
+                                      upstream[2],
+                                      state['consecutive_failures'])
+                state['opened_at'] = time.time()
+
+    def _state(self, upstream):
+        """Return the state of upstream. Must hold self._lock."""
+        if upstream not in self._upstreams:
+            self._upstreams[upstream] = {
+                'requests': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'rejected': 0,
+                'opened_at': None,
+                # One count per LATENCY_BUCKETS, and one for slower requests.
+                'latency': [0] * (len(self.LATENCY_BUCKETS) + 1)}
+
+        return self._upstreams[upstream]
+
+
+# The HttpClient used for every request to the CMDB and IAMs made by this
+# process, so that connections to them are shared.
+HTTP_CLIENT = HttpClient(settings.HTTP_CONNECT_TIMEOUT,
+                         settings.HTTP_READ_TIMEOUT,
+                         settings.HTTP_RETRIES,
+                         settings.HTTP_RETRY_BACKOFF,
+                         settings.HTTP_POOL_SIZE,
+                         settings.HTTP_CIRCUIT_FAILURES,
+                         settings.HTTP_CIRCUIT_RESET_TIMEOUT)
@@ -0,0 +1,87 @@
+"""This module contains the IntrospectionWorker class."""
+import itertools
+import logging
+import threading
+import time
+
+from rest_framework.compat import OrderedDict
+
+
+class IntrospectionWorker(object):
+    """
+    Run token checks in a background thread, rather than in a request.
+
+    Each check is submitted with a key, normally the token being checked.
+    A check submitted while another with the same key is still pending is
+    dropped, so a token used by many requests is only checked once.
+
+    Every 'interval' seconds, up to 'batch_size' pending checks are run,
+    oldest first. The thread is started when the first check is submitted.
+    """
+
+    def __init__(self, interval=5, batch_size=50):
+        """Initialize a new IntrospectionWorker with nothing pending."""
+        self.logger = logging.getLogger(__name__)
+        self._interval = interval
+        self._batch_size = batch_size
+
+        # _lock guards the state below.
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._thread = None
+
+    def submit(self, key, check):
+        """
+        Run check, a callable taking no arguments, in the background.
+
+        Return False if a check with the same key is already pending.
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+
+            self._pending[key] = check
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+        return True
+
+    def run_pending(self):
+        """Run the oldest batch_size pending checks and return how many ran."""
+        with self._lock:
+            # The SortedDict used on Python 2.6 cannot popitem(last=False).
+            keys = list(itertools.islice(self._pending, self._batch_size))
+            batch = [(key, self._pending.pop(key)) for key in keys]
+
+        for key, check in batch:
+            try:
+                check()
+            except Exception:
+                # One failed check should not stop the others.
+                self.logger.exception('Token check failed')
+
+        return len(batch)
+
+    def pending(self):
+        """Return the number of checks waiting to run."""
+        return len(self._pending)
+
+    def clear(self):
+        """Drop all pending checks."""
+        with self._lock:
+            self._pending.clear()
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _run(self):
+        """Run pending checks every self._interval seconds."""
+        while True:
+            time.sleep(self._interval)
+            self.run_pending()
@@ -0,0 +1,136 @@
+"""This module contains the KeyCache class."""
+import logging
+import threading
+import time
+
+
+class KeyCache(object):
+    """
+    Cache the JSON Web Key Sets (JWKS) of token issuers.
+
+    Each issuer's keys are indexed by key ID ('kid'), so finding the key a
+    token names is a dictionary lookup. The keys are fetched again once
+    they are older than 'ttl' seconds, or when a token names a key ID that
+    is not cached, i.e. the issuer may have rotated its keys.
+
+    Keys are never fetched from an issuer more than once every
+    'min_refresh_interval' seconds, so tokens naming made up key IDs
+    cannot be used to flood an issuer with requests. If a fetch fails,
+    the last good copy of the keys continues to be used.
+    """
+
+    def __init__(self, ttl=3600, min_refresh_interval=60):
+        """Initialize a new, empty, KeyCache."""
+        self.logger = logging.getLogger(__name__)
+        self._ttl = ttl
+        self._min_refresh_interval = min_refresh_interval
+
+        # _lock serialises fetches and guards the state below.
+        self._lock = threading.Lock()
+
+        # Maps each issuer to its cached key set, see _parse.
+        self._key_sets = {}
+        # Maps each issuer to when its keys were last requested.
+        self._last_attempts = {}
+
+    def keys(self, issuer, kid, loader):
+        """
+        Return a JWKS of the keys of issuer that could match kid.
+
+        loader is a callable that takes issuer and returns its JWKS as a
+        dictionary, or None if it could not be retrieved. It is only
+        called if the cached keys are missing, stale or do not include
+        kid. If kid is None, or the issuer's keys have no key IDs, all of
+        the issuer's keys are returned.
+
+        Return None if there is no key that could match kid.
+        """
+        key_set = self._key_sets.get(issuer)
+
+        if self._needs_fetch(key_set, kid):
+            with self._lock:
+                # The keys may have been fetched while waiting for the lock.
+                key_set = self._key_sets.get(issuer)
+                if (self._needs_fetch(key_set, kid) and
+                        self._may_fetch(issuer)):
+                    key_set = self._fetch(issuer, loader) or key_set
+
+        if key_set is None:
+            return None
+
+        return self._select(key_set, kid)
+
+    def clear(self):
+        """Forget all cached keys."""
+        with self._lock:
+            self._key_sets = {}
+            self._last_attempts = {}
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _needs_fetch(self, key_set, kid):
+        """Return True if key_set is missing, stale or does not have kid."""
+        if key_set is None:
+            return True
+
+        if time.time() - key_set['fetched_at'] >= self._ttl:
+            return True
+
+        return (kid is not None and
+                bool(key_set['by_kid']) and
+                kid not in key_set['by_kid'])
+
+    def _may_fetch(self, issuer):
+        """Return True if issuer's keys have not been requested recently."""
+        last_attempt = self._last_attempts.get(issuer)
+        return (last_attempt is None or
+                time.time() - last_attempt >= self._min_refresh_interval)
+
+    def _fetch(self, issuer, loader):
+        """
+        Fetch, cache and return the key set of issuer using loader.
+
+        Return None if the keys could not be fetched.
+        """
+        self._last_attempts[issuer] = time.time()
+        self.logger.info('Fetching keys of %s', issuer)
+
+        key_set = self._parse(loader(issuer))
+        if key_set is None:
+            self.logger.error('Could not retrieve keys of %s', issuer)
+            if issuer in self._key_sets:
+                self.logger.info('Continuing to use the last keys retrieved')
+            return None
+
+        self._key_sets[issuer] = key_set
+        return key_set
+
+    def _parse(self, jwks):
+        """Return a key set built from a JWKS, or None if it is invalid."""
+        try:
+            keys = list(jwks['keys'])
+        except (KeyError, TypeError):
+            return None
+
+        if not keys:
+            return None
+
+        by_kid = dict((key['kid'], key) for key in keys
+                      if isinstance(key, dict) and 'kid' in key)
+
+        return {'keys': keys, 'by_kid': by_kid, 'fetched_at': time.time()}
+
+    def _select(self, key_set, kid):
+        """Return a JWKS of the keys in key_set that could match kid."""
+        if kid is None or not key_set['by_kid']:
+            return {'keys': key_set['keys']}
+
+        key = key_set['by_kid'].get(kid)
+        if key is None:
+            return None
+
+        return {'keys': [key]}
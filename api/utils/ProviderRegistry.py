@@ -0,0 +1,121 @@
+"""This module contains the ProviderRegistry class."""
+import logging
+import threading
+import time
+
+
+class ProviderRegistry(object):
+    """
+    Cache the hostnames of registered Resource Providers.
+
+    The hostnames are held in a set so checking a host is an O(1) lookup.
+    A copy younger than 'ttl' seconds is served as is. An older copy is
+    still served, but a refresh is started in a background thread
+    (stale-while-revalidate). If a refresh fails, the last good copy
+    is kept and a new refresh is not attempted for 'retry_interval'
+    seconds.
+
+    Only while no copy has ever been loaded do callers have to wait
+    for the provider list to be fetched.
+    """
+
+    def __init__(self, ttl=300, retry_interval=60):
+        """Initialize a new, empty, ProviderRegistry."""
+        self.logger = logging.getLogger(__name__)
+        self._ttl = ttl
+        self._retry_interval = retry_interval
+
+        # _lock guards the state below, _load_lock serialises the
+        # blocking load made when there is no copy to serve.
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        self._hostnames = None
+        self._loaded_at = None
+        self._last_attempt = None
+        self._refreshing = False
+
+    def hostnames(self, loader):
+        """
+        Return a frozenset of registered provider hostnames.
+
+        loader is a callable returning an iterable of hostnames. It is only
+        called if the cached copy is missing or stale. An empty result from
+        loader is treated as a failure to retrieve the provider list.
+        """
+        if self._hostnames is None:
+            return self._load(loader)
+
+        now = time.time()
+        with self._lock:
+            start_refresh = (now - self._loaded_at >= self._ttl and
+                             not self._refreshing and
+                             self._may_retry(now))
+            if start_refresh:
+                self._refreshing = True
+                self._last_attempt = now
+
+        if start_refresh:
+            # Serve the stale copy while it is refreshed in the background.
+            refresh_thread = threading.Thread(target=self._refresh,
+                                              args=(loader,))
+            refresh_thread.daemon = True
+            refresh_thread.start()
+
+        return self._hostnames
+
+    def refresh(self, loader):
+        """Synchronously refresh the cached hostnames using loader."""
+        with self._lock:
+            self._refreshing = True
+            self._last_attempt = time.time()
+
+        self._refresh(loader)
+
+    def clear(self):
+        """Forget any cached hostnames."""
+        with self._lock:
+            self._hostnames = None
+            self._loaded_at = None
+            self._last_attempt = None
+            self._refreshing = False
+
+    def _load(self, loader):
+        """Block until a first copy of the hostnames has been loaded."""
+        with self._load_lock:
+            # Another caller may have loaded a copy while we waited.
+            if self._hostnames is None and self._may_retry(time.time()):
+                self.refresh(loader)
+
+        return self._hostnames or frozenset()
+
+    def _may_retry(self, now):
+        """Return True if enough time has passed since the last attempt."""
+        return (self._last_attempt is None or
+                now - self._last_attempt >= self._retry_interval)
+
+    def _refresh(self, loader):
+        """Call loader and, if it succeeds, replace the cached hostnames."""
+        try:
+            new_hostnames = frozenset(loader())
+        except Exception as error:
+            # loader is expected to handle its own errors, but a background
+            # refresh must never leave the registry marked as refreshing.
+            self.logger.error("Provider list refresh failed: %s: %s",
+                              type(error), error)
+            new_hostnames = frozenset()
+
+        with self._lock:
+            self._refreshing = False
+
+            if not new_hostnames:
+                if self._hostnames is not None:
+                    self.logger.warning("Could not refresh provider list, "
+                                        "using last good copy.")
+                return
+
+            self._hostnames = new_hostnames
+            self._loaded_at = time.time()
+
+        self.logger.info("Provider list refreshed, %s hostnames found.",
+                         len(new_hostnames))
@@ -0,0 +1,276 @@
+"""This module contains the QueueWriter class."""
+import codecs
+import errno
+import os
+import random
+import shutil
+import threading
+import time
+
+from django.conf import settings
+# These private dirq helpers are why dirq is pinned in requirements.txt.
+# Check they still behave the same before changing the pinned version.
+from dirq.QueueBase import _file_create, _file_write, _name, _special_mkdir
+from dirq.queue import TEMPORARY_DIRECTORY, Queue, QueueError, _subdirs_num
+
+# The schema of messages saved to the incoming queue, taken from ssm2.
+QSCHEMA = {'body': 'string',
+           'signer': 'string',
+           'empaid': 'string?'}
+
+
+class MessageEncodingError(Exception):
+    """Raised when a field of a message is not valid UTF-8."""
+
+
+class QueueWriter(object):
+    """
+    A thread safe writer that adds messages to a dirq Queue.
+
+    add_stream() copies the body of a message to disk a chunk at a time,
+    so the whole body is never held in memory.
+
+    Normally, like dirq, every message is added to the newest intermediate
+    directory of the queue. If 'shards' is more than one, each message is
+    instead added to one of 'shards' intermediate directories at random,
+    so that many processes adding at once do not all contend for the same
+    directory. Readers of the queue see the messages as usual.
+
+    Like dirq, fields are written UTF-8 encoded. Byte string fields must
+    already be valid UTF-8, as dirq cannot read any other bytes back.
+    """
+
+    def __init__(self, path, schema, shards=1, chunk_size=65536,
+                 maxelts=16000):
+        """
+        Initialize a new QueueWriter for the Queue at path.
+
+        maxelts is the most elements an intermediate directory holds, as
+        for a dirq Queue.
+        """
+        self._queue = Queue(path, schema=schema, maxelts=maxelts)
+        self._shards = shards
+        self._chunk_size = chunk_size
+
+        # _lock guards the state below.
+        self._lock = threading.Lock()
+        # Maps each shard to the number of the intermediate directory it
+        # adds to. Shard n uses directories whose numbers are n modulo
+        # self._shards, moving to the next when one is full.
+        self._directories = {}
+
+        # Metrics
+        self._adds = 0
+        self._failures = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    @property
+    def path(self):
+        """Return the path of the queue."""
+        return self._queue.path
+
+    def add(self, data):
+        """Add a message, a dictionary of strings, and return its name."""
+        return self.add_stream(None, None, data)
+
+    def add_stream(self, stream_field, stream, data):
+        """
+        Add a message and return its name.
+
+        The stream_field of the message is read from stream, a file like
+        object, and the other fields are taken from data. If reading stream
+        raises an exception, no message is added and it is re-raised.
+
+        Raise MessageEncodingError if a byte string field, or the bytes
+        read from stream, are not valid UTF-8.
+        """
+        start = time.time()
+        try:
+            name = self._add(stream_field, stream, data)
+        except:
+            self._record(time.time() - start, failed=True)
+            raise
+
+        self._record(time.time() - start, failed=False)
+        return name
+
+    def stats(self):
+        """Return a dictionary describing the messages added and latency."""
+        with self._lock:
+            if self._adds:
+                average_latency = self._total_latency / self._adds
+            else:
+                average_latency = 0.0
+
+            return {'shards': self._shards,
+                    'adds': self._adds,
+                    'failures': self._failures,
+                    'average_latency': average_latency,
+                    'max_latency': self._max_latency}
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _add(self, stream_field, stream, data):
+        """Add a message to the queue and return its name."""
+        queue = self._queue
+
+        fields = data.keys()
+        if stream_field is not None:
+            fields.append(stream_field)
+
+        for field in fields:
+            if queue.type.get(field) != 'string':
+                raise QueueError("unexpected data: %s" % field)
+
+        for field in queue.mandatory:
+            if field not in fields:
+                raise QueueError("missing mandatory data: %s" % field)
+
+        # These are the steps taken by Queue.add, except the stream is
+        # copied to its file rather than written all at once. The element
+        # is built in a temporary directory, so it is not seen by other
+        # processes until it is renamed into the queue.
+        while True:
+            temp = '%s/%s/%s' % (queue.path, TEMPORARY_DIRECTORY,
+                                 _name(queue.rndhex))
+            if _special_mkdir(temp, queue.umask):
+                break
+
+        try:
+            for field, value in data.items():
+                # dirq writes through a UTF-8 codec, which only accepts
+                # unicode or ASCII byte strings.
+                if not isinstance(value, unicode):
+                    value = self._decode(value, field)
+                _file_write('%s/%s' % (temp, field), 1, queue.umask, value)
+
+            if stream_field is not None:
+                self._copy(stream, '%s/%s' % (temp, stream_field))
+
+            return self._rename(temp)
+        except:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+
+    def _copy(self, stream, path):
+        """
+        Copy stream to a new file at path, a chunk at a time.
+
+        The file is UTF-8 encoded, as if written by dirq. Byte strings read
+        from stream are checked, but written unchanged.
+        """
+        field = os.path.basename(path)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        element_file = _file_create(path, umask=self._queue.umask)
+        try:
+            while True:
+                chunk = stream.read(self._chunk_size)
+                if not chunk:
+                    break
+
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode('utf-8')
+                else:
+                    self._decode(chunk, field, decoder)
+                element_file.write(chunk)
+
+            # Any incomplete character left at the end is also an error.
+            self._decode('', field, decoder, final=True)
+        finally:
+            element_file.close()
+
+    def _decode(self, data, field, decoder=None, final=False):
+        """
+        Return data, a UTF-8 byte string from field, as unicode.
+
+        If given, decoder is an incremental UTF-8 decoder, so data can be
+        one of several chunks, the last of which is passed with final set.
+        Raise MessageEncodingError if data is not valid UTF-8.
+        """
+        try:
+            if decoder is None:
+                return data.decode('utf-8')
+
+            return decoder.decode(data, final)
+        except UnicodeDecodeError as error:
+            raise MessageEncodingError("%s is not valid UTF-8: %s" %
+                                       (field, error))
+
+    def _rename(self, temp):
+        """Move the element at temp into the queue and return its name."""
+        while True:
+            name = '%s/%s' % (self._insertion_directory(),
+                              _name(self._queue.rndhex))
+            try:
+                os.rename(temp, '%s/%s' % (self._queue.path, name))
+                return name
+            except OSError as error:
+                # Another element may already have taken the name.
+                if error.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                    continue
+
+                # The directory may have been purged since it was chosen,
+                # but the element itself may have been purged too, e.g. if
+                # it took longer than the queue's maxtemp to write.
+                if error.errno == errno.ENOENT and os.path.isdir(temp):
+                    continue
+
+                raise
+
+    def _insertion_directory(self):
+        """Return the name of the intermediate directory to add to."""
+        if self._shards == 1:
+            return self._queue._insertion_directory()
+
+        shard = random.randrange(self._shards)
+        with self._lock:
+            number = self._directories.get(shard, shard)
+            # Like dirq, directories hold at most maxelts elements.
+            while (_subdirs_num('%s/%08x' % (self._queue.path, number)) >=
+                   self._queue.maxelts):
+                number += self._shards
+            self._directories[shard] = number
+
+        name = '%08x' % number
+        _special_mkdir('%s/%s' % (self._queue.path, name), self._queue.umask)
+        return name
+
+    def _record(self, latency, failed):
+        """Record the latency and outcome of adding a message."""
+        with self._lock:
+            if failed:
+                self._failures += 1
+                return
+
+            self._adds += 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+
+_queue_writer = None
+_queue_writer_key = None
+_queue_writer_lock = threading.Lock()
+
+
+def get_queue_writer():
+    """
+    Return the process wide QueueWriter for the incoming queue.
+
+    A new QueueWriter is created if settings.QPATH or settings.QUEUE_SHARDS
+    has changed since it was last requested.
+    """
+    global _queue_writer, _queue_writer_key
+
+    key = (os.path.join(settings.QPATH, 'incoming'), settings.QUEUE_SHARDS)
+
+    with _queue_writer_lock:
+        if _queue_writer_key != key:
+            _queue_writer = QueueWriter(key[0], QSCHEMA, shards=key[1])
+            _queue_writer_key = key
+
+        return _queue_writer
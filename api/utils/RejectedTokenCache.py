@@ -0,0 +1,98 @@
+"""This module contains the RejectedTokenCache class."""
+import hashlib
+import threading
+import time
+
+from rest_framework.compat import OrderedDict
+
+
+class RejectedTokenCache(object):
+    """
+    Remember, briefly, which tokens have been rejected and why.
+
+    A client retrying a bad token would otherwise have it decoded, and
+    possibly the keys of its issuer fetched, on every request. Instead,
+    a rejected token is rejected again from this cache for 'ttl' seconds.
+
+    At most 'max_entries' tokens are held, keyed by a hash of the token.
+    When full, the least recently used token is forgotten. The cache is
+    held in memory, so is per process.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        """Initialize a new, empty, RejectedTokenCache."""
+        self._max_entries = max_entries
+        self._ttl = ttl
+
+        # _lock guards the state below.
+        self._lock = threading.Lock()
+        # Maps each token hash to (reason, expiry), least recently used
+        # first.
+        self._entries = OrderedDict()
+        # Maps each reason to how many tokens have been rejected for it,
+        # and how many of those rejections came from this cache.
+        self._counts = {}
+
+    def get(self, token):
+        """Return the reason token was rejected, or None."""
+        key = self._key(token)
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            reason, expires = entry
+            if expires <= time.time():
+                return None
+
+            # Re-insert the entry, so that it is the most recently used.
+            self._entries[key] = entry
+            self._count(reason, 'hits')
+
+        return reason
+
+    def reject(self, token, reason):
+        """Remember token was rejected for reason."""
+        key = self._key(token)
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (reason, time.time() + self._ttl)
+            self._count(reason, 'rejected')
+
+            while len(self._entries) > self._max_entries:
+                # The SortedDict used on Python 2.6 cannot
+                # popitem(last=False).
+                del self._entries[next(iter(self._entries))]
+
+    def stats(self):
+        """Return the rejected and hits counts of each reason."""
+        with self._lock:
+            return dict((reason, dict(counts))
+                        for reason, counts in self._counts.items())
+
+    def __len__(self):
+        """Return the number of tokens held, including any expired."""
+        return len(self._entries)
+
+    def clear(self):
+        """Forget every rejected token and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._counts = {}
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _count(self, reason, counter):
+        """Add one to a counter of reason. Must hold self._lock."""
+        counts = self._counts.setdefault(reason, {'rejected': 0, 'hits': 0})
+        counts[counter] += 1
+
+    def _key(self, token):
+        """Return the key token is held under."""
+        return hashlib.sha256(token).hexdigest()
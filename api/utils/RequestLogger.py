@@ -0,0 +1,148 @@
+"""This module contains RequestLogger, RequestLog and RequestLoggingMixin."""
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+
+
+class RequestLogger(object):
+    """
+    Log a sample of requests, one structured record per request.
+
+    A fraction, 'sample_rate', of requests are logged, so the cost of
+    logging is proportional to it rather than to the number of requests.
+    Each record holds the request line, headers, the first 'body_bytes'
+    bytes of the body and the response status, as a line of JSON.
+
+    The values of the 'redacted_headers', given as request.META keys,
+    are never logged.
+    """
+
+    # The request.META keys, other than HTTP headers, that are logged.
+    META_KEYS = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'REMOTE_ADDR',
+                 'SSL_CLIENT_S_DN')
+
+    def __init__(self, sample_rate=0.0, body_bytes=256,
+                 redacted_headers=('HTTP_AUTHORIZATION',)):
+        """Initialize a new RequestLogger."""
+        self.logger = logging.getLogger(__name__)
+        self._sample_rate = sample_rate
+        self._body_bytes = body_bytes
+        self._redacted_headers = frozenset(redacted_headers)
+
+    def start(self, request):
+        """Return a RequestLog for request if it is sampled, or None."""
+        if not self._sample_rate or random.random() >= self._sample_rate:
+            return None
+
+        return RequestLog(self, request)
+
+    def log(self, record):
+        """Log a record, a dictionary, as a line of JSON."""
+        self.logger.info('%s', json.dumps(record, sort_keys=True))
+
+    def headers(self, request):
+        """Return a dictionary of the headers of request, redacted."""
+        headers = {}
+        for key, value in request.META.items():
+            if not key.startswith('HTTP_') and key not in self.META_KEYS:
+                continue
+
+            if key in self._redacted_headers:
+                value = '[redacted]'
+
+            headers[key] = value
+
+        return headers
+
+    def body_bytes(self):
+        """Return how many bytes of each request body are logged."""
+        return self._body_bytes
+
+
+class RequestLog(object):
+    """The log record of a sampled request, see RequestLogger.start."""
+
+    def __init__(self, request_logger, request):
+        """Initialize a new RequestLog for request."""
+        self._request_logger = request_logger
+        self._start = time.time()
+        self._record = {'method': request.method,
+                        'path': request.path,
+                        'query': request.META.get('QUERY_STRING', ''),
+                        'headers': request_logger.headers(request)}
+        # The start of the body, only set if the body is read.
+        self._body = None
+        self._body_size = 0
+
+    def wrap(self, stream):
+        """Return a file like object that reads stream, logging its start."""
+        self._body = ''
+        return _BodyRecorder(stream, self)
+
+    def add_body(self, data):
+        """Add data, read from the request body, to the record."""
+        self._body_size += len(data)
+
+        remaining = self._request_logger.body_bytes() - len(self._body)
+        if remaining > 0:
+            self._body += data[:remaining]
+
+    def finish(self, status, **fields):
+        """Log the record, with the response status and any other fields."""
+        self._record.update(fields)
+        self._record['status'] = status
+        self._record['duration'] = round(time.time() - self._start, 6)
+
+        if self._body is not None:
+            self._record['body'] = self._body.decode('utf-8', 'replace')
+            self._record['body_size'] = self._body_size
+
+        self._request_logger.log(self._record)
+
+
+class _BodyRecorder(object):
+    """A file like object that passes what it reads to a RequestLog."""
+
+    def __init__(self, stream, request_log):
+        """Initialize a new _BodyRecorder reading stream."""
+        self._stream = stream
+        self._request_log = request_log
+
+    def read(self, size=-1):
+        """Read from the stream, as file.read."""
+        data = self._stream.read(size)
+        self._request_log.add_body(data)
+        return data
+
+
+class RequestLoggingMixin(object):
+    """
+    Log a sample of the requests to an APIView, using REQUEST_LOGGER.
+
+    While a sampled request is handled, request_log is its RequestLog,
+    otherwise it is None.
+    """
+
+    request_log = None
+
+    def initial(self, request, *args, **kwargs):
+        """Start logging request, if it has been sampled."""
+        self.request_log = REQUEST_LOGGER.start(request)
+        super(RequestLoggingMixin, self).initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Finish logging request, if it has been sampled."""
+        if self.request_log is not None:
+            self.request_log.finish(response.status_code)
+
+        return super(RequestLoggingMixin, self).finalize_response(
+            request, response, *args, **kwargs)
+
+
+# The RequestLogger used by every view in this process.
+REQUEST_LOGGER = RequestLogger(settings.REQUEST_LOG_SAMPLE_RATE,
+                               settings.REQUEST_LOG_BODY_BYTES,
+                               settings.REQUEST_LOG_REDACTED_HEADERS)
@@ -0,0 +1,179 @@
+"""This module contains the ResponseCache class."""
+import hashlib
+import json
+import threading
+import time
+
+from django.utils.http import quote_etag
+
+from django.conf import settings
+from django.core.cache import get_cache
+from rest_framework.compat import OrderedDict
+
+
+class ResponseCache(object):
+    """
+    Cache the data of summary responses until the summaries change.
+
+    Entries are held in the Django cache 'cache_alias' from
+    settings.CACHES, keyed by the request's URL and query parameters,
+    settings.RETURN_HEADERS and the summary generation. The generation is
+    read from the LastUpdated table, which changes whenever SummariseVMs
+    finishes or a summary is loaded, so entries for older generations are
+    never looked up again and expire after 'ttl' seconds.
+
+    Each process re-reads the generation at most every 'generation_ttl'
+    seconds, so a repeated request usually costs a single cache lookup,
+    but may be answered from the previous generation for that long.
+
+    etag() and last_modified() describe the response to a request in a
+    generation, so that clients can make conditional requests.
+    """
+
+    # Every row is read, rather than the latest time, as SummariseVMs
+    # records the time it started, which may be before another update.
+    GENERATION_QUERY = 'select Type, UpdateTime from LastUpdated order by Type'
+
+    def __init__(self, cache_alias='default', ttl=3600, generation_ttl=10):
+        """Initialize a new ResponseCache using the given Django cache."""
+        self._cache_alias = cache_alias
+        self._ttl = ttl
+        self._generation_ttl = generation_ttl
+        self._cache = None
+
+        # _lock guards the state below, which is per process.
+        self._lock = threading.Lock()
+        self._generation = None
+        self._generation_read_at = None
+        self._last_modified = None
+        self._hits = 0
+        self._misses = 0
+
+    def generation(self, pool):
+        """
+        Return the current summary generation, as a string.
+
+        The generation is read using a connection from pool, a
+        ConnectionPool, unless it was read in the last generation_ttl
+        seconds.
+        """
+        with self._lock:
+            if (self._generation_read_at is not None and
+                    time.time() - self._generation_read_at <
+                    self._generation_ttl):
+                return self._generation
+
+        with pool.connection() as database:
+            cursor = database.cursor()
+            cursor.execute(self.GENERATION_QUERY)
+            rows = cursor.fetchall()
+            cursor.close()
+
+        # UpdateTime is a TIMESTAMP, returned in the local time zone.
+        update_times = [time.mktime(updated.timetuple())
+                        for _, updated in rows if updated is not None]
+
+        with self._lock:
+            self._generation = ','.join('%s=%s' % row for row in rows)
+            self._generation_read_at = time.time()
+            self._last_modified = max(update_times) if update_times else None
+            return self._generation
+
+    def last_modified(self, pool):
+        """
+        Return when the summaries last changed, in seconds since the epoch.
+
+        Return None if that is not known. The time is read along with the
+        generation, see generation().
+        """
+        self.generation(pool)
+        with self._lock:
+            return self._last_modified
+
+    def etag(self, request, generation):
+        """Return the quoted ETag of the response to request in generation."""
+        return quote_etag(self._digest(request, generation))
+
+    def get(self, request, generation):
+        """Return the cached data for request and generation, or None."""
+        data = self._get_cache().get(self._key(request, generation))
+
+        with self._lock:
+            if data is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+
+        return data
+
+    def set(self, request, generation, data):
+        """Cache data as the response data for request and generation."""
+        self._get_cache().set(self._key(request, generation),
+                              self._ordered(data), self._ttl)
+
+    def stats(self):
+        """Return a dictionary of this process' cache hits and misses."""
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'generation': self._generation}
+
+    def clear(self):
+        """Forget every cached response, the generation and the counters."""
+        self._get_cache().clear()
+        with self._lock:
+            self._generation = None
+            self._generation_read_at = None
+            self._last_modified = None
+            self._hits = 0
+            self._misses = 0
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _get_cache(self):
+        """Return the Django cache, which is only created when first used."""
+        if self._cache is None:
+            self._cache = get_cache(self._cache_alias)
+
+        return self._cache
+
+    def _ordered(self, data):
+        """
+        Return a copy of data with each dictionary in it as an OrderedDict.
+
+        The serializer's ReturnDict, like a dict, is pickled without its
+        order, so a cached response would be rendered with its keys in a
+        different order to the response it was cached from.
+        """
+        if isinstance(data, dict):
+            return OrderedDict((key, self._ordered(value))
+                               for key, value in data.items())
+
+        if isinstance(data, (list, tuple)):
+            return [self._ordered(item) for item in data]
+
+        return data
+
+    def _key(self, request, generation):
+        """Return the cache key of the response to request in generation."""
+        return 'response-%s' % self._digest(request, generation)
+
+    def _digest(self, request, generation):
+        """Return a hash identifying the response to request in generation."""
+        # The order of the query parameters does not change the response,
+        # but the host does, as it is used in links to other pages.
+        normalized = json.dumps([request.build_absolute_uri(request.path),
+                                 sorted(request.GET.lists()),
+                                 list(settings.RETURN_HEADERS),
+                                 generation])
+        return hashlib.sha256(normalized).hexdigest()
+
+
+# The ResponseCache used by every summary view in this process.
+RESPONSE_CACHE = ResponseCache(settings.RESPONSE_CACHE_ALIAS,
+                               settings.RESPONSE_CACHE_TTL,
+                               settings.RESPONSE_CACHE_GENERATION_TTL)
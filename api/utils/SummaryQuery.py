@@ -0,0 +1,386 @@
+"""This module contains the SummaryQuery class."""
+import logging
+from operator import itemgetter
+
+import MySQLdb.cursors
+
+
+class SummaryQuery(object):
+    """
+    A query over the Cloud Accounting Summaries.
+
+    The query is not run when the SummaryQuery is created. Instead, slicing
+    a SummaryQuery runs it with a LIMIT, so only the requested rows are
+    fetched, and count() runs a separate 'select count(*)'. This means a
+    SummaryQuery can be passed to a django Paginator in place of a list.
+
+    seek() fetches the rows either side of a given ORDER_BY key. Each
+    table has an index in ORDER_BY order for each filter, see
+    schemas/10-cloud.sql. With no filter, or one value for a filter, a
+    page is read from that index starting at the key, so its cost does
+    not depend on how deep into the results it is. With several values
+    for a filter, MySQL still sorts the matching rows.
+
+    stream() iterates over all matching rows using an unbuffered,
+    server side, cursor, so they are never all held in memory at once.
+
+    aggregate() sums the matching rows in MySQL, grouped by some of
+    DIMENSIONS, and returns just the totals.
+
+    Only the requested columns are selected, and each summary is built
+    directly from the row tuple returned by MySQL.
+
+    Monthly and yearly summaries are read from rollups of TABLE, see
+    TABLES, so a query over a long period reads far fewer rows.
+    """
+
+    # A copy of VCloudSummaries, refreshed by SummariseVMs, that is
+    # indexed for each of the filters the summary view supports.
+    TABLE = 'MaterialisedCloudSummaries'
+
+    # The table summaries of each granularity are read from. The coarser
+    # tables are rollups of TABLE, maintained by SummariseVMs.
+    TABLES = {'day': TABLE,
+              'month': 'CloudMonthlySummaries',
+              'year': 'CloudYearlySummaries'}
+
+    # The columns of TABLE that are rolled up at each granularity, and so
+    # are null in summaries of that granularity.
+    ROLLED_UP = {'day': (),
+                 'month': ('Day',),
+                 'year': ('Day', 'Month')}
+
+    # The columns of TABLE that can be returned.
+    COLUMNS = ('UpdateTime', 'SiteName', 'CloudComputeService', 'Day',
+               'Month', 'Year', 'GlobalUserName', 'VO', 'VOGroup', 'VORole',
+               'Status', 'CloudType', 'ImageId', 'EarliestStartTime',
+               'LatestStartTime', 'WallDuration', 'CpuDuration', 'CpuCount',
+               'NetworkInbound', 'NetworkOutbound', 'PublicIPCount', 'Memory',
+               'Disk', 'BenchmarkType', 'Benchmark', 'NumberOfVMs')
+
+    # The columns of TABLE that summaries can be grouped by.
+    DIMENSIONS = ('SiteName', 'CloudComputeService', 'Day', 'Month', 'Year',
+                  'GlobalUserName', 'VO', 'VOGroup', 'VORole', 'Status',
+                  'CloudType', 'ImageId', 'BenchmarkType')
+
+    # The columns of TABLE that can be summed.
+    METRICS = ('WallDuration', 'CpuDuration', 'CpuCount', 'NetworkInbound',
+               'NetworkOutbound', 'PublicIPCount', 'Memory', 'Disk',
+               'NumberOfVMs')
+
+    # Summaries are returned in this order, which uniquely identifies
+    # a summary, so that pages neither overlap nor skip rows.
+    ORDER_BY = ('Year', 'Month', 'Day', 'SiteName', 'GlobalUserName', 'VO',
+                'VOGroup', 'VORole', 'Status', 'CloudType', 'ImageId')
+
+    # The ORDER_BY columns that are integers, and those that can be null.
+    # The others are strings.
+    INTEGER_COLUMNS = ('Year', 'Month', 'Day')
+    NULLABLE_COLUMNS = ('Status', 'CloudType', 'ImageId')
+
+    def __init__(self, database, conditions, params, columns=None,
+                 granularity='day'):
+        """
+        Initialize a new SummaryQuery.
+
+        conditions is a list of SQL conditions, that are combined with
+        'and', using params as their parameters. columns lists the
+        columns each summary will contain and defaults to COLUMNS.
+        granularity is one of the keys of TABLES.
+
+        Raise ValueError if columns is not valid, see check_columns, or
+        if granularity is not known.
+        """
+        self.logger = logging.getLogger(__name__)
+        if granularity not in self.TABLES:
+            raise ValueError("Unknown summary granularity: %s" % granularity)
+
+        if columns is None:
+            columns = self.COLUMNS
+
+        self.check_columns(columns)
+
+        self._database = database
+        self._conditions = conditions
+        self._params = params
+        self._table = self.TABLES[granularity]
+        self._rolled_up = self.ROLLED_UP[granularity]
+        self._order_by = self.key_columns(granularity)
+        self._columns = tuple(columns)
+        # seek() also needs the key of each row, so any key columns
+        # that are not being returned are selected after them.
+        self._seek_columns = self._columns + tuple(
+            column for column in self._order_by
+            if column not in self._columns)
+        self._get_key = itemgetter(*[self._seek_columns.index(column)
+                                     for column in self._order_by])
+        self._count = None
+
+    @classmethod
+    def check_columns(cls, columns):
+        """
+        Raise ValueError if columns cannot be returned by a SummaryQuery.
+
+        That is, if columns is empty, repeats a column or contains a column
+        that is not in COLUMNS.
+        """
+        if not columns:
+            raise ValueError("No summary columns requested")
+
+        unknown = [column for column in columns if column not in cls.COLUMNS]
+        if unknown:
+            raise ValueError("Unknown summary columns: %s" %
+                             ', '.join(unknown))
+
+        if len(set(columns)) != len(columns):
+            raise ValueError("Summary columns are repeated: %s" %
+                             ', '.join(columns))
+
+    @classmethod
+    def check_key(cls, key, granularity='day'):
+        """
+        Raise ValueError if key is not a key of summaries of granularity.
+
+        That is, if key does not have a value for each of their key
+        columns, see key_columns, of that column's type.
+        """
+        columns = cls.key_columns(granularity)
+        if len(key) != len(columns):
+            raise ValueError("Key has %s values, not %s" %
+                             (len(key), len(columns)))
+
+        for column, value in zip(columns, key):
+            if value is None:
+                valid = column in cls.NULLABLE_COLUMNS
+            elif column in cls.INTEGER_COLUMNS:
+                # bool is a subclass of int, but is not a valid key.
+                valid = (isinstance(value, (int, long)) and
+                         not isinstance(value, bool))
+            else:
+                valid = isinstance(value, basestring)
+
+            if not valid:
+                raise ValueError("Key value for %s is not valid: %r" %
+                                 (column, value))
+
+    @classmethod
+    def key_columns(cls, granularity='day'):
+        """Return the ORDER_BY columns of summaries of granularity."""
+        return tuple(column for column in cls.ORDER_BY
+                     if column not in cls.ROLLED_UP[granularity])
+
+    def count(self):
+        """Return the number of summaries matching this query."""
+        if self._count is None:
+            cursor = self._database.cursor()
+            cursor.execute('select count(*) from %s%s' % (self._table,
+                                                         self._where()),
+                           self._params)
+            (self._count,) = cursor.fetchone()
+            cursor.close()
+
+        return self._count
+
+    def __len__(self):
+        """Return the number of summaries matching this query."""
+        return self.count()
+
+    def __getitem__(self, key):
+        """Return a list of summaries for a slice, or a single summary."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.count())
+            if step != 1:
+                raise ValueError("SummaryQuery slices do not support a step")
+            if stop <= start:
+                return []
+
+            return self._fetch(start, stop - start)
+
+        if key < 0:
+            key += self.count()
+
+        rows = self._fetch(key, 1)
+        if not rows:
+            raise IndexError("SummaryQuery index out of range")
+
+        return rows[0]
+
+    def seek(self, limit, after=None, before=None):
+        """
+        Return up to limit (key, summary) tuples, in ORDER_BY order.
+
+        If after is given, only summaries whose key comes after it are
+        returned. If before is given, the last limit summaries before it
+        are returned. A key is a tuple of the values of key_columns().
+        """
+        conditions = list(self._conditions)
+        params = list(self._params)
+        descending = before is not None
+
+        if after is not None:
+            condition, condition_params = self._key_condition('>', after)
+            conditions.append(condition)
+            params.extend(condition_params)
+
+        if before is not None:
+            condition, condition_params = self._key_condition('<', before)
+            conditions.append(condition)
+            params.extend(condition_params)
+
+        if descending:
+            order_by = ', '.join('%s desc' % column
+                                 for column in self._order_by)
+        else:
+            order_by = ', '.join(self._order_by)
+
+        cursor = self._database.cursor()
+        cursor.execute('select %s from %s%s order by %s limit %%s' %
+                       (self._expressions(self._seek_columns), self._table,
+                        self._where(conditions), order_by),
+                       params + [limit])
+
+        rows = [(self._get_key(row), self._build(row))
+                for row in cursor.fetchall()]
+        cursor.close()
+
+        if descending:
+            rows.reverse()
+
+        return rows
+
+    def stream(self, chunk_size=1000):
+        """
+        Run the query and return an iterator over all matching summaries.
+
+        The query is run before this method returns. The database
+        connection cannot be used for anything else until the iterator
+        has been exhausted or closed.
+        """
+        cursor = self._database.cursor(MySQLdb.cursors.SSCursor)
+        cursor.execute(self._select(), self._params)
+        return self._iterate(cursor, chunk_size)
+
+    def aggregate(self, group_by, metrics, limit=None):
+        """
+        Return a list of the totals of metrics for each group_by group.
+
+        Each total is a dictionary of the group_by columns and the sum of
+        each of the metrics columns over the matching summaries, ordered
+        by group_by. If limit is given, at most limit totals are returned.
+
+        Raise ValueError if metrics is empty, or if group_by or metrics
+        contains a column not in DIMENSIONS or METRICS respectively. A
+        column that is rolled up at this query's granularity cannot be in
+        group_by.
+        """
+        if not metrics:
+            raise ValueError("No metrics requested")
+
+        unknown = ([column for column in group_by
+                    if column not in self.DIMENSIONS or
+                    column in self._rolled_up] +
+                   [column for column in metrics
+                    if column not in self.METRICS])
+        if unknown:
+            raise ValueError("Cannot aggregate columns: %s" %
+                             ', '.join(unknown))
+
+        columns = list(group_by) + ['sum(%s)' % column for column in metrics]
+        statement = 'select %s from %s%s' % (', '.join(columns), self._table,
+                                             self._where())
+        if group_by:
+            statement += ' group by %s order by %s' % (', '.join(group_by),
+                                                       ', '.join(group_by))
+
+        params = list(self._params)
+        if limit is not None:
+            statement += ' limit %s'
+            params.append(limit)
+
+        cursor = self._database.cursor()
+        cursor.execute(statement, params)
+
+        totals = []
+        for row in cursor.fetchall():
+            total = dict(zip(group_by, row))
+            for column, value in zip(metrics, row[len(group_by):]):
+                # MySQL returns sums as Decimals, the metrics are integers.
+                total[column] = None if value is None else int(value)
+            totals.append(total)
+
+        cursor.close()
+        return totals
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _where(self, conditions=None):
+        """Return a where clause for conditions, or this query if None."""
+        if conditions is None:
+            conditions = self._conditions
+
+        if not conditions:
+            return ''
+
+        return ' where ' + ' and '.join(conditions)
+
+    def _key_condition(self, operator, key):
+        """
+        Return a condition, and its params, comparing the key columns to key.
+
+        The comparison is written out column by column, rather than as a
+        row constructor, as MySQL 5.6 can only turn the former into a
+        range over the ORDER_BY indexes of the table.
+        """
+        condition = '%s %s %%s' % (self._order_by[-1], operator)
+        params = [key[-1]]
+
+        for column, value in reversed(zip(self._order_by[:-1], key[:-1])):
+            condition = '(%s %s %%s or (%s = %%s and %s))' % (column,
+                                                             operator,
+                                                             column,
+                                                             condition)
+            params = [value, value] + params
+
+        return condition, params
+
+    def _select(self, limit=''):
+        """Return an ordered select statement for this query."""
+        return 'select %s from %s%s order by %s%s' % (
+            self._expressions(self._columns), self._table, self._where(),
+            ', '.join(self._order_by), limit)
+
+    def _expressions(self, columns):
+        """Return the select expressions for columns, null if rolled up."""
+        return ', '.join('null' if column in self._rolled_up else column
+                         for column in columns)
+
+    def _fetch(self, offset, limit):
+        """Return a list of limit summaries, starting from offset."""
+        cursor = self._database.cursor()
+        cursor.execute(self._select(' limit %s offset %s'),
+                       list(self._params) + [limit, offset])
+        rows = [self._build(row) for row in cursor.fetchall()]
+        cursor.close()
+        return rows
+
+    def _iterate(self, cursor, chunk_size):
+        """Yield the rows of an executed cursor, chunk_size at a time."""
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield self._build(row)
+        finally:
+            cursor.close()
+
+    def _build(self, row):
+        """Return a summary dictionary built from a selected row tuple."""
+        # Any trailing key columns, selected only by seek(), are dropped.
+        return dict(zip(self._columns, row))
@@ -0,0 +1,93 @@
+"""This module contains the TokenCache class."""
+import hashlib
+import threading
+import time
+
+from django.core.cache import get_cache
+
+
+class TokenCache(object):
+    """
+    Remember which tokens have been verified, and which have been revoked.
+
+    Entries are held in the Django cache 'cache_alias' from
+    settings.CACHES. If that cache is shared, as the memcached 'tokens'
+    cache is, a token verified by one process is accepted by all of them.
+
+    Entries are keyed by a hash of the token, so a client can have more
+    than one token cached at once. A verified token is cached until it
+    expires or for 'ttl' seconds, whichever is sooner, so that a token
+    revoked by its issuer stops being accepted.
+    """
+
+    def __init__(self, cache_alias='default', ttl=300):
+        """Initialize a new TokenCache using the given Django cache."""
+        self._cache_alias = cache_alias
+        self._ttl = ttl
+        self._cache = None
+
+        # _lock guards the counters below, which are per process.
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, token):
+        """Return the subject token was verified for, or None."""
+        subject = self._get_cache().get(self._key('verified', token))
+
+        with self._lock:
+            if subject is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+
+        return subject
+
+    def set(self, token, subject, expires):
+        """
+        Cache token as verified for subject.
+
+        expires is the time, in seconds since the epoch, the token expires.
+        """
+        timeout = min(int(expires - time.time()), self._ttl)
+        if timeout > 0:
+            self._get_cache().set(self._key('verified', token), subject,
+                                  timeout)
+
+    def revoke(self, token, timeout):
+        """Stop token being accepted, for timeout seconds."""
+        self._get_cache().set(self._key('revoked', token), True, timeout)
+        self._get_cache().delete(self._key('verified', token))
+
+    def is_revoked(self, token):
+        """Return True if token has been revoked."""
+        return bool(self._get_cache().get(self._key('revoked', token)))
+
+    def stats(self):
+        """Return a dictionary of this process' cache hits and misses."""
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses}
+
+    def clear(self):
+        """Forget every cached token and reset the counters."""
+        self._get_cache().clear()
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _get_cache(self):
+        """Return the Django cache, which is only created when first used."""
+        if self._cache is None:
+            self._cache = get_cache(self._cache_alias)
+
+        return self._cache
+
+    def _key(self, kind, token):
+        """Return the cache key of an entry of the given kind for token."""
+        return 'token-%s-%s' % (kind, hashlib.sha256(token).hexdigest())
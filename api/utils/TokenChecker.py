@@ -1,47 +1,104 @@
 """This module contains the TokenChecker class."""
 import base64
 import datetime
-import httplib
+import functools
 import json
 import logging
-import urllib2
+import time
+import urllib
 
 from django.conf import settings
-from django.core.cache import cache
 from jose import jwt
 from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
 
+from api.utils.HttpClient import HTTP_CLIENT, HttpError
+from api.utils.IntrospectionWorker import IntrospectionWorker
+from api.utils.KeyCache import KeyCache
+from api.utils.RejectedTokenCache import RejectedTokenCache
+from api.utils.TokenCache import TokenCache
+
 
 class TokenChecker(object):
     """This class contains methods to check a JWT token for validity."""
 
+    # The possible results of asking an IAM about a token, see
+    # _introspect_token. UNKNOWN means the IAM could not be asked, or
+    # did not give an answer.
+    ACTIVE = 'active'
+    INACTIVE = 'inactive'
+    UNKNOWN = 'unknown'
+
+    # The public keys of each IAM, shared by every TokenChecker so that
+    # they are not fetched again for each token.
+    key_cache = KeyCache(settings.JWKS_CACHE_TTL,
+                         settings.JWKS_MIN_REFRESH_INTERVAL)
+
+    # The tokens that have been verified, or revoked, shared by every
+    # process using the settings.TOKEN_CACHE_ALIAS cache.
+    token_cache = TokenCache(settings.TOKEN_CACHE_ALIAS,
+                             settings.TOKEN_CACHE_TTL)
+
+    # When this process last logged the token cache stats, see
+    # _log_token_cache_stats.
+    token_cache_stats_logged = 0
+
+    # The tokens recently rejected by this process, so that a client
+    # retrying a bad token does not cause it to be checked again.
+    rejected_token_cache = RejectedTokenCache(
+        settings.REJECTED_TOKEN_CACHE_SIZE,
+        settings.REJECTED_TOKEN_CACHE_TTL)
+
+    # Checks tokens have not been revoked, in the background, when
+    # settings.ASYNC_TOKEN_INTROSPECTION is True.
+    introspection_worker = IntrospectionWorker(
+        settings.TOKEN_INTROSPECTION_INTERVAL,
+        settings.TOKEN_INTROSPECTION_BATCH_SIZE)
+
     def __init__(self):
         """Initialize a new TokenChecker."""
         self.logger = logging.getLogger(__name__)
 
     def valid_token_to_id(self, token):
         """Introspect a token to determine its origin."""
+        # if token was rejected recently, we say it is still invalid
+        rejected_reason = self.rejected_token_cache.get(token)
+        if rejected_reason is not None:
+            self.logger.info('Token was rejected recently: %s',
+                             rejected_reason)
+            self.logger.debug('Rejected token cache: %s',
+                              self.rejected_token_cache.stats())
+            return None
+
         try:
             jwt_unverified_json = jwt.get_unverified_claims(token)
         except JWTError:
             self.logger.error('Token cannot be decoded.')
-            self.logger.debug('Full token: %s', token)
+            self.rejected_token_cache.reject(token, 'malformed')
             return None
 
         unverified_token_id = jwt_unverified_json['sub']
         self.logger.info('Token claims to be from %s', unverified_token_id)
 
+        if (settings.ASYNC_TOKEN_INTROSPECTION and
+                self.token_cache.is_revoked(token)):
+            self.logger.info('Token has been revoked.')
+            return None
+
         # if token is in the cache, we say it is valid
-        if cache.get(unverified_token_id) == token:
+        cached_token_id = self.token_cache.get(token)
+        self._log_token_cache_stats()
+        if cached_token_id is not None:
             self.logger.info("Token is in cache.")
 
-            return jwt_unverified_json['sub']
+            return cached_token_id
 
         # otherwise, we need to validate the token
         if not self._is_token_json_temporally_valid(jwt_unverified_json):
+            self.rejected_token_cache.reject(token, 'temporally invalid')
             return None
 
         if not self._is_token_issuer_trusted(jwt_unverified_json):
+            self.rejected_token_cache.reject(token, 'untrusted issuer')
             return None
 
         issuer = jwt_unverified_json['iss']
@@ -49,37 +106,104 @@ class TokenChecker(object):
         # returns if jwt_unverified_json['iss'] is missing.
         issuer = jwt_unverified_json['iss']
         if not self._verify_token(token, issuer):
+            self.rejected_token_cache.reject(token, 'unverified')
             return None
 
-        # check the token has not been revoked
-        verifed_token_id = self._check_token_not_revoked(token, issuer)
-        # if the IAM disagrees with the token sub, reject ir
-        if verifed_token_id != jwt_unverified_json['sub']:
-            return None
+        if settings.ASYNC_TOKEN_INTROSPECTION:
+            # Accept the locally verified token now, and check it has
+            # not been revoked in the background. If it has, it will be
+            # rejected once the check has run.
+            self.introspection_worker.submit(
+                token,
+                functools.partial(self._check_token_in_background,
+                                  token, issuer, jwt_unverified_json['sub']))
+        else:
+            # check the token has not been revoked
+            verifed_token_id = self._check_token_not_revoked(token, issuer)
+            # if the IAM disagrees with the token sub, reject ir
+            if verifed_token_id != jwt_unverified_json['sub']:
+                return None
 
         self.logger.info('Token validated')
         # If the execution gets here, we can cache the token.
-        # The cache variable is a key: value like structure
-        # with an optional timeout, we use the token subject
-        # as the key and the token as the value.
-        # Cache timeout set to 300 seconds to enable quick revocation
-        # but also limit the number of requests to the IAM instance
+        # The cache is keyed by a hash of the token, with the token
+        # subject as the value. Tokens are cached until they expire,
+        # or for at most settings.TOKEN_CACHE_TTL seconds to enable
+        # quick revocation but also limit the number of requests to
+        # the IAM instance.
         # Caching is also done after token validation to ensure
         # only valids tokens are cached
-        cache.set(jwt_unverified_json['sub'], token, 300)
+        self.token_cache.set(token, jwt_unverified_json['sub'],
+                             jwt_unverified_json['exp'])
 
         return jwt_unverified_json['sub']
 
+    def _log_token_cache_stats(self):
+        """
+        Log this process' token cache hits and misses.
+
+        They are logged at INFO level at most every
+        settings.TOKEN_CACHE_STATS_INTERVAL seconds, and otherwise at
+        DEBUG level.
+        """
+        now = time.time()
+        if (now - TokenChecker.token_cache_stats_logged <
+                settings.TOKEN_CACHE_STATS_INTERVAL):
+            self.logger.debug('Token cache: %s', self.token_cache.stats())
+            return
+
+        TokenChecker.token_cache_stats_logged = now
+        self.logger.info('Token cache: %s', self.token_cache.stats())
+
+    def _check_token_in_background(self, token, issuer, subject):
+        """
+        Revoke token if the issuer says it is inactive or not from subject.
+
+        Revoked tokens are rejected for settings.TOKEN_REVOCATION_TTL
+        seconds. If the issuer cannot be asked, e.g. it is down, the token
+        is left cached, so an outage of the issuer does not reject every
+        token checked during it.
+        """
+        state, client_id = self._introspect_token(token, issuer)
+        if state == self.UNKNOWN:
+            self.logger.warning('Token from %s could not be checked by %s, '
+                                'leaving it cached.', subject, issuer)
+            return
+
+        if state == self.ACTIVE and client_id == subject:
+            return
+
+        self.logger.info('Token from %s was not confirmed by %s, '
+                         'revoking it.', subject, issuer)
+        self.token_cache.revoke(token, settings.TOKEN_REVOCATION_TTL)
+
     def _check_token_not_revoked(self, token, issuer):
-        """Contact issuer to check if the token has been revoked or not."""
+        """
+        Contact issuer to check if the token has been revoked or not.
+
+        Return the client_id of the token if the issuer says it is active,
+        otherwise None.
+        """
+        state, client_id = self._introspect_token(token, issuer)
+        if state != self.ACTIVE:
+            return None
+
+        return client_id
+
+    def _introspect_token(self, token, issuer):
+        """
+        Ask issuer about token and return a (state, client_id) tuple.
+
+        state is ACTIVE, with the client_id of the token, INACTIVE if the
+        issuer says the token is not active, or UNKNOWN if the issuer could
+        not be asked or gave no usable answer. client_id is None unless
+        state is ACTIVE.
+        """
         if "https://" not in issuer:
             self.logger.info('Issuer not https! Ending revokation check!')
-            return None
+            return self.UNKNOWN, None
 
         try:
-            auth_request = urllib2.Request('%s/introspect' % issuer,
-                                           data='token=%s' % token)
-
             server_id = settings.SERVER_IAM_ID
             server_secret = settings.SERVER_IAM_SECRET
 
@@ -87,20 +211,37 @@ class TokenChecker(object):
 
             base64string = base64.encodestring(encode_string).replace('\n', '')
 
-            auth_request.add_header("Authorization", "Basic %s" % base64string)
-            auth_result = urllib2.urlopen(auth_request)
+            headers = {
+                "Authorization": "Basic %s" % base64string,
+                "Content-Type": "application/x-www-form-urlencoded",
+            }
+            auth_result = HTTP_CLIENT.post('%s/introspect' % issuer,
+                                           urllib.urlencode({'token': token}),
+                                           headers)
 
-            auth_json = json.loads(auth_result.read())
-            client_id = auth_json['client_id']
+            auth_json = json.loads(auth_result)
 
-        except (urllib2.HTTPError,
-                urllib2.URLError,
-                httplib.HTTPException,
-                KeyError) as error:
+        except (HttpError,
+                ValueError) as error:
             self.logger.error("%s: %s", type(error), str(error))
-            return None
+            return self.UNKNOWN, None
 
-        return client_id
+        if not isinstance(auth_json, dict):
+            self.logger.error("Unexpected introspection response from %s",
+                              issuer)
+            return self.UNKNOWN, None
+
+        # An inactive token is described only by {"active": false}.
+        if auth_json.get('active') is False:
+            return self.INACTIVE, None
+
+        client_id = auth_json.get('client_id')
+        if client_id is None:
+            self.logger.error("Introspection response from %s has no "
+                              "client_id", issuer)
+            return self.UNKNOWN, None
+
+        return self.ACTIVE, client_id
 
     def _verify_token(self, token, issuer):
         """Fetch IAM public key and veifry token against it."""
@@ -108,8 +249,16 @@ class TokenChecker(object):
             self.logger.info('Issuer not https! Will not verify token!')
             return False
 
-        # get the IAM's public key
-        key_json = self._get_issuer_public_key(issuer)
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except JWTError:
+            self.logger.error('Token header cannot be decoded.')
+            return False
+
+        # get the IAM's public key, only contacting the IAM
+        # if it is not cached or the token names an unknown key
+        key_json = self.key_cache.keys(issuer, kid,
+                                       self._get_issuer_public_key)
 
         # if we couldn't get the IAM public key, we cannot verify the token.
         if key_json is None:
@@ -128,16 +277,14 @@ class TokenChecker(object):
     def _get_issuer_public_key(self, issuer):
         """Return the public key of an IAM Hostname."""
         try:
-            key_request = urllib2.Request('%s/jwk' % issuer)
-            key_result = urllib2.urlopen(key_request)
+            key_result = HTTP_CLIENT.get('%s/jwk' % issuer)
 
-            key_json = json.loads(key_result.read())
+            key_json = json.loads(key_result)
             return key_json
 
-        except (urllib2.HTTPError,
-                urllib2.URLError,
-                httplib.HTTPException,
-                KeyError) as error:
+        except (HttpError,
+                KeyError,
+                ValueError) as error:
             self.logger.error("%s: %s", type(error), str(error))
             return None
 
@@ -0,0 +1,134 @@
+"""This file contains the CloudRecordBatchView class."""
+
+from dirq.queue import QueueError
+from django.conf import settings
+from rest_framework.response import Response
+
+from api.utils.ContentDecoder import ContentDecodeError
+from api.utils.QueueWriter import MessageEncodingError, get_queue_writer
+from api.views.CloudRecordView import CloudRecordView
+
+
+class CloudRecordBatchView(CloudRecordView):
+    """
+    Submit many Cloud Accounting Record messages in one request.
+
+    .../api/v1/cloud/record/batch
+
+    The request body is a sequence of messages, each preceded by its
+    length in bytes, as a decimal number, and a newline. The signer is
+    authorised once, then every message is saved for later loading.
+    """
+
+    def post(self, request, format=None):
+        """
+        Submit many Cloud Accounting Record messages in one request.
+
+        .../api/v1/cloud/record/batch
+
+        Returns the result of saving each message, in the order they
+        were sent.
+        """
+        empaid = self._get_empaid(request)
+        self.logger.info("Received batch. ID = %s", empaid)
+
+        signer, error_response = self._get_signer(request)
+        if error_response is not None:
+            return error_response
+
+        try:
+            messages = self._split_messages(self._get_body(request))
+        except ContentDecodeError as error:
+            self.logger.error("Could not read batch: %s", error)
+            return Response(str(error), status=error.status)
+        except ValueError as error:
+            self.logger.error("Could not split batch: %s", error)
+            return Response("Messages could not be read: %s" % error,
+                            status=400)
+
+        if not messages:
+            return Response("No messages were sent.", status=400)
+
+        if len(messages) > settings.MAX_BATCH_MESSAGES:
+            return Response("At most %s messages can be sent at once." %
+                            settings.MAX_BATCH_MESSAGES,
+                            status=400)
+
+        self.logger.info("Batch contains %s messages", len(messages))
+
+        inq = get_queue_writer()
+
+        results = []
+        for body in messages:
+            try:
+                inq.add({'body': body,
+                         'signer': signer,
+                         'empaid': empaid})
+            except MessageEncodingError as err:
+                self.logger.error("Could not read message: %s", err)
+                results.append({'status': 400, 'detail': str(err)})
+            except (QueueError, IOError, OSError) as err:
+                self.logger.error("Could not save message to %s: %s",
+                                  inq.path, err)
+                results.append({'status': 500,
+                                'detail': "Data could not be saved to disk, "
+                                          "please try again."})
+            else:
+                results.append({'status': 202,
+                                'detail': "Data successfully saved for "
+                                          "future loading."})
+
+        saved = len([result for result in results
+                     if result['status'] == 202])
+        self.logger.info("%s of %s messages saved to %s", saved,
+                         len(messages), inq.path)
+        self.logger.debug("Queue writer: %s", inq.stats())
+
+        if saved == len(messages):
+            status = 202
+        elif saved == 0:
+            status = 500
+        else:
+            # Some, but not all, of the messages were saved.
+            status = 207
+
+        return Response({'saved': saved, 'results': results}, status=status)
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _split_messages(self, body):
+        """
+        Return the list of messages in a batch body.
+
+        Raise ValueError if body is not a sequence of length
+        prefixed messages.
+        """
+        messages = []
+        offset = 0
+        while offset < len(body):
+            newline = body.find('\n', offset)
+            if newline == -1:
+                raise ValueError("message %s has no length" % len(messages))
+
+            try:
+                length = int(body[offset:newline])
+            except ValueError:
+                raise ValueError("message %s has an invalid length" %
+                                 len(messages))
+
+            if length < 0:
+                raise ValueError("message %s has an invalid length" %
+                                 len(messages))
+
+            start = newline + 1
+            offset = start + length
+            if offset > len(body):
+                raise ValueError("message %s is truncated" % len(messages))
+
+            messages.append(body[start:offset])
+
+        return messages
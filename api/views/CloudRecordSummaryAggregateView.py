@@ -0,0 +1,142 @@
+"""This file contains the CloudRecordSummaryAggregateView class."""
+
+import MySQLdb
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from api.utils.ConnectionPool import PoolTimeoutError
+from api.utils.Database import get_connection_pool
+from api.utils.DatabaseConfig import DatabaseConfigError
+from api.utils.ResponseCache import RESPONSE_CACHE
+from api.utils.SummaryQuery import SummaryQuery
+from api.views.CloudRecordSummaryView import CloudRecordSummaryView
+
+
+class CloudRecordSummaryAggregateView(CloudRecordSummaryView):
+    """
+    Retrieve totals of Cloud Accounting Summaries.
+
+    Usage:
+
+    .../api/v1/cloud/record/summary/aggregate?from=<date_from>&group_by=<columns>&metrics=<columns>
+
+    Will return, for each distinct combination of the comma separated
+    group_by columns, the sums of the comma separated metrics columns over
+    the summaries selected by the same filters as the summary view.
+
+    Adding granularity=month or granularity=year sums monthly or yearly
+    summaries instead, which is much faster for long periods, but then
+    the data cannot be grouped by Day, or by Day or Month, respectively.
+
+    Conditional requests are answered as by the summary view.
+    """
+
+    def get(self, request, format=None):
+        """
+        Retrieve totals of Cloud Accounting Summaries.
+
+        .../api/v1/cloud/record/summary/aggregate?from=<date_from>&group_by=<columns>&metrics=<columns>
+
+        group_by defaults to no columns, i.e. a single total, and metrics
+        defaults to every column that can be summed.
+        """
+        error_response = self._authorize(request)
+        if error_response is not None:
+            return error_response
+
+        try:
+            conditions, params = self._get_conditions(request)
+        except ValueError as err:
+            return Response(str(err), status=400)
+
+        try:
+            granularity = self._get_granularity(request)
+        except ValueError as err:
+            return Response(str(err), status=400)
+
+        group_by = self._parse_columns(request, 'group_by', ())
+        metrics = self._parse_columns(request, 'metrics',
+                                      SummaryQuery.METRICS)
+
+        dimensions = [column for column in SummaryQuery.DIMENSIONS
+                      if column not in SummaryQuery.ROLLED_UP[granularity]]
+        unknown = [column for column in group_by if column not in dimensions]
+        if unknown:
+            return Response("'group_by' must be some of %s." %
+                            ', '.join(dimensions),
+                            status=400)
+
+        unknown = [column for column in metrics
+                   if column not in SummaryQuery.METRICS]
+        if unknown or not metrics:
+            return Response("'metrics' must be some of %s." %
+                            ', '.join(SummaryQuery.METRICS),
+                            status=400)
+
+        try:
+            pool = get_connection_pool()
+        except DatabaseConfigError as err:
+            self.logger.error("No valid database configuration in %s: %s",
+                              settings.CLOUD_DB_CONF, err)
+            return Response(status=500)
+
+        limit = settings.MAX_AGGREGATE_RESULTS
+        try:
+            generation = RESPONSE_CACHE.generation(pool)
+            etag = RESPONSE_CACHE.etag(request, generation)
+            last_modified = RESPONSE_CACHE.last_modified(pool)
+            if self._is_not_modified(request, etag, last_modified):
+                return self._add_validators(Response(status=304), etag,
+                                            last_modified)
+
+            results = RESPONSE_CACHE.get(request, generation)
+            if results is None:
+                with pool.connection() as database:
+                    query = SummaryQuery(database, conditions, params,
+                                         granularity=granularity)
+                    # Fetch one extra row to find out if there are too many.
+                    results = query.aggregate(group_by, metrics, limit + 1)
+
+                RESPONSE_CACHE.set(request, generation, results)
+
+        except MySQLdb.OperationalError as err:
+            self.logger.error("Could not query database: %s", err)
+            return Response(status=500)
+
+        except PoolTimeoutError as err:
+            self.logger.error("%s", err)
+            self.logger.error("Connection pool: %s", pool.stats())
+            return Response(status=503)
+
+        if len(results) > limit:
+            return Response("More than %s groups match, group by fewer "
+                            "columns or narrow the filters." % limit,
+                            status=400)
+
+        response = Response({'group_by': group_by,
+                             'metrics': metrics,
+                             'results': results},
+                            status=200)
+        return self._add_validators(response, etag, last_modified)
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _parse_columns(self, request, parameter, default):
+        """Return the list of comma separated columns in a query parameter."""
+        value = request.GET.get(parameter, '')
+        if value == '':
+            return list(default)
+
+        # Duplicates are dropped, keeping the order the columns were given.
+        columns = []
+        for column in value.split(','):
+            column = column.strip()
+            if column not in columns:
+                columns.append(column)
+
+        return columns
@@ -1,20 +1,47 @@
 """This file contains the CloudRecordSummaryView class."""
 
-import ConfigParser
+import base64
 import datetime
+import json
 import logging
 import MySQLdb
 
+from rest_framework.compat import OrderedDict
 from rest_framework.pagination import PaginationSerializer
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.utils.http import quote_etag
 from rest_framework.response import Response
+from rest_framework.templatetags.rest_framework import replace_query_param
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
+from api.utils.ConnectionPool import PoolTimeoutError
+from api.utils.Database import get_connection_pool
+from api.utils.DatabaseConfig import DatabaseConfigError
+from api.utils.RequestLogger import RequestLoggingMixin
+from api.utils.ResponseCache import RESPONSE_CACHE
+from api.utils.SummaryQuery import SummaryQuery
 from api.utils.TokenChecker import TokenChecker
 
 
-class CloudRecordSummaryView(APIView):
+def check_return_headers():
+    """Raise ImproperlyConfigured if settings.RETURN_HEADERS is not valid."""
+    try:
+        SummaryQuery.check_columns(settings.RETURN_HEADERS)
+    except ValueError as error:
+        raise ImproperlyConfigured("Invalid RETURN_HEADERS: %s" % error)
+
+
+# The columns returned are checked once, when the views are loaded, rather
+# than by every request.
+check_return_headers()
+
+
+class CloudRecordSummaryView(RequestLoggingMixin, APIView):
     """
     Retrieve Cloud Accounting Summaries.
 
@@ -39,8 +66,30 @@ class CloudRecordSummaryView(APIView):
 
     Will give summary for whole infrastructure from date_from
     (exclusive) to now
+
+    user, group and service can be combined, and each given more than
+    once, or for group and service as a comma separated list, to return
+    the summaries matching all of the filters in one request.
+
+    Adding cursor= to any of the above will page through the results using
+    the 'next' and 'previous' links, rather than page numbers.
+
+    Adding stream=ndjson or stream=json to any of the above will return
+    every matching summary, unpaginated, as newline delimited JSON or as
+    a JSON list respectively.
+
+    Adding granularity=month or granularity=year to any of the above will
+    return monthly or yearly summaries, rather than daily summaries.
+
+    Responses carry an ETag and a Last-Modified header. A request with
+    If-None-Match or If-Modified-Since gets a 304 response, without
+    querying the summaries, if they have not changed.
     """
 
+    # The content type of each supported stream format.
+    STREAM_CONTENT_TYPES = {'json': 'application/json',
+                            'ndjson': 'application/x-ndjson'}
+
     def __init__(self):
         """Set up class level logging."""
         self.logger = logging.getLogger(__name__)
@@ -70,6 +119,117 @@ class CloudRecordSummaryView(APIView):
 
         Will give summary for whole infrastructure from
         date_from (exclusive) to now
+
+        user, group and service can be combined, and each given more than
+        once, or for group and service as a comma separated list, to return
+        the summaries matching all of the filters in one request.
+
+        Adding cursor= to any of the above will page through the results
+        using the 'next' and 'previous' links, rather than page numbers.
+
+        Adding stream=ndjson or stream=json to any of the above will return
+        every matching summary, unpaginated, as newline delimited JSON or as
+        a JSON list respectively.
+
+        Adding granularity=month or granularity=year to any of the above
+        will return monthly or yearly summaries, rather than daily summaries.
+        """
+        error_response = self._authorize(request)
+        if error_response is not None:
+            return error_response
+
+        try:
+            conditions, params = self._get_conditions(request)
+        except ValueError as err:
+            return Response(str(err), status=400)
+
+        try:
+            granularity = self._get_granularity(request)
+        except ValueError as err:
+            return Response(str(err), status=400)
+
+        try:
+            cursor_position = self._decode_cursor(request.GET.get('cursor'),
+                                                  granularity)
+        except ValueError:
+            return Response("'cursor' is not valid.", status=400)
+
+        stream_format = request.GET.get('stream')
+        if (stream_format is not None and
+                stream_format not in self.STREAM_CONTENT_TYPES):
+            return Response("'stream' must be one of %s." %
+                            ', '.join(sorted(self.STREAM_CONTENT_TYPES)),
+                            status=400)
+
+        # get the data requested
+        try:
+            pool = get_connection_pool()
+        except DatabaseConfigError as err:
+            self.logger.error("No valid database configuration in %s: %s",
+                              settings.CLOUD_DB_CONF, err)
+            return Response(status=500)
+
+        try:
+            if stream_format is not None:
+                stream = self._stream_result(pool, conditions, params,
+                                             stream_format, granularity)
+                # Start the stream now, so that any error running
+                # the query can still be reported by the status code.
+                next(stream)
+                return StreamingHttpResponse(
+                    stream,
+                    content_type=self.STREAM_CONTENT_TYPES[stream_format])
+
+            generation = RESPONSE_CACHE.generation(pool)
+            etag = RESPONSE_CACHE.etag(request, generation)
+            last_modified = RESPONSE_CACHE.last_modified(pool)
+            if self._is_not_modified(request, etag, last_modified):
+                return self._add_validators(Response(status=304), etag,
+                                            last_modified)
+
+            # Identical requests are answered from the cache until the
+            # summaries are next changed.
+            results = RESPONSE_CACHE.get(request, generation)
+            if results is None:
+                with pool.connection() as database:
+                    self.logger.debug("Connection pool: %s", pool.stats())
+                    # Only the columns in settings.RETURN_HEADERS are
+                    # selected.
+                    query = SummaryQuery(database, conditions, params,
+                                         settings.RETURN_HEADERS, granularity)
+                    # Only the requested page is fetched from the database.
+                    if 'cursor' in request.GET:
+                        results = self._paginate_by_cursor(request, query,
+                                                           cursor_position)
+                    else:
+                        results = self._paginate_result(request, query)
+
+                RESPONSE_CACHE.set(request, generation, results)
+
+        except MySQLdb.OperationalError as err:
+            self.logger.error("Could not query database: %s", err)
+            return Response(status=500)
+
+        except PoolTimeoutError as err:
+            self.logger.error("%s", err)
+            self.logger.error("Connection pool: %s", pool.stats())
+            return Response(status=503)
+
+        return self._add_validators(Response(results, status=200), etag,
+                                    last_modified)
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _authorize(self, request):
+        """
+        Return None if request may view summaries, or an error Response.
+
+        The response is a 401 if request has no valid token, and a 403 if
+        the client the token was issued to is not allowed to view summaries.
         """
         client_token = self._request_to_token(request)
         if client_token is None:
@@ -85,99 +245,96 @@ class CloudRecordSummaryView(APIView):
         if not self._is_client_authorized(client_id):
             return Response(status=403)
 
+        return None
+
+    def _get_conditions(self, request):
+        """
+        Return the SQL conditions, and their params, the request filters by.
+
+        Any of user, group and service can be combined, and each can be
+        given more than once. group and service can also be given as
+        comma separated lists. Each filter with more than one value
+        becomes an 'in' list, so all of them are answered by one query.
+
+        Raise ValueError, with a message for the client, if the query
+        parameters of request do not describe a supported filter.
+        """
         # parse query parameters
-        (group_name,
-         service_name,
-         start_date,
-         end_date,
-         global_user_name) = self._parse_query_parameters(request)
-
-        # Check that at most one of group_name, service_name
-        # and global_user_name is set as having more than
-        # one defined is currently ambiguous while retrieval
-        # against only one parameter per GET request is supported.
-        parameters_to_check = (group_name, service_name, global_user_name)
-        set_count = sum([1 for para in parameters_to_check if para is None])
-        if set_count <= 1:
-            self.logger.error("User, Group and/or Service combined.")
-            self.logger.error("Rejecting request.")
-            return Response("Only one of User, Group and Service can be set.",
-                            status=400)
+        (_, _, start_date, end_date, _) = self._parse_query_parameters(request)
 
         if start_date is None:
             # querying without a from is not supported
-            return Response("'from' must be set in GET requests.",
-                            status=400)
+            raise ValueError("'from' must be set in GET requests.")
+
+        conditions = []
+        params = []
+        # Global user names are DNs, which can contain commas.
+        for parameter, column, separator in (('user', 'GlobalUserName', None),
+                                             ('group', 'VOGroup', ','),
+                                             ('service', 'SiteName', ',')):
+            values = self._parse_filter_values(request, parameter, separator)
+            if not values:
+                continue
+
+            if len(values) > settings.MAX_FILTER_VALUES:
+                raise ValueError("At most %s values can be given for '%s'." %
+                                 (settings.MAX_FILTER_VALUES, parameter))
+
+            if len(values) == 1:
+                conditions.append('%s = %%s' % column)
+            else:
+                conditions.append('%s in (%s)' % (
+                    column, ', '.join(['%s'] * len(values))))
+            params.extend(values)
+
+        if conditions:
+            conditions.extend(['EarliestStartTime > %s',
+                               'LatestStartTime < %s'])
+            params.extend([start_date, end_date])
 
-        # Read configuration from file
-        try:
-            dbcp = ConfigParser.ConfigParser()
-            dbcp.read(settings.CLOUD_DB_CONF)
-
-            db_hostname = dbcp.get('db', 'hostname')
-            # db_port = int(dbcp.get('db', 'port'))
-            db_name = dbcp.get('db', 'name')
-            db_username = dbcp.get('db', 'username')
-            db_password = dbcp.get('db', 'password')
-        except (ConfigParser.Error, ValueError, IOError) as err:
-            self.logger.warning('Error in configuration file %s: %s',
-                                settings.CLOUD_DB_CONF,
-                                err)
-            self.logger.warning('Using default configuration.')
-
-            db_hostname = 'localhost'
-            db_name = 'apel_rest'
-            db_username = 'root'
-            db_password = ''
+        else:
+            conditions = ['EarliestStartTime > %s']
+            params = [start_date]
 
-        # get the data requested
-        try:
-            database = MySQLdb.connect(db_hostname,
-                                       db_username,
-                                       db_password,
-                                       db_name)
-        except MySQLdb.OperationalError:
-            self.logger.error("Could not connect to %s at %s using %s, %s",
-                              db_name, db_hostname, db_username, db_password)
-            return Response(status=500)
+        return conditions, params
 
-        cursor = database.cursor(MySQLdb.cursors.DictCursor)
-
-        if global_user_name is not None:
-            cursor.execute('select * from VCloudSummaries '
-                           'where GlobalUserName = %s '
-                           'and EarliestStartTime > %s '
-                           'and LatestStartTime < %s',
-                           [global_user_name, start_date, end_date])
-
-        elif group_name is not None:
-            cursor.execute('select * from VCloudSummaries '
-                           'where VOGroup = %s '
-                           'and EarliestStartTime > %s '
-                           'and LatestStartTime < %s',
-                           [group_name, start_date, end_date])
-
-        elif service_name is not None:
-            cursor.execute('select * from VCloudSummaries '
-                           'where SiteName = %s and '
-                           'EarliestStartTime > %s and '
-                           'LatestStartTime < %s',
-                           [service_name, start_date, end_date])
+    def _parse_filter_values(self, request, parameter, separator):
+        """
+        Return the distinct values of a filter query parameter, in order.
 
-        else:
-            cursor.execute('select * from VCloudSummaries '
-                           'where EarliestStartTime > %s',
-                           [start_date])
+        If separator is not None, each value is also split on it.
+        """
+        values = []
+        for value in request.GET.getlist(parameter):
+            if separator is None:
+                parts = [value]
+            else:
+                parts = value.split(separator)
 
-        results = self._filter_cursor(cursor)
-        results = self._paginate_result(request, results)
-        return Response(results, status=200)
+            for part in parts:
+                part = part.strip()
+                if part and part not in values:
+                    values.append(part)
 
-###############################################################################
-#                                                                             #
-# Helper methods                                                              #
-#                                                                             #
-###############################################################################
+        return values
+
+    def _get_granularity(self, request):
+        """
+        Return the granularity of the summaries the request is for.
+
+        The coarser the granularity, the fewer rows are read to answer the
+        request, see SummaryQuery.TABLES. Raise ValueError, with a message
+        for the client, if the granularity is not supported.
+        """
+        granularity = request.GET.get('granularity', '')
+        if granularity == '':
+            return 'day'
+
+        if granularity not in SummaryQuery.TABLES:
+            raise ValueError("'granularity' must be one of %s." %
+                             ', '.join(sorted(SummaryQuery.TABLES)))
+
+        return granularity
 
     def _parse_query_parameters(self, request):
         """Parse expected query parameters from the given HTTP request."""
@@ -235,31 +392,143 @@ class CloudRecordSummaryView(APIView):
                                           context={'request': request})
         return serializer.data
 
-    def _filter_cursor(self, cursor):
+    def _paginate_by_cursor(self, request, query, position):
+        """
+        Return a page of results starting from a cursor position.
+
+        position is a (direction, key) tuple, as returned by
+        _decode_cursor, or None for the first page. The returned page
+        uses the same structure as _paginate_result, but the 'next' and
+        'previous' links carry an opaque cursor rather than a page number
+        and 'count' is always None, as counting every result would cost
+        as much as fetching them.
+        """
+        limit = settings.RESULTS_PER_PAGE
+        if position is None:
+            direction, key = 'next', None
+        else:
+            direction, key = position
+
+        # Fetch one extra row to find out if there is another page.
+        if direction == 'previous':
+            rows = query.seek(limit + 1, before=key)
+            has_previous = len(rows) > limit
+            rows = rows[-limit:]
+            has_next = True
+        else:
+            rows = query.seek(limit + 1, after=key)
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            has_previous = key is not None
+
+        url = request.build_absolute_uri()
+        next_url = None
+        previous_url = None
+
+        if has_next:
+            if rows:
+                next_url = replace_query_param(
+                    url, 'cursor', self._encode_cursor('next', rows[-1][0]))
+            else:
+                # Paged back past the first result, so start again.
+                next_url = replace_query_param(url, 'cursor', '')
+
+        if has_previous and rows:
+            previous_url = replace_query_param(
+                url, 'cursor', self._encode_cursor('previous', rows[0][0]))
+
+        return OrderedDict([('count', None),
+                            ('next', next_url),
+                            ('previous', previous_url),
+                            ('results', [row for _, row in rows])])
+
+    def _encode_cursor(self, direction, key):
+        """Return an opaque cursor for a direction and SummaryQuery key."""
+        cursor = base64.urlsafe_b64encode(json.dumps([direction] + list(key)))
+        # The padding is not needed to decode the cursor.
+        return cursor.rstrip('=')
+
+    def _decode_cursor(self, cursor, granularity='day'):
+        """
+        Return the (direction, key) tuple encoded in cursor.
+
+        Return None if cursor is None or empty, i.e. the first page is
+        wanted, and raise ValueError if cursor is not valid for summaries
+        of granularity.
+        """
+        if not cursor:
+            return None
+
+        try:
+            cursor = str(cursor)
+            decoded = json.loads(base64.urlsafe_b64decode(
+                cursor + '=' * (-len(cursor) % 4)))
+        except (TypeError, UnicodeError):
+            raise ValueError("Cursor could not be decoded")
+
+        if (not isinstance(decoded, list) or not decoded or
+                decoded[0] not in ('next', 'previous')):
+            raise ValueError("Cursor is not of the expected form")
+
+        key = tuple(decoded[1:])
+        SummaryQuery.check_key(key, granularity)
+        return decoded[0], key
+
+    def _stream_result(self, pool, conditions, params, stream_format,
+                       granularity='day'):
+        """
+        Yield every summary matching conditions, encoded as stream_format.
+
+        The first chunk yielded is always empty and is yielded once the
+        query has been run. A pooled connection is held until the
+        generator is exhausted or closed.
+        """
+        encoder = JSONEncoder(separators=(',', ':'))
+        with pool.connection() as database:
+            query = SummaryQuery(database, conditions, params,
+                                 settings.RETURN_HEADERS, granularity)
+            summaries = query.stream()
+            yield ''
+
+            if stream_format == 'ndjson':
+                for summary in summaries:
+                    yield encoder.encode(summary) + '\n'
+
+            else:
+                separator = '['
+                for summary in summaries:
+                    yield separator + encoder.encode(summary)
+                    separator = ','
+
+                # If there were no summaries, the list is not yet open.
+                yield '[]' if separator == '[' else ']'
+
+    def _is_not_modified(self, request, etag, last_modified):
         """
-        Filter database results based on settings.RETURN_HEADERS.
+        Return True if the client already has the response to request.
 
-        Allows for configuration of what summary fields
-        the REST interface returns on GET requests.
+        That is, if If-None-Match matches etag or, if If-None-Match was not
+        sent, if last_modified is no later than If-Modified-Since.
         """
-        results_list = []
-        # Use results_list to store individual summaries to before returning.
-        for record in cursor.fetchall():
-            # record refers to one day's summary
-            result = {}
-            # result is used to construct a new, filtered, summary with
-            # only the values listed in settings.RETURN_HEADERS.
-            for key, value in record.iteritems():
-                if key in settings.RETURN_HEADERS:
-                    # keys listed in settings.RETURN_HEADERS represent
-                    # summary fields the REST interface has been configured
-                    # to return. As such we need to add that field to the
-                    # new summary we are constructing
-                    result.update({key: value})
-
-            results_list.append(result)
-
-        return results_list
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            # parse_etags also accepts weak ETags, which is fine for a GET.
+            etags = parse_etags(if_none_match)
+            return '*' in etags or etag in [quote_etag(tag) for tag in etags]
+
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return (if_modified_since is not None and
+                last_modified is not None and
+                int(last_modified) <= if_modified_since)
+
+    def _add_validators(self, response, etag, last_modified):
+        """Add the ETag and Last-Modified headers to response."""
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+
+        return response
 
     def _request_to_token(self, request):
         """Get the token from the request."""
@@ -272,10 +541,8 @@ class CloudRecordSummaryView(APIView):
         except IndexError:
             self.logger.error("AUTHORIZATION header provided, "
                               "but not of expected form.")
-            self.logger.error(request.META['HTTP_AUTHORIZATION'])
             return None
         self.logger.info("Successfully extracted Token")
-        self.logger.debug("Full Token: %s", token)
         return token
 
     def _is_client_authorized(self, client_id):
@@ -2,16 +2,22 @@
 
 import json
 import logging
-import os
-import urllib2
+from StringIO import StringIO
 
-from dirq.queue import Queue, QueueError
+from dirq.queue import QueueError
 from django.conf import settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.utils.ContentDecoder import (BodyTooLargeError, ContentDecodeError,
+                                      ContentDecoder)
+from api.utils.HttpClient import HTTP_CLIENT, HttpError
+from api.utils.ProviderRegistry import ProviderRegistry
+from api.utils.QueueWriter import MessageEncodingError, get_queue_writer
+from api.utils.RequestLogger import RequestLoggingMixin
 
-class CloudRecordView(APIView):
+
+class CloudRecordView(RequestLoggingMixin, APIView):
     """
     Submit Cloud Accounting Records.
 
@@ -20,6 +26,11 @@ class CloudRecordView(APIView):
     Will save Cloud Accounting Records for later loading.
     """
 
+    # Shared by every CloudRecordView in this process, so the CMDB
+    # is only contacted when the cached provider list goes stale.
+    provider_registry = ProviderRegistry(settings.PROVIDERS_CACHE_TTL,
+                                         settings.PROVIDERS_RETRY_INTERVAL)
+
     def __init__(self):
         """Set up class level logging."""
         self.logger = logging.getLogger(__name__)
@@ -33,76 +44,124 @@ class CloudRecordView(APIView):
 
         Will save Cloud Accounting Records for later loading.
         """
+        empaid = self._get_empaid(request)
+        self.logger.info("Received message. ID = %s", empaid)
+
+        signer, error_response = self._get_signer(request)
+        if error_response is not None:
+            return error_response
+
+        inq = get_queue_writer()
+
         try:
-            empaid = request.META['HTTP_EMPA_ID']
-        except KeyError:
-            empaid = 'noid'
+            # The body is copied to the queue a chunk at a time,
+            # rather than being read into memory all at once.
+            name = inq.add_stream('body', self._open_body(request),
+                                  {'signer': signer,
+                                   'empaid': empaid})
+        except ContentDecodeError as error:
+            self.logger.error("Could not read message: %s", error)
+            return Response(str(error), status=error.status)
+        except MessageEncodingError as error:
+            self.logger.error("Could not read message: %s", error)
+            return Response(str(error), status=400)
+        except (QueueError, IOError, OSError) as err:
+            self.logger.error("Could not save message to %s: %s",
+                              inq.path, err)
 
-        self.logger.info("Received message. ID = %s", empaid)
+            response = "Data could not be saved to disk, please try again."
+            return Response(response, status=500)
+
+        self.logger.info("Message saved to in queue as %s/%s", inq.path,
+                         name)
+        self.logger.debug("Queue writer: %s", inq.stats())
+
+        response = "Data successfully saved for future loading."
+        return Response(response, status=202)
 
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _get_empaid(self, request):
+        """Return the ID the sender gave request, or 'noid'."""
         try:
-            signer = request.META['SSL_CLIENT_S_DN']
+            return request.META['HTTP_EMPA_ID']
         except KeyError:
-            self.logger.error("No DN supplied in header")
-            return Response(status=401)
+            return 'noid'
 
-        # authorise DNs here
-        if not self._signer_is_valid(signer):
-            self.logger.error("%s not a valid provider", signer)
-            return Response(status=403)
+    def _open_body(self, request):
+        """
+        Return a file like object that reads the body of request.
 
+        The body is decompressed if it was compressed, and reading more
+        than settings.MAX_BODY_SIZE bytes of it raises BodyTooLargeError.
+        Raise ContentDecodeError if the body cannot be read.
+        """
         if "_content" in request.POST.dict():
             # then POST likely to come via the rest api framework
             # hence use the content of request.POST as message
-            body = request.POST.get('_content')
-
+            # Django decodes POST data, but the body is read as bytes.
+            stream = StringIO(request.POST.get('_content').encode('utf-8'))
         else:
             # POST likely to comes through a browser client or curl
-            # hence use request.body as message
-            body = request.body
+            # hence read the message from the request itself
+            stream = request
 
-        self.logger.debug("Message body received: %s", body)
+            try:
+                content_length = int(request.META.get('CONTENT_LENGTH'))
+            except (TypeError, ValueError):
+                content_length = 0
 
-        for header in request.META:
-            self.logger.debug("%s: %s", header, request.META[header])
+            # Reject bodies that are too large without reading them.
+            if content_length > settings.MAX_BODY_SIZE:
+                raise BodyTooLargeError("Body is larger than %s bytes" %
+                                        settings.MAX_BODY_SIZE)
 
-        # taken from ssm2
-        QSCHEMA = {'body': 'string',
-                   'signer': 'string',
-                   'empaid': 'string?'}
+        body = ContentDecoder(settings.MAX_BODY_SIZE).open(
+            stream, request.META.get('HTTP_CONTENT_ENCODING'))
 
-        inqpath = os.path.join(settings.QPATH, 'incoming')
-        inq = Queue(inqpath, schema=QSCHEMA)
+        if self.request_log is not None:
+            body = self.request_log.wrap(body)
 
-        try:
-            name = inq.add({'body': body,
-                            'signer': signer,
-                            'empaid': empaid})
-        except QueueError as err:
-            self.logger.error("Could not save %s/%s: %s", inqpath, name, err)
+        return body
 
-            response = "Data could not be saved to disk, please try again."
-            return Response(response, status=500)
+    def _get_body(self, request):
+        """
+        Return the body of request, decompressed if it was compressed.
 
-        self.logger.info("Message saved to in queue as %s/%s", inqpath, name)
+        Raise ContentDecodeError if the body cannot be read.
+        """
+        return self._open_body(request).read()
 
-        response = "Data successfully saved for future loading."
-        return Response(response, status=202)
+    def _get_signer(self, request):
+        """
+        Return the DN that signed request, and None.
 
-###############################################################################
-#                                                                             #
-# Helper methods                                                              #
-#                                                                             #
-###############################################################################
+        If the request cannot be accepted, return None and the
+        error Response to send instead.
+        """
+        try:
+            signer = request.META['SSL_CLIENT_S_DN']
+        except KeyError:
+            self.logger.error("No DN supplied in header")
+            return None, Response(status=401)
+
+        # authorise DNs here
+        if not self._signer_is_valid(signer):
+            self.logger.error("%s not a valid provider", signer)
+            return None, Response(status=403)
+
+        return signer, None
 
     def _get_provider_json_indigo_cmdb(self):
         """Fetch the INDIGO CMDB Resource Provider JSON."""
         try:
-            provider_json_request = urllib2.Request(settings.PROVIDERS_URL)
-            provider_json_response = urllib2.urlopen(provider_json_request)
-            return json.loads(provider_json_response.read())
+            return json.loads(HTTP_CLIENT.get(settings.PROVIDERS_URL))
 
-        except (ValueError, urllib2.HTTPError) as error:
+        except (ValueError, HttpError) as error:
             self.logger.error("List of providers could not be retrieved.")
             self.logger.error("%s: %s", type(error), error)
             return {}
@@ -135,13 +194,19 @@ class CloudRecordView(APIView):
         # Return the hostnames we were able to extract.
         return provider_hostnames
 
-    def _get_indigo_providers(self):
-        """Return a list of registered INDIGO Resource Provider hostnames."""
+    def _fetch_indigo_providers(self):
+        """Fetch a list of registered INDIGO Resource Provider hostnames."""
         # Get the JSON from the CMDB.
         provider_json = self._get_provider_json_indigo_cmdb()
         # Return any hostnames we can parse from the provider JSON.
         return self._parse_hostnames_indigo_cmdb(provider_json)
 
+    def _get_indigo_providers(self):
+        """Return a set of registered INDIGO Resource Provider hostnames."""
+        # The registry only calls _fetch_indigo_providers when
+        # its cached copy of the hostnames is missing or stale.
+        return self.provider_registry.hostnames(self._fetch_indigo_providers)
+
     def _signer_is_valid(self, signer_dn):
         """Return True if signer's host is listed as a Resource Provider."""
         # Get the hostname from the DN
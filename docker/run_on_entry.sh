@@ -35,6 +35,9 @@ echo "# Cron job running by default every 6 hours, at 45 minutes past the hour
 
 45 */6 * * * root /usr/sbin/fetch-crl -q -r 360" >  /etc/cron.d/fetch-crl
 
+# start memcached, which caches verified tokens for every apache process
+/usr/bin/memcached -d -u memcached -l 127.0.0.1
+
 # start apache
 /usr/sbin/httpd
 
@@ -130,7 +130,10 @@ CREATE TABLE CloudSummaries (
   
   PublisherDNID VARCHAR(255),
 
-  PRIMARY KEY (SiteID, Day, Month, Year, GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, CloudType, ImageId)
+  PRIMARY KEY (SiteID, Day, Month, Year, GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, CloudType, ImageId),
+
+  -- Used by SummariseVMs to replace the summaries of a day.
+  INDEX index_yearmonthday USING BTREE (Year, Month, Day)
 
 );
 
@@ -154,95 +157,332 @@ BEGIN
         wallDuration, cpuDuration, cpuCount, networkInbound, networkOutbound, publicIPCount, memory,
         disk, benchmarkType, benchmark, numberOfVMs, DNLookup(publisherDN)
         );
+
+    CALL RefreshMaterialisedCloudSummary(SiteLookup(site), day, month, year, DNLookup(globalUserName),
+        VOLookup(vo), VOGroupLookup(voGroup), VORoleLookup(voRole), status, cloudType, imageId);
+    CALL RefreshCloudSummaryRollup(SiteLookup(site), month, year, DNLookup(globalUserName),
+        VOLookup(vo), VOGroupLookup(voGroup), VORoleLookup(voRole), status, cloudType, imageId);
+
+    -- Tell the REST API its cached summary responses are out of date.
+    CALL UpdateTimestamp('ReplaceCloudSummaryRecord');
 END //
 DELIMITER ;
 
 
+-- The last record of each VM on each day it was measured, as of the last
+-- time SummariseVMs was run. This is kept between runs, so that only the
+-- days with new records need to be recalculated.
+DROP TABLE IF EXISTS LastCloudRecordPerDay;
+CREATE TABLE LastCloudRecordPerDay (
+  VMUUID VARCHAR(255) NOT NULL,
+  SiteID INT NOT NULL,
+  CloudComputeServiceID INT NOT NULL,
+  GlobalUserNameID INT NOT NULL,
+  VOID INT NOT NULL,
+  VOGroupID INT NOT NULL,
+  VORoleID INT NOT NULL,
+  Status VARCHAR(255),
+  StartTime DATETIME NOT NULL,
+  WallDuration INT NOT NULL,
+  CpuDuration INT,
+  CpuCount INT,
+  NetworkInbound INT,
+  NetworkOutbound INT,
+  PublicIPCount INT,
+  Memory INT,
+  Disk INT,
+  BenchmarkType VARCHAR(50) NOT NULL,
+  Benchmark DECIMAL(10,3) NOT NULL,
+  ImageId VARCHAR(255),
+  CloudType VARCHAR(255),
+
+  MeasurementTime DATETIME NOT NULL,
+  Year INT NOT NULL,
+  Month INT NOT NULL,
+  Day INT NOT NULL,
+
+  INDEX index_vmuuidyearmonthday USING BTREE (VMUUID, Year, Month, Day),
+  INDEX index_vmuuidmeasurementtime USING BTREE (VMUUID, MeasurementTime),
+  INDEX index_yearmonthday USING BTREE (Year, Month, Day)
+);
+
+-- Summarise the VMs in CloudRecords into CloudSummaries.
+--
+-- Only the days with records that have been updated since the last run,
+-- as recorded in LastUpdated under the type 'SummariseVMs', are summarised
+-- again, along with the next day each of those VMs was measured on, as its
+-- usage on that day is calculated from the last record of the day before.
+-- If there is no such entry in LastUpdated, every day is summarised.
 DROP PROCEDURE IF EXISTS SummariseVMs;
 DELIMITER //
 CREATE PROCEDURE SummariseVMs()
 BEGIN
+DECLARE watermark TIMESTAMP DEFAULT NULL;
+DECLARE runStart TIMESTAMP DEFAULT NULL;
+
+SET runStart = NOW();
+SET watermark = (SELECT UpdateTime FROM LastUpdated WHERE Type = 'SummariseVMs');
+
+IF watermark IS NULL THEN
+    TRUNCATE TABLE LastCloudRecordPerDay;
+END IF;
+
+DROP TEMPORARY TABLE IF EXISTS TChangedCloudRecords, TChangedVMDays,
+    TCloudRecordsWithMeasurementTime, TGreatestMeasurementTimePerDay,
+    TAffectedDays, TAffectedVMs, TVMUsagePerDay;
+
+-- Records updated since the last run. Records with an UpdateTime equal to
+-- the watermark are included, as they may have been updated after the last
+-- run started but within the same second.
+CREATE TEMPORARY TABLE TChangedCloudRecords
+SELECT VMUUID, TIMESTAMPADD(SECOND, (IFNULL(SuspendDuration, 0) + WallDuration), StartTime) as MeasurementTime
+FROM CloudRecords
+WHERE watermark IS NULL OR UpdateTime >= watermark;
+
+CREATE TEMPORARY TABLE TChangedVMDays
+(PRIMARY KEY (VMUUID, Year, Month, Day))
+SELECT DISTINCT
+	VMUUID,
+	Year(MeasurementTime) as Year,
+	Month(MeasurementTime) as Month,
+	Day(MeasurementTime) as Day
+	from TChangedCloudRecords
+;
+
+-- Every record of the VMs with changes, as any of their records could be
+-- the last record of a changed day.
 CREATE TEMPORARY TABLE TCloudRecordsWithMeasurementTime
-(INDEX index_measurementtime USING BTREE (MeasurementTime))
-SELECT *, TIMESTAMPADD(SECOND, (IFNULL(SuspendDuration, 0) + WallDuration), StartTime) as MeasurementTime FROM CloudRecords;
+(INDEX index_vmuuidyearmonthday USING BTREE (VMUUID, Year, Month, Day))
+SELECT
+	measured.*,
+	Year(measured.MeasurementTime) as Year,
+	Month(measured.MeasurementTime) as Month,
+	Day(measured.MeasurementTime) as Day
+	from (
+		SELECT *, TIMESTAMPADD(SECOND, (IFNULL(SuspendDuration, 0) + WallDuration), StartTime) as MeasurementTime
+		FROM CloudRecords
+		WHERE VMUUID IN (SELECT VMUUID FROM TChangedVMDays)
+	) as measured
+;
 
 CREATE TEMPORARY TABLE TGreatestMeasurementTimePerDay
-(INDEX index_greatestmeasurementtime USING BTREE (MaxMT))
-select 
-	Year(MeasurementTime) as Year, 
-	Month(MeasurementTime) as Month, 
-        Day(MeasurementTime) as Day,
-	VMUUID, 
-	max(MeasurementTime) as MaxMT 
-	from TCloudRecordsWithMeasurementTime 
-	group by 
-		Year(MeasurementTime), 
-		Month(MeasurementTime), 
-                Day(MeasurementTime),
-		VMUUID
-;
-DROP TABLE IF EXISTS LastCloudRecordPerDay;
-CREATE TABLE LastCloudRecordPerDay
 (INDEX index_vmuuidyearmonthday USING BTREE (VMUUID, Year, Month, Day))
-SELECT 
-	a.*, 
-	Year(a.MeasurementTime) as Year, 
-	Month(a.MeasurementTime) as Month, 
-        Day(a.MeasurementTime) as Day
-	from TCloudRecordsWithMeasurementTime as a 
-	left join 
-	TGreatestMeasurementTimePerDay as b 
+select
+	a.Year,
+	a.Month,
+	a.Day,
+	a.VMUUID,
+	max(a.MeasurementTime) as MaxMT
+	from TCloudRecordsWithMeasurementTime as a
+	join TChangedVMDays as changed
 	on (
-		Year(a.MeasurementTime) = b.Year and 
-		Month(a.MeasurementTime) = b.Month and
-                Day(a.MeasurementTime) = b.Day and                                  
-	        a.VMUUID = b.VMUUID
-	)       
-	where a.MeasurementTime = b.MaxMT
-	
-	ORDER BY a.VMUUID, Year(a.MeasurementTime), Month(a.MeasurementTime), Day(a.MeasurementTime)
+		a.VMUUID = changed.VMUUID and
+		a.Year = changed.Year and
+		a.Month = changed.Month and
+		a.Day = changed.Day
+	)
+	group by
+		a.Year,
+		a.Month,
+		a.Day,
+		a.VMUUID
 ;
 
--- Based on discussion here: http://stackoverflow.com/questions/13196190/mysql-subtracting-value-from-previous-row-group-by
+-- Replace the last record of each changed day.
+DELETE last FROM LastCloudRecordPerDay as last
+JOIN TChangedVMDays as changed
+ON (
+	last.VMUUID = changed.VMUUID and
+	last.Year = changed.Year and
+	last.Month = changed.Month and
+	last.Day = changed.Day
+);
 
-CREATE TEMPORARY TABLE TVMUsagePerDay
-(INDEX index_VMUsagePerDay USING BTREE (VMUUID, Day, Month, Year))
+INSERT INTO LastCloudRecordPerDay(VMUUID, SiteID, CloudComputeServiceID,
+    GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, StartTime,
+    WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound,
+    PublicIPCount, Memory, Disk, BenchmarkType, Benchmark, ImageId, CloudType,
+    MeasurementTime, Year, Month, Day)
 SELECT
-	ThisRecord.VMUUID as VMUUID,
-	ThisRecord.SiteID as SiteID,
-	ThisRecord.CloudComputeServiceID as CloudComputeServiceID,
-	ThisRecord.Day as Day,
-	ThisRecord.Month as Month,
-	ThisRecord.Year as Year,
-	ThisRecord.GlobalUserNameID as GlobalUserNameID,
-	ThisRecord.VOID as VOID,
-	ThisRecord.VOGroupID as VOGroupID,
-	ThisRecord.VORoleID as VORoleID,
-	ThisRecord.Status as Status,
-	ThisRecord.CloudType as CloudType,
-	ThisRecord.ImageId as ImageId,
-	ThisRecord.StartTime as StartTime,
-	COALESCE(ThisRecord.WallDuration - IFNULL(PrevRecord.WallDuration, 0.00)) AS ComputedWallDuration,
-	COALESCE(ThisRecord.CpuDuration - IFNULL(PrevRecord.CpuDuration, 0.00)) AS ComputedCpuDuration,
-	ThisRecord.CpuCount as CpuCount,
-	COALESCE(ThisRecord.NetworkInbound - IFNULL(PrevRecord.NetworkInbound, 0.00)) AS ComputedNetworkInbound,
-	COALESCE(ThisRecord.NetworkOutbound - IFNULL(PrevRecord.NetworkOutbound, 0.00)) AS ComputedNetworkOutbound,
-	ThisRecord.PublicIPCount as PublicIPCount,
-	-- Will Memory change during the course of the VM lifetime? If so, do we report a maximum, or
-	-- average, or something else?
-	-- If it doesn't change:
-	ThisRecord.Memory,
-	ThisRecord.Disk, -- As above: constant or changing?
-	ThisRecord.BenchmarkType as BenchmarkType,
-	ThisRecord.Benchmark as Benchmark
-FROM	LastCloudRecordPerDay as ThisRecord
-LEFT JOIN LastCloudRecordPerDay as PrevRecord
-ON 	(ThisRecord.VMUUID = PrevRecord.VMUUID and
-	PrevRecord.MeasurementTime = (SELECT max(MeasurementTime)
-					FROM LastCloudRecordPerDay
-					WHERE VMUUID = ThisRecord.VMUUID
-					AND MeasurementTime < ThisRecord.MeasurementTime)
-	);
+	a.VMUUID, a.SiteID, a.CloudComputeServiceID,
+	a.GlobalUserNameID, a.VOID, a.VOGroupID, a.VORoleID, a.Status, a.StartTime,
+	a.WallDuration, a.CpuDuration, a.CpuCount, a.NetworkInbound, a.NetworkOutbound,
+	a.PublicIPCount, a.Memory, a.Disk, a.BenchmarkType, a.Benchmark, a.ImageId, a.CloudType,
+	a.MeasurementTime, a.Year, a.Month, a.Day
+	from TCloudRecordsWithMeasurementTime as a
+	join TGreatestMeasurementTimePerDay as b
+	on (
+		a.Year = b.Year and
+		a.Month = b.Month and
+		a.Day = b.Day and
+		a.VMUUID = b.VMUUID
+	)
+	where a.MeasurementTime = b.MaxMT
+;
+
+-- The days to summarise again: each changed day, plus the next day
+-- each VM with a changed day was measured on.
+CREATE TEMPORARY TABLE TAffectedDays
+(PRIMARY KEY (Year, Month, Day))
+SELECT DISTINCT Year, Month, Day FROM TChangedVMDays;
+
+INSERT IGNORE INTO TAffectedDays(Year, Month, Day)
+SELECT Year(NextMT), Month(NextMT), Day(NextMT)
+FROM (
+	SELECT min(following.MeasurementTime) as NextMT
+	FROM TChangedVMDays as changed
+	JOIN LastCloudRecordPerDay as following
+	ON (
+		following.VMUUID = changed.VMUUID and
+		-- i.e. at or after the start of the day after the changed day
+		following.MeasurementTime >= MAKEDATE(changed.Year, 1) + INTERVAL (changed.Month - 1) MONTH + INTERVAL changed.Day DAY
+	)
+	GROUP BY changed.VMUUID, changed.Year, changed.Month, changed.Day
+) as nextdays;
+
+-- The VMs measured on an affected day. Their usage is calculated from
+-- their previous record, which may be on any earlier day.
+CREATE TEMPORARY TABLE TAffectedVMs
+(PRIMARY KEY (VMUUID))
+SELECT DISTINCT last.VMUUID
+FROM LastCloudRecordPerDay as last
+JOIN TAffectedDays as Affected
+ON (last.Year = Affected.Year and
+    last.Month = Affected.Month and
+    last.Day = Affected.Day);
+
+CREATE TEMPORARY TABLE TVMUsagePerDay (
+  VMUUID VARCHAR(255) NOT NULL,
+  SiteID INT NOT NULL,
+  CloudComputeServiceID INT NOT NULL,
+  Day INT NOT NULL,
+  Month INT NOT NULL,
+  Year INT NOT NULL,
+  GlobalUserNameID INT NOT NULL,
+  VOID INT NOT NULL,
+  VOGroupID INT NOT NULL,
+  VORoleID INT NOT NULL,
+  Status VARCHAR(255),
+  CloudType VARCHAR(255),
+  ImageId VARCHAR(255),
+  StartTime DATETIME NOT NULL,
+  ComputedWallDuration BIGINT,
+  ComputedCpuDuration BIGINT,
+  CpuCount INT,
+  ComputedNetworkInbound BIGINT,
+  ComputedNetworkOutbound BIGINT,
+  PublicIPCount INT,
+  Memory INT,
+  Disk INT,
+  BenchmarkType VARCHAR(50) NOT NULL,
+  Benchmark DECIMAL(10,3) NOT NULL,
+
+  INDEX index_VMUsagePerDay USING BTREE (VMUUID, Day, Month, Year)
+);
+
+-- Based on discussion here: http://stackoverflow.com/questions/13196190/mysql-subtracting-value-from-previous-row-group-by
+-- Each record of an affected VM is compared to the record before it in a
+-- single pass over the VM's records, in MeasurementTime order, that keeps
+-- the previous record in variables. The order of a cursor is defined,
+-- unlike the order user variables in a SELECT are read and set in. Only
+-- the records on affected days are kept.
+BEGIN
+    DECLARE done BOOLEAN DEFAULT FALSE;
+    DECLARE isAffected BOOLEAN;
+    DECLARE thisVMUUID, prevVMUUID VARCHAR(255) DEFAULT NULL;
+    DECLARE thisSiteID, thisCloudComputeServiceID, thisDay, thisMonth,
+        thisYear, thisGlobalUserNameID, thisVOID, thisVOGroupID,
+        thisVORoleID INT;
+    DECLARE thisStatus, thisCloudType, thisImageId VARCHAR(255);
+    DECLARE thisStartTime DATETIME;
+    DECLARE thisWallDuration, thisCpuDuration, thisCpuCount,
+        thisNetworkInbound, thisNetworkOutbound, thisPublicIPCount,
+        thisMemory, thisDisk INT;
+    DECLARE prevWallDuration, prevCpuDuration, prevNetworkInbound,
+        prevNetworkOutbound INT DEFAULT NULL;
+    DECLARE thisBenchmarkType VARCHAR(50);
+    DECLARE thisBenchmark DECIMAL(10,3);
+
+    DECLARE records CURSOR FOR
+        SELECT last.VMUUID, last.SiteID, last.CloudComputeServiceID,
+            last.Day, last.Month, last.Year, last.GlobalUserNameID,
+            last.VOID, last.VOGroupID, last.VORoleID, last.Status,
+            last.CloudType, last.ImageId, last.StartTime, last.WallDuration,
+            last.CpuDuration, last.CpuCount, last.NetworkInbound,
+            last.NetworkOutbound, last.PublicIPCount, last.Memory, last.Disk,
+            last.BenchmarkType, last.Benchmark,
+            Affected.Year IS NOT NULL
+        FROM LastCloudRecordPerDay as last
+        JOIN TAffectedVMs as AffectedVM
+        ON (last.VMUUID = AffectedVM.VMUUID)
+        LEFT JOIN TAffectedDays as Affected
+        ON (last.Year = Affected.Year and
+            last.Month = Affected.Month and
+            last.Day = Affected.Day)
+        ORDER BY last.VMUUID, last.MeasurementTime;
+
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = TRUE;
+
+    OPEN records;
+
+    read_records: LOOP
+        FETCH records INTO thisVMUUID, thisSiteID, thisCloudComputeServiceID,
+            thisDay, thisMonth, thisYear, thisGlobalUserNameID, thisVOID,
+            thisVOGroupID, thisVORoleID, thisStatus, thisCloudType,
+            thisImageId, thisStartTime, thisWallDuration, thisCpuDuration,
+            thisCpuCount, thisNetworkInbound, thisNetworkOutbound,
+            thisPublicIPCount, thisMemory, thisDisk, thisBenchmarkType,
+            thisBenchmark, isAffected;
+
+        IF done THEN
+            LEAVE read_records;
+        END IF;
+
+        -- The first record of a VM has no previous record.
+        IF prevVMUUID IS NULL OR prevVMUUID != thisVMUUID THEN
+            SET prevWallDuration = NULL, prevCpuDuration = NULL,
+                prevNetworkInbound = NULL, prevNetworkOutbound = NULL;
+        END IF;
+
+        IF isAffected THEN
+            -- Will Memory change during the course of the VM lifetime? If
+            -- so, do we report a maximum, or average, or something else?
+            -- If it doesn't change, the last Memory and Disk are used.
+            INSERT INTO TVMUsagePerDay VALUES (thisVMUUID, thisSiteID,
+                thisCloudComputeServiceID, thisDay, thisMonth, thisYear,
+                thisGlobalUserNameID, thisVOID, thisVOGroupID, thisVORoleID,
+                thisStatus, thisCloudType, thisImageId, thisStartTime,
+                thisWallDuration - IFNULL(prevWallDuration, 0),
+                thisCpuDuration - IFNULL(prevCpuDuration, 0),
+                thisCpuCount,
+                thisNetworkInbound - IFNULL(prevNetworkInbound, 0),
+                thisNetworkOutbound - IFNULL(prevNetworkOutbound, 0),
+                thisPublicIPCount, thisMemory, thisDisk, thisBenchmarkType,
+                thisBenchmark);
+        END IF;
+
+        SET prevVMUUID = thisVMUUID,
+            prevWallDuration = thisWallDuration,
+            prevCpuDuration = thisCpuDuration,
+            prevNetworkInbound = thisNetworkInbound,
+            prevNetworkOutbound = thisNetworkOutbound;
+    END LOOP;
+
+    CLOSE records;
+END;
+
+    -- Replace the summaries of the affected days in one transaction, so
+    -- they are never seen half replaced.
+    START TRANSACTION;
+
+    -- Remove the summariser's summaries of the affected days first,
+    -- in case any of them no longer apply, e.g. a VM changed Status.
+    DELETE summary FROM CloudSummaries as summary
+    JOIN TAffectedDays as Affected
+    ON (summary.Year = Affected.Year and
+        summary.Month = Affected.Month and
+        summary.Day = Affected.Day)
+    WHERE summary.PublisherDNID = 'summariser';
 
     REPLACE INTO CloudSummaries(SiteID, CloudComputeServiceID, Day, Month, Year,
         GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, CloudType, ImageId,
@@ -272,6 +512,31 @@ ON 	(ThisRecord.VMUUID = PrevRecord.VMUUID and
         VOGroupID, VORoleID, Status, CloudType, ImageId, CpuCount,
         BenchmarkType, Benchmark
     ORDER BY NULL;
+
+    IF watermark IS NOT NULL THEN
+        CALL RefreshMaterialisedCloudSummaryDays();
+        CALL RefreshCloudSummaryRollupMonths();
+
+        -- The next run picks up any records updated after this one started.
+        REPLACE INTO LastUpdated (UpdateTime, Type) VALUES (runStart, 'SummariseVMs');
+    END IF;
+
+    COMMIT;
+
+    -- A full run rebuilds the copies of the summaries outside the
+    -- transaction, so it is only recorded in LastUpdated, which readers
+    -- use to tell when the summaries change, once they are rebuilt.
+    IF watermark IS NULL THEN
+        CALL RefreshMaterialisedCloudSummaries();
+        CALL RefreshCloudSummaryRollups();
+
+        REPLACE INTO LastUpdated (UpdateTime, Type) VALUES (runStart, 'SummariseVMs');
+        COMMIT;
+    END IF;
+
+    DROP TEMPORARY TABLE IF EXISTS TChangedCloudRecords, TChangedVMDays,
+        TCloudRecordsWithMeasurementTime, TGreatestMeasurementTimePerDay,
+        TAffectedDays, TAffectedVMs, TVMUsagePerDay;
 END //
 DELIMITER ;
 
@@ -495,3 +760,527 @@ CREATE VIEW VCloudSummaries AS
         AND VORoleID = vorole.id;
 
 
+-- -----------------------------------------------------------------------------
+-- Materialised CloudSummaries
+
+-- A copy of VCloudSummaries, with the names already resolved, so that the
+-- REST API can filter summaries by name using the indexes below rather than
+-- joining CloudSummaries against every lookup table on each request.
+DROP TABLE IF EXISTS MaterialisedCloudSummaries;
+CREATE TABLE MaterialisedCloudSummaries (
+  UpdateTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  SiteID INT NOT NULL,
+  SiteName VARCHAR(255) NOT NULL,
+  CloudComputeService VARCHAR(255) NOT NULL,
+
+  Day INT NOT NULL,
+  Month INT NOT NULL,
+  Year INT NOT NULL,
+
+  GlobalUserNameID INT NOT NULL,
+  GlobalUserName VARCHAR(255) NOT NULL,
+  VOID INT NOT NULL,
+  VO VARCHAR(255) NOT NULL,
+  VOGroupID INT NOT NULL,
+  VOGroup VARCHAR(255) NOT NULL,
+  VORoleID INT NOT NULL,
+  VORole VARCHAR(255) NOT NULL,
+
+  Status VARCHAR(255),
+  CloudType VARCHAR(255),
+  ImageId VARCHAR(255),
+
+  EarliestStartTime DATETIME,
+  LatestStartTime DATETIME,
+  WallDuration BIGINT,
+  CpuDuration BIGINT,
+  CpuCount INT,
+
+  NetworkInbound BIGINT,
+  NetworkOutbound BIGINT,
+  PublicIPCount BIGINT,
+  Memory BIGINT,
+  Disk BIGINT,
+
+  BenchmarkType VARCHAR(50) NOT NULL,
+  Benchmark DECIMAL(10,3) NOT NULL,
+
+  NumberOfVMs INT,
+
+  -- The same key as CloudSummaries.
+  PRIMARY KEY (SiteID, Day, Month, Year, GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, CloudType, ImageId),
+
+  -- One index per filter the REST API supports, i.e. user, group, service
+  -- or none, each followed by the start time range it is combined with.
+  -- A filter with many values is a range scan over each value's part of
+  -- its index, and when filters are combined MySQL uses the most selective.
+  INDEX index_user_starttime (GlobalUserName, EarliestStartTime, LatestStartTime),
+  INDEX index_group_starttime (VOGroup, EarliestStartTime, LatestStartTime),
+  INDEX index_site_starttime (SiteName, EarliestStartTime, LatestStartTime),
+  INDEX index_starttime (EarliestStartTime),
+
+  -- The REST API returns summaries in this order, see SummaryQuery.ORDER_BY,
+  -- so one index per filter leads with the filter and is then in that
+  -- order. A page of summaries with no filter, or one value for a filter,
+  -- is read from its index starting at the page's key, without a sort.
+  -- The filtered column is left out, as the filter makes it constant.
+  INDEX index_order (Year, Month, Day, SiteName, GlobalUserName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+  INDEX index_user_order (GlobalUserName, Year, Month, Day, SiteName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+  INDEX index_group_order (VOGroup, Year, Month, Day, SiteName, GlobalUserName, VO, VORole, Status, CloudType, ImageId),
+  INDEX index_site_order (SiteName, Year, Month, Day, GlobalUserName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+
+  -- Used by SummariseVMs to replace the summaries of a day.
+  INDEX index_yearmonthday (Year, Month, Day)
+);
+
+-- Rebuild MaterialisedCloudSummaries from CloudSummaries.
+-- The new copy is built alongside the old one and swapped in atomically,
+-- so the REST API never sees a partially refreshed table.
+DROP PROCEDURE IF EXISTS RefreshMaterialisedCloudSummaries;
+DELIMITER //
+CREATE PROCEDURE RefreshMaterialisedCloudSummaries()
+BEGIN
+    DROP TABLE IF EXISTS MaterialisedCloudSummariesNew, MaterialisedCloudSummariesOld;
+    CREATE TABLE MaterialisedCloudSummariesNew LIKE MaterialisedCloudSummaries;
+
+    INSERT INTO MaterialisedCloudSummariesNew(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Day, Month, Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT UpdateTime, SiteID, site.name, cloudComputeService.name, Day, Month, Year,
+           GlobalUserNameID, userdn.name, VOID, vo.name, VOGroupID, vogroup.name,
+           VORoleID, vorole.name, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+           WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+           Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs
+    FROM CloudSummaries, Sites site, CloudComputeServices cloudComputeService, DNs userdn, VOs vo, VOGroups vogroup, VORoles vorole WHERE
+        SiteID = site.id
+        AND CloudComputeServiceID = cloudComputeService.id
+        AND GlobalUserNameID = userdn.id
+        AND VOID = vo.id
+        AND VOGroupID = vogroup.id
+        AND VORoleID = vorole.id;
+
+    RENAME TABLE MaterialisedCloudSummaries TO MaterialisedCloudSummariesOld,
+                 MaterialisedCloudSummariesNew TO MaterialisedCloudSummaries;
+    DROP TABLE MaterialisedCloudSummariesOld;
+END //
+DELIMITER ;
+
+-- Copy a single summary from CloudSummaries into MaterialisedCloudSummaries.
+DROP PROCEDURE IF EXISTS RefreshMaterialisedCloudSummary;
+DELIMITER //
+CREATE PROCEDURE RefreshMaterialisedCloudSummary(
+  siteID INT, day INT, month INT, year INT, globalUserNameID INT, voID INT,
+  voGroupID INT, voRoleID INT, status VARCHAR(255), cloudType VARCHAR(255),
+  imageId VARCHAR(255))
+BEGIN
+    REPLACE INTO MaterialisedCloudSummaries(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Day, Month, Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT summary.UpdateTime, summary.SiteID, site.name, cloudComputeService.name,
+           summary.Day, summary.Month, summary.Year,
+           summary.GlobalUserNameID, userdn.name, summary.VOID, vo.name,
+           summary.VOGroupID, vogroup.name, summary.VORoleID, vorole.name,
+           summary.Status, summary.CloudType, summary.ImageId,
+           summary.EarliestStartTime, summary.LatestStartTime,
+           summary.WallDuration, summary.CpuDuration, summary.CpuCount,
+           summary.NetworkInbound, summary.NetworkOutbound, summary.PublicIPCount,
+           summary.Memory, summary.Disk, summary.BenchmarkType, summary.Benchmark,
+           summary.NumberOfVMs
+    FROM CloudSummaries summary, Sites site, CloudComputeServices cloudComputeService, DNs userdn, VOs vo, VOGroups vogroup, VORoles vorole WHERE
+        summary.SiteID = siteID
+        AND summary.Day = day
+        AND summary.Month = month
+        AND summary.Year = year
+        AND summary.GlobalUserNameID = globalUserNameID
+        AND summary.VOID = voID
+        AND summary.VOGroupID = voGroupID
+        AND summary.VORoleID = voRoleID
+        AND summary.Status = status
+        AND summary.CloudType = cloudType
+        AND summary.ImageId = imageId
+        AND summary.SiteID = site.id
+        AND summary.CloudComputeServiceID = cloudComputeService.id
+        AND summary.GlobalUserNameID = userdn.id
+        AND summary.VOID = vo.id
+        AND summary.VOGroupID = vogroup.id
+        AND summary.VORoleID = vorole.id;
+END //
+DELIMITER ;
+
+-- Copy the summaries of the days in the temporary table TAffectedDays,
+-- created by SummariseVMs, from CloudSummaries into MaterialisedCloudSummaries.
+DROP PROCEDURE IF EXISTS RefreshMaterialisedCloudSummaryDays;
+DELIMITER //
+CREATE PROCEDURE RefreshMaterialisedCloudSummaryDays()
+BEGIN
+    DELETE materialised FROM MaterialisedCloudSummaries materialised
+    JOIN TAffectedDays affected
+    ON (materialised.Year = affected.Year
+        AND materialised.Month = affected.Month
+        AND materialised.Day = affected.Day);
+
+    INSERT INTO MaterialisedCloudSummaries(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Day, Month, Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT summary.UpdateTime, summary.SiteID, site.name, cloudComputeService.name,
+           summary.Day, summary.Month, summary.Year,
+           summary.GlobalUserNameID, userdn.name, summary.VOID, vo.name,
+           summary.VOGroupID, vogroup.name, summary.VORoleID, vorole.name,
+           summary.Status, summary.CloudType, summary.ImageId,
+           summary.EarliestStartTime, summary.LatestStartTime,
+           summary.WallDuration, summary.CpuDuration, summary.CpuCount,
+           summary.NetworkInbound, summary.NetworkOutbound, summary.PublicIPCount,
+           summary.Memory, summary.Disk, summary.BenchmarkType, summary.Benchmark,
+           summary.NumberOfVMs
+    FROM CloudSummaries summary
+    JOIN TAffectedDays affected
+    ON (summary.Year = affected.Year
+        AND summary.Month = affected.Month
+        AND summary.Day = affected.Day),
+    Sites site, CloudComputeServices cloudComputeService, DNs userdn, VOs vo, VOGroups vogroup, VORoles vorole WHERE
+        summary.SiteID = site.id
+        AND summary.CloudComputeServiceID = cloudComputeService.id
+        AND summary.GlobalUserNameID = userdn.id
+        AND summary.VOID = vo.id
+        AND summary.VOGroupID = vogroup.id
+        AND summary.VORoleID = vorole.id;
+END //
+DELIMITER ;
+
+
+-- ------------------------------------------------------------------------------
+-- Cloud Summary Rollups
+
+-- MaterialisedCloudSummaries rolled up by month, and by year, so that the
+-- REST API can answer a request for monthly or yearly summaries without
+-- reading every daily summary in the period. Each metric is the sum of the
+-- daily values, so the totals of a rollup match those of the days it covers.
+DROP TABLE IF EXISTS CloudMonthlySummaries;
+CREATE TABLE CloudMonthlySummaries (
+  UpdateTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  SiteID INT NOT NULL,
+  SiteName VARCHAR(255) NOT NULL,
+  CloudComputeService VARCHAR(255) NOT NULL,
+
+  Month INT NOT NULL,
+  Year INT NOT NULL,
+
+  GlobalUserNameID INT NOT NULL,
+  GlobalUserName VARCHAR(255) NOT NULL,
+  VOID INT NOT NULL,
+  VO VARCHAR(255) NOT NULL,
+  VOGroupID INT NOT NULL,
+  VOGroup VARCHAR(255) NOT NULL,
+  VORoleID INT NOT NULL,
+  VORole VARCHAR(255) NOT NULL,
+
+  Status VARCHAR(255),
+  CloudType VARCHAR(255),
+  ImageId VARCHAR(255),
+
+  EarliestStartTime DATETIME,
+  LatestStartTime DATETIME,
+  WallDuration BIGINT,
+  CpuDuration BIGINT,
+  CpuCount BIGINT,
+
+  NetworkInbound BIGINT,
+  NetworkOutbound BIGINT,
+  PublicIPCount BIGINT,
+  Memory BIGINT,
+  Disk BIGINT,
+
+  BenchmarkType VARCHAR(50) NOT NULL,
+  Benchmark DECIMAL(10,3) NOT NULL,
+
+  NumberOfVMs BIGINT,
+
+  -- The key of CloudSummaries, without Day.
+  PRIMARY KEY (SiteID, Month, Year, GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, CloudType, ImageId),
+
+  -- The same filter indexes as MaterialisedCloudSummaries.
+  INDEX index_user_starttime (GlobalUserName, EarliestStartTime, LatestStartTime),
+  INDEX index_group_starttime (VOGroup, EarliestStartTime, LatestStartTime),
+  INDEX index_site_starttime (SiteName, EarliestStartTime, LatestStartTime),
+  INDEX index_starttime (EarliestStartTime),
+
+  -- The same order indexes as MaterialisedCloudSummaries, without Day.
+  INDEX index_order (Year, Month, SiteName, GlobalUserName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+  INDEX index_user_order (GlobalUserName, Year, Month, SiteName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+  INDEX index_group_order (VOGroup, Year, Month, SiteName, GlobalUserName, VO, VORole, Status, CloudType, ImageId),
+  INDEX index_site_order (SiteName, Year, Month, GlobalUserName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+
+  -- Used to replace the rollups of a month.
+  INDEX index_yearmonth (Year, Month)
+);
+
+DROP TABLE IF EXISTS CloudYearlySummaries;
+CREATE TABLE CloudYearlySummaries (
+  UpdateTime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+  SiteID INT NOT NULL,
+  SiteName VARCHAR(255) NOT NULL,
+  CloudComputeService VARCHAR(255) NOT NULL,
+
+  Year INT NOT NULL,
+
+  GlobalUserNameID INT NOT NULL,
+  GlobalUserName VARCHAR(255) NOT NULL,
+  VOID INT NOT NULL,
+  VO VARCHAR(255) NOT NULL,
+  VOGroupID INT NOT NULL,
+  VOGroup VARCHAR(255) NOT NULL,
+  VORoleID INT NOT NULL,
+  VORole VARCHAR(255) NOT NULL,
+
+  Status VARCHAR(255),
+  CloudType VARCHAR(255),
+  ImageId VARCHAR(255),
+
+  EarliestStartTime DATETIME,
+  LatestStartTime DATETIME,
+  WallDuration BIGINT,
+  CpuDuration BIGINT,
+  CpuCount BIGINT,
+
+  NetworkInbound BIGINT,
+  NetworkOutbound BIGINT,
+  PublicIPCount BIGINT,
+  Memory BIGINT,
+  Disk BIGINT,
+
+  BenchmarkType VARCHAR(50) NOT NULL,
+  Benchmark DECIMAL(10,3) NOT NULL,
+
+  NumberOfVMs BIGINT,
+
+  -- The key of CloudSummaries, without Day and Month.
+  PRIMARY KEY (SiteID, Year, GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, CloudType, ImageId),
+
+  -- The same filter indexes as MaterialisedCloudSummaries.
+  INDEX index_user_starttime (GlobalUserName, EarliestStartTime, LatestStartTime),
+  INDEX index_group_starttime (VOGroup, EarliestStartTime, LatestStartTime),
+  INDEX index_site_starttime (SiteName, EarliestStartTime, LatestStartTime),
+  INDEX index_starttime (EarliestStartTime),
+
+  -- The same order indexes as MaterialisedCloudSummaries, without Day and
+  -- Month.
+  INDEX index_order (Year, SiteName, GlobalUserName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+  INDEX index_user_order (GlobalUserName, Year, SiteName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+  INDEX index_group_order (VOGroup, Year, SiteName, GlobalUserName, VO, VORole, Status, CloudType, ImageId),
+  INDEX index_site_order (SiteName, Year, GlobalUserName, VO, VOGroup, VORole, Status, CloudType, ImageId),
+
+  -- Used to replace the rollups of a year.
+  INDEX index_year (Year)
+);
+
+-- Rebuild CloudMonthlySummaries and CloudYearlySummaries from
+-- MaterialisedCloudSummaries. As with RefreshMaterialisedCloudSummaries,
+-- the new copies are built alongside the old ones and swapped in atomically.
+DROP PROCEDURE IF EXISTS RefreshCloudSummaryRollups;
+DELIMITER //
+CREATE PROCEDURE RefreshCloudSummaryRollups()
+BEGIN
+    DROP TABLE IF EXISTS CloudMonthlySummariesNew, CloudMonthlySummariesOld,
+        CloudYearlySummariesNew, CloudYearlySummariesOld;
+    CREATE TABLE CloudMonthlySummariesNew LIKE CloudMonthlySummaries;
+    CREATE TABLE CloudYearlySummariesNew LIKE CloudYearlySummaries;
+
+    INSERT INTO CloudMonthlySummariesNew(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Month, Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT MAX(UpdateTime), SiteID, SiteName, MAX(CloudComputeService), Month, Year,
+           GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+           VORoleID, VORole, Status, CloudType, ImageId,
+           MIN(EarliestStartTime), MAX(LatestStartTime),
+           SUM(WallDuration), SUM(CpuDuration), SUM(CpuCount),
+           SUM(NetworkInbound), SUM(NetworkOutbound), SUM(PublicIPCount),
+           SUM(Memory), SUM(Disk), MAX(BenchmarkType), MAX(Benchmark),
+           SUM(NumberOfVMs)
+    FROM MaterialisedCloudSummaries
+    GROUP BY SiteID, SiteName, Month, Year, GlobalUserNameID, GlobalUserName,
+        VOID, VO, VOGroupID, VOGroup, VORoleID, VORole, Status, CloudType, ImageId;
+
+    -- Years are rolled up from the (at most twelve) months of each year.
+    INSERT INTO CloudYearlySummariesNew(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT MAX(UpdateTime), SiteID, SiteName, MAX(CloudComputeService), Year,
+           GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+           VORoleID, VORole, Status, CloudType, ImageId,
+           MIN(EarliestStartTime), MAX(LatestStartTime),
+           SUM(WallDuration), SUM(CpuDuration), SUM(CpuCount),
+           SUM(NetworkInbound), SUM(NetworkOutbound), SUM(PublicIPCount),
+           SUM(Memory), SUM(Disk), MAX(BenchmarkType), MAX(Benchmark),
+           SUM(NumberOfVMs)
+    FROM CloudMonthlySummariesNew
+    GROUP BY SiteID, SiteName, Year, GlobalUserNameID, GlobalUserName,
+        VOID, VO, VOGroupID, VOGroup, VORoleID, VORole, Status, CloudType, ImageId;
+
+    RENAME TABLE CloudMonthlySummaries TO CloudMonthlySummariesOld,
+                 CloudMonthlySummariesNew TO CloudMonthlySummaries,
+                 CloudYearlySummaries TO CloudYearlySummariesOld,
+                 CloudYearlySummariesNew TO CloudYearlySummaries;
+    DROP TABLE CloudMonthlySummariesOld, CloudYearlySummariesOld;
+END //
+DELIMITER ;
+
+-- Roll up the months, and years, of the days in the temporary table
+-- TAffectedDays, created by SummariseVMs, again.
+DROP PROCEDURE IF EXISTS RefreshCloudSummaryRollupMonths;
+DELIMITER //
+CREATE PROCEDURE RefreshCloudSummaryRollupMonths()
+BEGIN
+    DROP TEMPORARY TABLE IF EXISTS TAffectedMonths, TAffectedYears;
+
+    CREATE TEMPORARY TABLE TAffectedMonths
+    (PRIMARY KEY (Year, Month))
+    SELECT DISTINCT Year, Month FROM TAffectedDays;
+
+    CREATE TEMPORARY TABLE TAffectedYears
+    (PRIMARY KEY (Year))
+    SELECT DISTINCT Year FROM TAffectedDays;
+
+    DELETE rollup FROM CloudMonthlySummaries rollup
+    JOIN TAffectedMonths affected
+    ON (rollup.Year = affected.Year
+        AND rollup.Month = affected.Month);
+
+    INSERT INTO CloudMonthlySummaries(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Month, Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT MAX(summary.UpdateTime), summary.SiteID, summary.SiteName,
+           MAX(summary.CloudComputeService), summary.Month, summary.Year,
+           summary.GlobalUserNameID, summary.GlobalUserName, summary.VOID, summary.VO,
+           summary.VOGroupID, summary.VOGroup, summary.VORoleID, summary.VORole,
+           summary.Status, summary.CloudType, summary.ImageId,
+           MIN(summary.EarliestStartTime), MAX(summary.LatestStartTime),
+           SUM(summary.WallDuration), SUM(summary.CpuDuration), SUM(summary.CpuCount),
+           SUM(summary.NetworkInbound), SUM(summary.NetworkOutbound),
+           SUM(summary.PublicIPCount), SUM(summary.Memory), SUM(summary.Disk),
+           MAX(summary.BenchmarkType), MAX(summary.Benchmark), SUM(summary.NumberOfVMs)
+    FROM MaterialisedCloudSummaries summary
+    JOIN TAffectedMonths affected
+    ON (summary.Year = affected.Year
+        AND summary.Month = affected.Month)
+    GROUP BY summary.SiteID, summary.SiteName, summary.Month, summary.Year,
+        summary.GlobalUserNameID, summary.GlobalUserName, summary.VOID, summary.VO,
+        summary.VOGroupID, summary.VOGroup, summary.VORoleID, summary.VORole,
+        summary.Status, summary.CloudType, summary.ImageId;
+
+    DELETE rollup FROM CloudYearlySummaries rollup
+    JOIN TAffectedYears affected
+    ON (rollup.Year = affected.Year);
+
+    INSERT INTO CloudYearlySummaries(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT MAX(rollup.UpdateTime), rollup.SiteID, rollup.SiteName,
+           MAX(rollup.CloudComputeService), rollup.Year,
+           rollup.GlobalUserNameID, rollup.GlobalUserName, rollup.VOID, rollup.VO,
+           rollup.VOGroupID, rollup.VOGroup, rollup.VORoleID, rollup.VORole,
+           rollup.Status, rollup.CloudType, rollup.ImageId,
+           MIN(rollup.EarliestStartTime), MAX(rollup.LatestStartTime),
+           SUM(rollup.WallDuration), SUM(rollup.CpuDuration), SUM(rollup.CpuCount),
+           SUM(rollup.NetworkInbound), SUM(rollup.NetworkOutbound),
+           SUM(rollup.PublicIPCount), SUM(rollup.Memory), SUM(rollup.Disk),
+           MAX(rollup.BenchmarkType), MAX(rollup.Benchmark), SUM(rollup.NumberOfVMs)
+    FROM CloudMonthlySummaries rollup
+    JOIN TAffectedYears affected
+    ON (rollup.Year = affected.Year)
+    GROUP BY rollup.SiteID, rollup.SiteName, rollup.Year,
+        rollup.GlobalUserNameID, rollup.GlobalUserName, rollup.VOID, rollup.VO,
+        rollup.VOGroupID, rollup.VOGroup, rollup.VORoleID, rollup.VORole,
+        rollup.Status, rollup.CloudType, rollup.ImageId;
+
+    DROP TEMPORARY TABLE IF EXISTS TAffectedMonths, TAffectedYears;
+END //
+DELIMITER ;
+
+-- Roll up the month, and year, of a single summary again, as changed by
+-- ReplaceCloudSummaryRecord.
+DROP PROCEDURE IF EXISTS RefreshCloudSummaryRollup;
+DELIMITER //
+CREATE PROCEDURE RefreshCloudSummaryRollup(
+  siteID INT, month INT, year INT, globalUserNameID INT, voID INT,
+  voGroupID INT, voRoleID INT, status VARCHAR(255), cloudType VARCHAR(255),
+  imageId VARCHAR(255))
+BEGIN
+    REPLACE INTO CloudMonthlySummaries(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Month, Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT MAX(summary.UpdateTime), summary.SiteID, summary.SiteName,
+           MAX(summary.CloudComputeService), summary.Month, summary.Year,
+           summary.GlobalUserNameID, summary.GlobalUserName, summary.VOID, summary.VO,
+           summary.VOGroupID, summary.VOGroup, summary.VORoleID, summary.VORole,
+           summary.Status, summary.CloudType, summary.ImageId,
+           MIN(summary.EarliestStartTime), MAX(summary.LatestStartTime),
+           SUM(summary.WallDuration), SUM(summary.CpuDuration), SUM(summary.CpuCount),
+           SUM(summary.NetworkInbound), SUM(summary.NetworkOutbound),
+           SUM(summary.PublicIPCount), SUM(summary.Memory), SUM(summary.Disk),
+           MAX(summary.BenchmarkType), MAX(summary.Benchmark), SUM(summary.NumberOfVMs)
+    FROM MaterialisedCloudSummaries summary WHERE
+        summary.SiteID = siteID
+        AND summary.Month = month
+        AND summary.Year = year
+        AND summary.GlobalUserNameID = globalUserNameID
+        AND summary.VOID = voID
+        AND summary.VOGroupID = voGroupID
+        AND summary.VORoleID = voRoleID
+        AND summary.Status = status
+        AND summary.CloudType = cloudType
+        AND summary.ImageId = imageId
+    GROUP BY summary.SiteID, summary.SiteName, summary.Month, summary.Year,
+        summary.GlobalUserNameID, summary.GlobalUserName, summary.VOID, summary.VO,
+        summary.VOGroupID, summary.VOGroup, summary.VORoleID, summary.VORole,
+        summary.Status, summary.CloudType, summary.ImageId;
+
+    REPLACE INTO CloudYearlySummaries(UpdateTime, SiteID, SiteName, CloudComputeService,
+        Year, GlobalUserNameID, GlobalUserName, VOID, VO, VOGroupID, VOGroup,
+        VORoleID, VORole, Status, CloudType, ImageId, EarliestStartTime, LatestStartTime,
+        WallDuration, CpuDuration, CpuCount, NetworkInbound, NetworkOutbound, PublicIPCount,
+        Memory, Disk, BenchmarkType, Benchmark, NumberOfVMs)
+    SELECT MAX(rollup.UpdateTime), rollup.SiteID, rollup.SiteName,
+           MAX(rollup.CloudComputeService), rollup.Year,
+           rollup.GlobalUserNameID, rollup.GlobalUserName, rollup.VOID, rollup.VO,
+           rollup.VOGroupID, rollup.VOGroup, rollup.VORoleID, rollup.VORole,
+           rollup.Status, rollup.CloudType, rollup.ImageId,
+           MIN(rollup.EarliestStartTime), MAX(rollup.LatestStartTime),
+           SUM(rollup.WallDuration), SUM(rollup.CpuDuration), SUM(rollup.CpuCount),
+           SUM(rollup.NetworkInbound), SUM(rollup.NetworkOutbound),
+           SUM(rollup.PublicIPCount), SUM(rollup.Memory), SUM(rollup.Disk),
+           MAX(rollup.BenchmarkType), MAX(rollup.Benchmark), SUM(rollup.NumberOfVMs)
+    FROM CloudMonthlySummaries rollup WHERE
+        rollup.SiteID = siteID
+        AND rollup.Year = year
+        AND rollup.GlobalUserNameID = globalUserNameID
+        AND rollup.VOID = voID
+        AND rollup.VOGroupID = voGroupID
+        AND rollup.VORoleID = voRoleID
+        AND rollup.Status = status
+        AND rollup.CloudType = cloudType
+        AND rollup.ImageId = imageId
+    GROUP BY rollup.SiteID, rollup.SiteName, rollup.Year,
+        rollup.GlobalUserNameID, rollup.GlobalUserName, rollup.VOID, rollup.VO,
+        rollup.VOGroupID, rollup.VOGroup, rollup.VORoleID, rollup.VORole,
+        rollup.Status, rollup.CloudType, rollup.ImageId;
+END //
+DELIMITER ;
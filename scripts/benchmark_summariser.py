@@ -0,0 +1,287 @@
+"""
+This module benchmarks SummariseVMs against an earlier version of it.
+
+Each day's usage of a VM is the difference between its last record on
+that day and its last record on the previous day it was measured.
+SummariseVMs used to find that previous record for every record on every
+run. It now only summarises the days affected by records changed since
+its last run, in one ordered pass over the records of the affected VMs.
+
+If run as a python script, this module loads the same synthetic set of
+CloudRecords into two scratch databases, one with the current
+schemas/10-cloud.sql applied and one with an earlier version of it, e.g.
+from git. It then times CALL SummariseVMs() in each and checks both
+produce identical CloudSummaries, first for all the records and then
+after one more measurement of every VM is added, as when run from cron.
+The cloud tables of both databases are emptied first.
+"""
+
+
+import argparse
+import datetime
+import logging
+import random
+import sys
+import time
+
+import MySQLdb
+
+log = logging.getLogger(__name__)
+
+RECORD_COLUMNS = ('VMUUID', 'SiteID', 'CloudComputeServiceID',
+                  'GlobalUserNameID', 'VOID', 'VOGroupID', 'VORoleID',
+                  'Status', 'StartTime', 'SuspendDuration', 'WallDuration',
+                  'CpuDuration', 'CpuCount', 'NetworkInbound',
+                  'NetworkOutbound', 'PublicIPCount', 'Memory', 'Disk',
+                  'BenchmarkType', 'Benchmark', 'ImageId', 'CloudType',
+                  'PublisherDNID')
+
+INSERT_RECORD = 'INSERT INTO CloudRecords (%s) VALUES (%s)' % (
+    ', '.join(RECORD_COLUMNS), ', '.join(['%s'] * len(RECORD_COLUMNS)))
+
+# The columns summaries are grouped by, which also identify a summary.
+SUMMARY_KEY = ('SiteID, CloudComputeServiceID, Day, Month, Year, '
+               'GlobalUserNameID, VOID, VOGroupID, VORoleID, Status, '
+               'CloudType, ImageId, CpuCount, BenchmarkType, Benchmark')
+
+# Every column of CloudSummaries, except UpdateTime, in a stable order.
+SELECT_SUMMARIES = ('SELECT ' + SUMMARY_KEY + ', EarliestStartTime, '
+                    'LatestStartTime, WallDuration, CpuDuration, '
+                    'NetworkInbound, NetworkOutbound, PublicIPCount, Memory, '
+                    'Disk, NumberOfVMs, PublisherDNID '
+                    'FROM CloudSummaries ORDER BY ' + SUMMARY_KEY)
+
+
+class SummariserBenchmark(object):
+    """Time SummariseVMs in two databases and compare their summaries."""
+
+    def __init__(self, old_database, new_database):
+        """
+        Initialize a SummariserBenchmark using the given connections.
+
+        old_database has an earlier version of the schema applied, and
+        new_database the current one.
+        """
+        self._old_database = old_database
+        self._new_database = new_database
+        self._records = 0
+        self._vms = 0
+        self._seed = 0
+
+    def load(self, records, vms, seed):
+        """
+        Replace the contents of both databases with synthetic records.
+
+        records are spread evenly over vms VMs, each measured every six
+        hours from a random start time in 2018.
+        """
+        self._records = records
+        self._vms = vms
+        self._seed = seed
+
+        for database in (self._old_database, self._new_database):
+            self._empty(database)
+            self._insert(database, self._generate_records(
+                random.Random(seed), records, vms))
+
+    def run(self):
+        """Run the benchmark and return True if both databases agree."""
+        if not self._compare('full'):
+            return False
+
+        # The next measurement of every VM, as loaded between cron runs.
+        per_vm = max(self._records // self._vms, 1)
+        for database in (self._old_database, self._new_database):
+            self._insert(database, self._generate_records(
+                random.Random(self._seed), (per_vm + 1) * self._vms,
+                self._vms, per_vm + 1))
+
+        return self._compare('incremental')
+
+###############################################################################
+#                                                                             #
+# Helper methods                                                              #
+#                                                                             #
+###############################################################################
+
+    def _compare(self, name):
+        """Time a run in both databases and return True if they agree."""
+        old = self._time_summariser(self._old_database)
+        log.info('Earlier SummariseVMs %s run took %.1fs', name, old)
+
+        new = self._time_summariser(self._new_database)
+        log.info('Current SummariseVMs %s run took %.1fs', name, new)
+
+        if new > 0:
+            log.info('Speedup of the %s run: %.1fx', name, old / new)
+
+        old_summaries = self._summaries(self._old_database)
+        new_summaries = self._summaries(self._new_database)
+
+        if old_summaries != new_summaries:
+            log.error('The summaries of the %s run differ.', name)
+            return False
+
+        log.info('Both %s runs produced the same %s summaries.', name,
+                 len(new_summaries))
+        return True
+
+    def _empty(self, database):
+        """Empty the cloud tables of database."""
+        cursor = database.cursor()
+        # The earlier schema may not have the tables SummariseVMs now
+        # maintains, but the current one empties them on a full run.
+        for table in ('CloudRecords', 'CloudSummaries'):
+            cursor.execute('DELETE FROM %s' % table)
+
+        cursor.execute("DELETE FROM LastUpdated WHERE Type = 'SummariseVMs'")
+
+        for table in ('Sites', 'CloudComputeServices', 'DNs', 'VOs',
+                      'VOGroups', 'VORoles'):
+            cursor.execute('INSERT IGNORE INTO %s (id, name) '
+                           'VALUES (1, "Benchmark")' % table)
+
+        database.commit()
+        cursor.close()
+
+    def _insert(self, database, records):
+        """Insert the record tuples into the CloudRecords of database."""
+        cursor = database.cursor()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == 10000:
+                cursor.executemany(INSERT_RECORD, batch)
+                batch = []
+
+        if batch:
+            cursor.executemany(INSERT_RECORD, batch)
+
+        database.commit()
+        cursor.close()
+
+    def _generate_records(self, generator, records, vms, first=1):
+        """
+        Yield record tuples, in RECORD_COLUMNS order.
+
+        Only the measurements of each VM from the first onwards are
+        yielded. The VMs are the same for the same seed.
+        """
+        per_vm = max(records // vms, 1)
+        year_start = datetime.datetime(2018, 1, 1)
+
+        for vm in xrange(vms):
+            start_time = year_start + datetime.timedelta(
+                seconds=generator.randint(0, 365 * 24 * 3600))
+            cpu_count = generator.choice((1, 2, 4, 8))
+            load = generator.random()
+            user = vm % 100 + 1
+
+            for measurement in xrange(first, per_vm + 1):
+                wall_duration = measurement * 6 * 3600
+                yield ('benchmark-vm-%s' % vm, 1, 1, user, 1, 1, 1,
+                       'started', start_time, 0, wall_duration,
+                       int(wall_duration * cpu_count * load), cpu_count,
+                       measurement * 1024, measurement * 512, 1,
+                       cpu_count * 2048, 20, 'HEPSPEC', 10, 'benchmark-image',
+                       'Benchmark', 1)
+
+    def _time_summariser(self, database):
+        """Run SummariseVMs in database and return how long it took."""
+        cursor = database.cursor()
+        start = time.time()
+        cursor.execute('CALL SummariseVMs()')
+        database.commit()
+        duration = time.time() - start
+        cursor.close()
+        return duration
+
+    def _summaries(self, database):
+        """Return every row of CloudSummaries in database, in order."""
+        cursor = database.cursor()
+        cursor.execute(SELECT_SUMMARIES)
+        summaries = cursor.fetchall()
+        cursor.close()
+        return summaries
+
+
+def main():
+    """
+    Load synthetic records into scratch databases and run the benchmark.
+
+    Usage:
+    benchmark_summariser.py -n DATABASE -o OLD_DATABASE [-H HOST] [-u USER]
+                            [-p PASSWORD] [-r RECORDS] [-m VMS] [-s SEED]
+
+    Options:
+    -h, --help        show this help message and exit
+    -n DATABASE, --name DATABASE
+                      The scratch database with the current schema. Its
+                      cloud tables will be emptied.
+    -o OLD_DATABASE, --old-name OLD_DATABASE
+                      The scratch database with an earlier schema. Its
+                      cloud tables will be emptied.
+    -H HOST, --host HOST
+                      The database host, defaults to localhost
+    -u USER, --user USER
+                      The database user, defaults to root
+    -p PASSWORD, --password PASSWORD
+                      The database password, defaults to none
+    -r RECORDS, --records RECORDS
+                      The number of records to generate, defaults to 1000000
+    -m VMS, --vms VMS
+                      The number of VMs to spread the records over,
+                      defaults to 10000
+    -s SEED, --seed SEED
+                      The random seed, defaults to 0
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-n", "--name", type=str, required=True,
+                            help=("The scratch database with the current "
+                                  "schema. Its cloud tables will be "
+                                  "emptied."))
+
+    arg_parser.add_argument("-o", "--old-name", type=str, required=True,
+                            help=("The scratch database with an earlier "
+                                  "schema. Its cloud tables will be "
+                                  "emptied."))
+
+    arg_parser.add_argument("-H", "--host", type=str, default="localhost",
+                            help="The database host.")
+
+    arg_parser.add_argument("-u", "--user", type=str, default="root",
+                            help="The database user.")
+
+    arg_parser.add_argument("-p", "--password", type=str, default="",
+                            help="The database password.")
+
+    arg_parser.add_argument("-r", "--records", type=int, default=1000000,
+                            help="The number of records to generate.")
+
+    arg_parser.add_argument("-m", "--vms", type=int, default=10000,
+                            help="The number of VMs to spread records over.")
+
+    arg_parser.add_argument("-s", "--seed", type=int, default=0,
+                            help="The random seed.")
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    old_database = MySQLdb.connect(host=args.host, user=args.user,
+                                   passwd=args.password, db=args.old_name)
+    new_database = MySQLdb.connect(host=args.host, user=args.user,
+                                   passwd=args.password, db=args.name)
+
+    benchmark = SummariserBenchmark(old_database, new_database)
+
+    start = time.time()
+    benchmark.load(args.records, args.vms, args.seed)
+    log.info('Loaded %s records in %.1fs', args.records, time.time() - start)
+
+    if not benchmark.run():
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -11,46 +11,129 @@ import argparse
 import httplib
 import json
 import logging
+import Queue
 import ssl
 import socket
 import sys
+import threading
 import time
+import zlib
 
 from dirq.QueueSimple import QueueSimple
 
 log = logging.getLogger(__name__)
 
 
+class RateLimiter(object):
+    """
+    Space out requests made by any number of threads.
+
+    The interval between requests shrinks while the server accepts them,
+    and doubles whenever the server says it is overloaded.
+    """
+
+    def __init__(self, min_interval=0.0, max_interval=30.0):
+        """Initialize a RateLimiter that starts at min_interval."""
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._interval = min_interval
+        self._next_request = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next request can be made."""
+        with self._lock:
+            now = time.time()
+            request_time = max(now, self._next_request)
+            self._next_request = request_time + self._interval
+
+        if request_time > now:
+            time.sleep(request_time - now)
+
+    def accepted(self):
+        """Shorten the interval after a request was accepted."""
+        with self._lock:
+            if self._interval * 0.9 > max(self._min_interval, 0.001):
+                self._interval *= 0.9
+            else:
+                self._interval = self._min_interval
+
+    def overloaded(self, retry_after=None):
+        """
+        Lengthen the interval after the server said it was overloaded.
+
+        If given, no request will be made for retry_after seconds.
+        """
+        with self._lock:
+            self._interval = min(self._max_interval,
+                                 max(self._interval * 2, 0.1))
+            if retry_after is not None:
+                self._next_request = max(self._next_request,
+                                         time.time() + retry_after)
+
+
 class Sender(object):
     """A simple class for sending Accounting Records to a REST endpoint."""
 
-    def __init__(self, dest, qpath, cert, key, api_version):
-        """Initialize a Sender."""
+    def __init__(self, dest, qpath, cert, key, api_version, workers=1,
+                 compress=False):
+        """
+        Initialize a Sender that sends using workers threads.
+
+        If compress is True, messages are sent compressed with gzip.
+        Raise ValueError if workers is less than 1.
+        """
+        if workers < 1:
+            raise ValueError('At least one worker is needed, not %s' %
+                             workers)
+
         self._cert = cert
         self._key = key
         self._outq = QueueSimple(qpath)
         self._dest = dest
         self._api_version = api_version
+        self._workers = workers
+        self._compress = compress
+        self._rate_limiter = RateLimiter()
+        # Each worker thread keeps its own connection open between messages.
+        self._local = threading.local()
+        self._failed = threading.Event()
+        self._sent = 0
+        self._sent_lock = threading.Lock()
 
     def send_all(self):
-        """Send all the messages in the outgoing queue via REST."""
+        """
+        Send all the messages in the outgoing queue via REST.
+
+        Return False if sending was abandoned because a message could not
+        be sent. Unsent messages are left in the queue for the next run.
+        """
         log.info('Found %s messages.', self._outq.count())
-        for msgid in self._outq:
-            if not self._outq.lock(msgid):
-                log.warn('Message was locked. %s will not be sent.', msgid)
-                continue
 
-            text = self._outq.get(msgid)
+        # Bounded, so the queue is only read as fast as messages are sent.
+        msgids = Queue.Queue(maxsize=self._workers * 10)
+        workers = [threading.Thread(target=self._send_queued, args=(msgids,))
+                   for _ in range(self._workers)]
+
+        start = time.time()
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
 
-            path = '/api/%s/cloud/record' % self._api_version
-            data = text
+        for msgid in self._outq:
+            if self._failed.is_set():
+                break
+            msgids.put(msgid)
 
-            self._rest_send('POST', path, data, {}, 202)
-            log.info("Sent %s", msgid)
+        for _ in workers:
+            msgids.put(None)
 
-            time.sleep(0.1)
+        for worker in workers:
+            worker.join()
 
-            self._outq.remove(msgid)
+        duration = time.time() - start
+        log.info('Sent %s messages in %.1f seconds (%.1f messages/sec).',
+                 self._sent, duration, self._sent / max(duration, 0.001))
 
         log.info('Tidying message directory.')
         try:
@@ -59,43 +142,139 @@ class Sender(object):
         except OSError, e:
             log.warn('OSError raised while purging message queue: %s', e)
 
+        return not self._failed.is_set()
+
+    def _send_queued(self, msgids):
+        """Send the messages in msgids until None is received."""
+        path = '/api/%s/cloud/record' % self._api_version
+
+        try:
+            while True:
+                msgid = msgids.get()
+                if msgid is None:
+                    break
+
+                if self._failed.is_set():
+                    # Keep emptying msgids so that send_all is not blocked.
+                    continue
+
+                try:
+                    self._send_message(msgid, path)
+                except Exception:
+                    # If this thread died, send_all would block forever
+                    # on msgids, so an error only stops the sending.
+                    log.exception('Could not send %s', msgid)
+                    self._failed.set()
+        finally:
+            self._close_connection()
+
+    def _send_message(self, msgid, path):
+        """Send the message msgid to path and remove it from the queue."""
+        # The lock stops any other sender sending the same message.
+        if not self._outq.lock(msgid):
+            log.warn('Message was locked. %s will not be sent.', msgid)
+            return
+
+        text = self._outq.get(msgid)
+        headers = {}
+        if self._compress:
+            text = self._gzip(text)
+            headers['Content-Encoding'] = 'gzip'
+
+        if self._rest_send('POST', path, text, headers, 202) is None:
+            self._outq.unlock(msgid)
+            self._failed.set()
+            return
+
+        log.info("Sent %s", msgid)
+        self._outq.remove(msgid)
+
+        with self._sent_lock:
+            self._sent += 1
+
     def _rest_send(self, verb, path, data, headers, expected_response_code):
         """
         Send an HTTPS request to self._dest.
 
         Will attempt to repeat if expected_response is not returned.
+        Return the response, or None if every attempt failed.
         """
         attempt_number = 0
+        response = None
 
         while attempt_number < 3:
-            try:
-                attempt_number += 1
-
-                conn = httplib.HTTPSConnection(self._dest,
-                                               cert_file=self._cert,
-                                               key_file=self._key,
-                                               strict=False)
+            attempt_number += 1
+            self._rate_limiter.wait()
 
+            try:
+                conn = self._get_connection()
                 conn.request(verb, path, data, headers)
-
                 response = conn.getresponse()
-
-                if response.status == expected_response_code:
-                    return response
-                else:
-                    log.warning("Could not connect to endpoint, retrying")
-                    time.sleep(attempt_number)
-                    continue
+                # The whole response must be read before the
+                # connection can be used for the next request.
+                response.read()
 
             except socket.gaierror as e:
                 log.info('socket.gaierror: %s, %s',
                          e.errno, e.strerror)
-                sys.exit(1)
+                return None
+
+            except (httplib.HTTPException, socket.error) as e:
+                # e.g. the server closed an idle connection.
+                log.warning("Connection failed: %s, retrying", e)
+                self._close_connection()
+                continue
+
+            if response.status == expected_response_code:
+                self._rate_limiter.accepted()
+                return response
+
+            if response.status in (429, 503):
+                self._rate_limiter.overloaded(self._retry_after(response))
+            else:
+                time.sleep(attempt_number)
+
+            log.warning("Could not connect to endpoint, retrying")
 
         # if here, attempt_number has been exceeded
-        log.info('Could not connect to endpoint. Error: %s - %s',
-                 response.status, response.reason)
-        sys.exit(1)
+        if response is not None:
+            log.info('Could not connect to endpoint. Error: %s - %s',
+                     response.status, response.reason)
+        return None
+
+    def _get_connection(self):
+        """Return this thread's connection to self._dest."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = httplib.HTTPSConnection(self._dest,
+                                           cert_file=self._cert,
+                                           key_file=self._key,
+                                           strict=False)
+            self._local.conn = conn
+
+        return conn
+
+    def _close_connection(self):
+        """Close this thread's connection, if it has one."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _gzip(text):
+        """Return text compressed in the gzip format."""
+        # 16 + MAX_WBITS makes zlib write a gzip header and trailer.
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(text) + compressor.flush()
+
+    @staticmethod
+    def _retry_after(response):
+        """Return the Retry-After of response in seconds, or None."""
+        try:
+            return int(response.getheader('Retry-After'))
+        except (TypeError, ValueError):
+            return None
 
 
 def main():
@@ -104,6 +283,7 @@ def main():
 
     Usage:
     sender.py -d DESTINATION -q QUEUE -k KEY -c CERTIFICATE [-v VERSION]
+              [-w WORKERS] [-z]
 
     Options:
     -h, --help        show this help message and exit
@@ -124,6 +304,10 @@ def main():
     -v VERSION, --version VERSION
                       Version of the APEL REST API Version, expected to be
                       v1
+    -w WORKERS, --workers WORKERS
+                      The number of messages to send at once, each over its
+                      own connection, defaults to 1
+    -z, --gzip        Compress messages with gzip before sending them
     """
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("-d", "--destination", type=str, required=True,
@@ -149,15 +333,29 @@ def main():
                             help=("Version of the APEL REST API Version, "
                                   "expected to be v1"))
 
+    arg_parser.add_argument("-w", "--workers", type=int, default=1,
+                            help=("The number of messages to send at once, "
+                                  "each over its own connection."))
+
+    arg_parser.add_argument("-z", "--gzip", action="store_true",
+                            help=("Compress messages with gzip before "
+                                  "sending them."))
+
     args = arg_parser.parse_args()
 
+    if args.workers < 1:
+        arg_parser.error("argument -w/--workers: must be at least 1")
+
     sender = Sender(args.destination,
                     args.queue,
                     args.certificate,
                     args.key,
-                    args.version)
+                    args.version,
+                    args.workers,
+                    args.gzip)
 
-    sender.send_all()
+    if not sender.send_all():
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
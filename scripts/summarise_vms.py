@@ -0,0 +1,91 @@
+"""
+This module runs SummariseVMs in the cloud accounting database.
+
+SummariseVMs only summarises the days with records updated since its
+last run, and records loaded while it runs are left for its next run.
+So, unlike run_cloud_summariser.sh, it does not need the loader to be
+stopped, and can be run often, e.g. every 15 minutes from cron.
+
+If run as a python script, this module reads the database connection
+from the [db] section of a clouddb.cfg file and calls SummariseVMs once.
+"""
+
+
+import argparse
+import ConfigParser
+import logging
+import sys
+import time
+
+import MySQLdb
+
+log = logging.getLogger(__name__)
+
+
+def read_config(path):
+    """Return the MySQLdb.connect keyword arguments from the file at path."""
+    parser = ConfigParser.ConfigParser()
+    if not parser.read(path):
+        raise ConfigParser.Error("Could not read %s" % path)
+
+    return {'host': parser.get('db', 'hostname').strip(),
+            'port': parser.getint('db', 'port'),
+            'db': parser.get('db', 'name').strip(),
+            'user': parser.get('db', 'username').strip(),
+            'passwd': parser.get('db', 'password')}
+
+
+def summarise(connect_kwargs):
+    """Call SummariseVMs in the database and return how long it took."""
+    database = MySQLdb.connect(**connect_kwargs)
+    try:
+        cursor = database.cursor()
+        start = time.time()
+        cursor.execute('CALL SummariseVMs()')
+        database.commit()
+        cursor.close()
+        return time.time() - start
+    finally:
+        database.close()
+
+
+def main():
+    """
+    Call SummariseVMs in the database configured in a clouddb.cfg file.
+
+    Usage:
+    summarise_vms.py [-c CONFIG]
+
+    Options:
+    -h, --help        show this help message and exit
+    -c CONFIG, --config CONFIG
+                      The clouddb.cfg file to read the database connection
+                      from, defaults to /etc/apel/clouddb.cfg
+    """
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("-c", "--config", type=str,
+                            default="/etc/apel/clouddb.cfg",
+                            help=("The clouddb.cfg file to read the "
+                                  "database connection from."))
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        connect_kwargs = read_config(args.config)
+    except (ConfigParser.Error, ValueError) as error:
+        log.error('Invalid configuration: %s', error)
+        sys.exit(1)
+
+    try:
+        duration = summarise(connect_kwargs)
+    except MySQLdb.Error as error:
+        log.error('SummariseVMs failed: %s', error)
+        sys.exit(1)
+
+    log.info('SummariseVMs took %.1fs', duration)
+
+if __name__ == '__main__':
+    main()